@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from openprocurement.bridge.basic.utils import monotonic
+
+
+class MicroBatcher(object):
+
+    """
+    Accumulates items by key until batch holds max_size items or max_latency
+    seconds passed since first item was added. Deadline is computed once per
+    batch, so adding item costs one dict assignment and readiness check one
+    monotonic clock call.
+    Item added with already batched key replaces previous one.
+    """
+
+    def __init__(self, max_size, max_latency):
+        self.max_size = max(max_size, 1)
+        self.max_latency = max_latency
+        self.batch = {}
+        self.deadline = None
+
+    def __len__(self):
+        return len(self.batch)
+
+    def __iter__(self):
+        return iter(self.batch)
+
+    def __contains__(self, key):
+        return key in self.batch
+
+    def __getitem__(self, key):
+        return self.batch[key]
+
+    def get(self, key, default=None):
+        return self.batch.get(key, default)
+
+    def values(self):
+        return self.batch.values()
+
+    def add(self, key, item):
+        if self.deadline is None:
+            self.deadline = monotonic() + self.max_latency
+        self.batch[key] = item
+
+    def ready(self, now=None):
+        """
+        :return: bool: batch is full or its deadline passed
+        """
+        if self.deadline is None:
+            return False
+        if len(self.batch) >= self.max_size:
+            return True
+        if now is None:
+            now = monotonic()
+        return now >= self.deadline
+
+    def timeout(self, now=None):
+        """
+        Seconds to wait for next item before batch deadline, max_latency
+        for empty batch
+        """
+        if self.deadline is None:
+            return self.max_latency
+        if now is None:
+            now = monotonic()
+        return max(self.deadline - now, 0)
+
+    def take(self):
+        """
+        Return accumulated batch and start new one
+        :return: dict
+        """
+        batch = self.batch
+        self.batch = {}
+        self.deadline = None
+        return batch
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Compare feed items batching of filter greenlet: previous datetime polling
+loop and MicroBatcher with single monotonic deadline per batch.
+
+    python -m openprocurement.bridge.basic.benchmarks.batching \
+        --items 200000 --limit 100
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+from datetime import datetime
+from time import time
+from uuid import uuid4
+from gevent.queue import Queue, Empty
+from openprocurement.bridge.basic.batching import MicroBatcher
+
+
+def polling_batches(queue, limit, interval, total):
+    """
+    fill_resource_items_queue loop before MicroBatcher
+    :return: int: batches count
+    """
+    batches = 0
+    received = 0
+    start_time = datetime.now()
+    input_dict = {}
+    while received < total:
+        if not queue.empty():
+            resource_item = queue.get()
+        else:
+            timeout = interval - (datetime.now() - start_time).total_seconds()
+            if timeout > interval:
+                timeout = interval
+            try:
+                resource_item = queue.get(timeout=timeout)
+            except Empty:
+                resource_item = None
+        if resource_item is not None:
+            input_dict[resource_item['id']] = resource_item['dateModified']
+            received += 1
+        if (len(input_dict) >= limit or
+                (datetime.now() - start_time).total_seconds() >= interval):
+            if len(input_dict) > 0:
+                batches += 1
+                input_dict = {}
+            start_time = datetime.now()
+    return batches + bool(input_dict)
+
+
+def micro_batches(queue, limit, interval, total):
+    """
+    fill_resource_items_queue loop with MicroBatcher
+    :return: int: batches count
+    """
+    batches = 0
+    received = 0
+    batcher = MicroBatcher(limit, interval)
+    while received < total:
+        try:
+            resource_item = queue.get(timeout=batcher.timeout())
+            batcher.add(resource_item['id'], resource_item['dateModified'])
+            received += 1
+        except Empty:
+            pass
+        if batcher.ready():
+            batcher.take()
+            batches += 1
+    return batches + bool(batcher.take())
+
+
+def measure(loop, items, limit, interval):
+    """
+    :return: tuple: (items per sec., batches count)
+    """
+    queue = Queue()
+    for item in items:
+        queue.put(item)
+    start = time()
+    batches = loop(queue, limit, interval, len(items))
+    return len(items) / (time() - start), batches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- Feed items batching benchmark ----')
+    parser.add_argument('--items', type=int, default=200000)
+    parser.add_argument('--limit', type=int, default=100,
+                        help='Batch size, bulk_query_limit')
+    parser.add_argument('--interval', type=float, default=5,
+                        help='Batch latency, bulk_query_interval')
+    params = parser.parse_args()
+
+    date_modified = datetime.now().isoformat()
+    items = [{'id': uuid4().hex, 'dateModified': date_modified}
+             for _ in xrange(params.items)]
+    print('{:>10} {:>12} {:>10}'.format('loop', 'items/sec', 'batches'))
+    for name, loop in (('polling', polling_batches),
+                       ('batcher', micro_batches)):
+        rate, batches = measure(loop, items, params.limit, params.interval)
+        print('{:>10} {:>12.0f} {:>10}'.format(name, rate, batches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Compare api clients scheduling policies against fake API with backends of
+different latency: FIFO api_clients_queue and latency aware p2c scheduler.
+
+    python -m openprocurement.bridge.basic.benchmarks.client_scheduler \
+        --docs 5000 --backend-latencies 0.005,0.005,0.05,0.2
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import json
+from gevent.pywsgi import WSGIServer
+from openprocurement.bridge.basic.benchmarks.fake_api import FakeAPI
+from openprocurement.bridge.basic.benchmarks.runner import (
+    BASE_CONFIG,
+    parse_values,
+    run_child
+)
+
+POLICIES = ('fifo', 'p2c')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- API clients scheduler benchmark ----')
+    parser.add_argument('--docs', type=int, default=5000,
+                        help='Documents count in fake API')
+    parser.add_argument('--backend-latencies', type=str,
+                        default='0.005,0.005,0.05,0.2',
+                        help='Latency of each fake API backend, sec.')
+    parser.add_argument('--workers-max', type=int, default=3)
+    parser.add_argument('--workers-min', type=int, default=3,
+                        help='Idle api clients created on start')
+    parser.add_argument('--port', type=int, default=6543)
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Max duration of one run, sec.')
+    parser.add_argument('--config', type=str, default='{}',
+                        help='JSON with additional bridge options')
+    params = parser.parse_args()
+
+    api = FakeAPI(docs_count=params.docs, backend_latencies=parse_values(
+        params.backend_latencies, float))
+    server = WSGIServer(('127.0.0.1', params.port), api, log=None)
+    server.start()
+    print('{:>10} {:>8} {:>12} {:>8} {:>8} {:>12}'.format(
+        'scheduler', 'docs', 'docs/sec', 'lag p50', 'lag p99',
+        'API requests'))
+    for policy in POLICIES:
+        main_config = dict(BASE_CONFIG)
+        main_config.update({
+            'workers_max': params.workers_max,
+            'workers_min': params.workers_min,
+            'bulk_save_limit': 100,
+            'bulk_save_interval': 1,
+            'resources_api_server': 'http://127.0.0.1:{}'.format(
+                params.port),
+            'client_scheduler': policy
+        })
+        main_config.update(json.loads(params.config))
+        api.reset()
+        api.requests_count = 0
+        result = run_child(main_config, params.docs, params.timeout)
+        print('{:>10} {:>8} {:>12} {:>8} {:>8} {:>12}'.format(
+            policy, result['docs'], result['docs_per_sec'],
+            result['lag_p50'], result['lag_p99'], api.requests_count))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Compare CouchDBStorage.filter_bulk lookups on large database: legacy lookup
+by dateModified keys against id keyed by_id view.
+
+    python -m openprocurement.bridge.basic.benchmarks.couchdb_filter \
+        --docs 1000000 --host 127.0.0.1 --port 5984
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from time import time
+from uuid import uuid4
+from openprocurement.bridge.basic.benchmarks.runner import percentile
+from openprocurement.bridge.basic.storages.couchdb_plugin import CouchDBStorage
+
+
+def populate(storage, docs_count, chunk_size):
+    """
+    Fill database with generated documents
+    :return: dict: key: doc_id, value: dateModified
+    """
+    started = datetime(2017, 1, 1)
+    stored = {}
+    chunk = []
+    for i in xrange(docs_count):
+        doc_id = uuid4().hex
+        date_modified = (started + timedelta(seconds=i)).isoformat()
+        stored[doc_id] = date_modified
+        chunk.append({'_id': doc_id, 'id': doc_id, 'doc_type': 'Tender',
+                      'dateModified': date_modified})
+        if len(chunk) >= chunk_size:
+            storage.db.update(chunk)
+            chunk = []
+    if chunk:
+        storage.db.update(chunk)
+    return stored
+
+
+def make_bulk(stored_items, size):
+    """
+    Feed bulk: third of actual docs, third of updated docs and third of
+    new ones
+    """
+    bulk = {}
+    for doc_id, date_modified in random.sample(stored_items, size):
+        case = random.randint(0, 2)
+        if case == 0:
+            bulk[doc_id] = date_modified
+        elif case == 1:
+            bulk[doc_id] = date_modified + '1'
+        else:
+            bulk[uuid4().hex] = date_modified
+    return bulk
+
+
+def legacy_filter_bulk(storage, bulk):
+    rows = storage.db.view(storage.view_path, keys=bulk.values())
+    return {k.id: k.key for k in rows}
+
+
+def measure(name, lookup, storage, bulks):
+    durations = []
+    filtered = 0
+    for bulk in bulks:
+        start = time()
+        resp_dict = lookup(storage, bulk)
+        durations.append(time() - start)
+        filtered += len([doc_id for doc_id, date_modified in bulk.items()
+                         if resp_dict.get(doc_id) and
+                         resp_dict[doc_id] >= date_modified])
+    total = sum(len(bulk) for bulk in bulks)
+    print('{:>10} filtered {:>8} of {:>8}, lookup p50 {:.4f} sec., '
+          'p99 {:.4f} sec.'.format(name, filtered, total,
+                                   percentile(durations, 50),
+                                   percentile(durations, 99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- CouchDB filter_bulk benchmark ----')
+    parser.add_argument('--docs', type=int, default=1000000)
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5984)
+    parser.add_argument('--db-name', type=str,
+                        default='bridge_filter_benchmark')
+    parser.add_argument('--bulk-size', type=int, default=1000,
+                        help='Same as bulk_query_limit')
+    parser.add_argument('--bulks', type=int, default=100)
+    params = parser.parse_args()
+
+    storage = CouchDBStorage({'storage': {
+        'host': params.host, 'port': params.port,
+        'db_name': params.db_name}}, 'tenders')
+    start = time()
+    stored = populate(storage, params.docs, 10000)
+    print('Populated {} docs in {:.1f} sec.'.format(params.docs,
+                                                     time() - start))
+    # Build view indexes before measuring
+    for path in (storage.view_path, storage.id_view_path):
+        start = time()
+        list(storage.db.view(path, limit=1))
+        print('Built {} in {:.1f} sec.'.format(path, time() - start))
+
+    stored_items = stored.items()
+    bulks = [make_bulk(stored_items, params.bulk_size)
+             for _ in xrange(params.bulks)]
+    measure('legacy', legacy_filter_bulk, storage, bulks)
+    measure('by_id', CouchDBStorage.filter_bulk, storage, bulks)
+
+
+if __name__ == '__main__':
+    main()
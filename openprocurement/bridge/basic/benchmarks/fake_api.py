@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+from Cookie import SimpleCookie
+from datetime import datetime
+from hashlib import md5
+from time import time
+from urlparse import parse_qs
+from gevent import sleep
+from openprocurement.bridge.basic.utils import TZ
+
+
+class FakeAPI(object):
+
+    """
+    WSGI stand-in for openprocurement API: changes feed pages and resource
+    item GETs. Documents are published with publish_rate docs/sec (all at
+    once if 0) starting from reset(), dateModified of each document is its
+    publication time, so storage can measure document lag. With
+    backend_latencies sessions are bound to backends round-robin by
+    SERVER_ID cookie as in real API, each backend adds own latency.
+    """
+
+    def __init__(self, resource='tenders', api_version='0', docs_count=1000,
+                 latency=0, rate_429=0, doc_size=1024, publish_rate=0,
+                 backend_latencies=None):
+        self.resource = resource
+        self.prefix = '/api/{}/'.format(api_version)
+        self.docs_count = docs_count
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.doc_size = doc_size
+        self.publish_rate = publish_rate
+        self.backend_latencies = backend_latencies or []
+        self.next_backend = 0
+        self.ids = [md5(str(i)).hexdigest() for i in xrange(docs_count)]
+        self.positions = dict((doc_id, i) for i, doc_id in enumerate(self.ids))
+        self.requests_count = 0
+        self.reset()
+
+    def reset(self):
+        self.started = time()
+
+    def published(self):
+        if not self.publish_rate:
+            return self.docs_count
+        count = int((time() - self.started) * self.publish_rate) + 1
+        return min(count, self.docs_count)
+
+    def date_modified(self, position):
+        published_at = self.started
+        if self.publish_rate:
+            published_at += float(position) / self.publish_rate
+        return datetime.fromtimestamp(published_at, TZ).isoformat()
+
+    def feed_item(self, position):
+        return {'id': self.ids[position],
+                'dateModified': self.date_modified(position)}
+
+    def document(self, position):
+        doc = self.feed_item(position)
+        doc['status'] = 'active.tendering'
+        doc['description'] = 'x' * self.doc_size
+        return doc
+
+    def feed(self, params):
+        published = self.published()
+        limit = int(params.get('limit', 100))
+        offset = params.get('offset')
+        opt_fields = [field for field in params.get('opt_fields', '').split(
+            ',') if field]
+        if params.get('descending'):
+            end = published if offset is None else int(offset)
+            start = max(end - limit, 0)
+            positions = reversed(xrange(start, end))
+            next_offset = start
+        else:
+            start = published if offset is None else int(offset)
+            end = min(start + limit, published)
+            positions = xrange(start, end)
+            next_offset = max(end, start)
+        data = []
+        for position in positions:
+            item = self.feed_item(position)
+            if opt_fields:
+                doc = self.document(position)
+                item.update((field, doc[field]) for field in opt_fields
+                            if field in doc)
+            data.append(item)
+        return {
+            'data': data,
+            'next_page': {'offset': str(next_offset)},
+            'prev_page': {'offset': str(published)}
+        }
+
+    def item(self, doc_id):
+        position = self.positions.get(doc_id)
+        if position is None or position >= self.published():
+            return None
+        return {'data': self.document(position)}
+
+    def backend(self, environ):
+        """
+        :return: int: backend index from SERVER_ID cookie or next backend
+        """
+        cookie = SimpleCookie(environ.get('HTTP_COOKIE', ''))
+        if 'SERVER_ID' in cookie and cookie['SERVER_ID'].value.isdigit():
+            backend = int(cookie['SERVER_ID'].value)
+            if backend < len(self.backend_latencies):
+                return backend
+        backend = self.next_backend
+        self.next_backend = (backend + 1) % len(self.backend_latencies)
+        return backend
+
+    def __call__(self, environ, start_response):
+        self.requests_count += 1
+        latency = self.latency
+        server_id = 'fake'
+        if self.backend_latencies:
+            server_id = self.backend(environ)
+            latency += self.backend_latencies[server_id]
+        if latency:
+            sleep(latency)
+        path = environ.get('PATH_INFO', '')
+        params = dict((k, v[0]) for k, v in parse_qs(
+            environ.get('QUERY_STRING', '')).items())
+        headers = [('Content-Type', 'application/json'),
+                   ('Set-Cookie', 'SERVER_ID={}; Path=/'.format(server_id))]
+        if self.rate_429 and random.random() < self.rate_429:
+            start_response('429 Too Many Requests', headers)
+            return [json.dumps({'status': 'error'})]
+        resource_path = self.prefix + self.resource
+        if path == self.prefix + 'spore':
+            start_response('200 OK', headers)
+            return ['']
+        if path.rstrip('/') == resource_path:
+            body = self.feed(params)
+        elif path.startswith(resource_path + '/'):
+            body = self.item(path[len(resource_path) + 1:])
+        else:
+            body = None
+        if body is None:
+            start_response('404 Not Found', headers)
+            return [json.dumps({'status': 'error'})]
+        start_response('200 OK', headers)
+        return [json.dumps(body)]
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import itertools
+import json
+import logging
+import resource
+import sys
+from time import time
+from gevent import spawn, sleep
+from gevent.pywsgi import WSGIServer
+from gevent.subprocess import PIPE, Popen
+from openprocurement.bridge.basic.benchmarks.fake_api import FakeAPI
+from openprocurement.bridge.basic.benchmarks.storage import MemoryStorage
+from openprocurement.bridge.basic.stats import percentile
+
+BASE_CONFIG = {
+    'resources_api_version': '0',
+    'resource': 'tenders',
+    'storage_db': 'memory',
+    'workers_min': 1,
+    'retry_workers_min': 1,
+    'retry_workers_max': 1,
+    'retry_default_timeout': 0.5,
+    'queue_timeout': 0.1,
+    'worker_sleep': 0.1,
+    'watch_interval': 1,
+    'queues_controller_timeout': 1,
+    'bulk_query_interval': 0.5,
+    'filter_index_size': 0,
+    'retrievers_params': {
+        'down_requests_sleep': 0.1,
+        'up_requests_sleep': 0.1,
+        'up_wait_sleep': 30,
+        'queue_size': 101
+    }
+}
+MATRIX_KEYS = ['workers_max', 'bulk_save_limit', 'bulk_save_interval']
+
+
+def run_bridge(main_config, docs_count, timeout):
+    """
+    Run bridge against fake API until all documents are saved to memory
+    storage or timeout expired
+    :return: dict with results
+    """
+    from openprocurement.bridge.basic.databridge import BasicDataBridge
+    storage = MemoryStorage(main_config.pop('storage_latency', 0))
+    main_config['storage_obj'] = storage
+    bridge = BasicDataBridge({'main': main_config})
+    started = time()
+    runner = spawn(bridge.run)
+    while len(storage.docs) < docs_count and time() - started < timeout:
+        sleep(0.1)
+    elapsed = time() - started
+    runner.kill()
+    return {
+        'docs': len(storage.docs),
+        'elapsed': round(elapsed, 3),
+        'docs_per_sec': round(len(storage.docs) / elapsed, 1),
+        'lag_p50': round(percentile(storage.lags, 50), 3),
+        'lag_p99': round(percentile(storage.lags, 99), 3),
+        'peak_rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    }
+
+
+def run_child(main_config, docs_count, timeout):
+    """Run bridge in separate process to get clean peak RSS per config"""
+    process = Popen([sys.executable, '-m',
+                     'openprocurement.bridge.basic.benchmarks.runner',
+                     '--child', json.dumps(main_config),
+                     '--docs', str(docs_count), '--timeout', str(timeout)],
+                    stdout=PIPE)
+    output = process.communicate()[0]
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def parse_values(value, cast):
+    return [cast(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- Basic Bridge benchmark ----')
+    parser.add_argument('--docs', type=int, default=10000,
+                        help='Documents count in fake API')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Fake API latency, sec.')
+    parser.add_argument('--rate-429', type=float, default=0,
+                        help='Part of fake API responses with 429 status')
+    parser.add_argument('--doc-size', type=int, default=1024,
+                        help='Approximate document size, bytes')
+    parser.add_argument('--publish-rate', type=float, default=0,
+                        help='New documents per sec., 0 - all at start')
+    parser.add_argument('--storage-latency', type=float, default=0,
+                        help='Memory storage latency, sec.')
+    parser.add_argument('--port', type=int, default=6543)
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Max duration of one run, sec.')
+    parser.add_argument('--workers-max', type=str, default='3')
+    parser.add_argument('--bulk-save-limit', type=str, default='1000')
+    parser.add_argument('--bulk-save-interval', type=str, default='5')
+    parser.add_argument('--config', type=str, default='{}',
+                        help='JSON with additional bridge options')
+    parser.add_argument('--child', type=str, default=None,
+                        help=argparse.SUPPRESS)
+    params = parser.parse_args()
+
+    if params.child is not None:
+        logging.basicConfig(level=logging.ERROR)
+        result = run_bridge(json.loads(params.child), params.docs,
+                            params.timeout)
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+        return
+
+    api = FakeAPI(docs_count=params.docs, latency=params.latency,
+                  rate_429=params.rate_429, doc_size=params.doc_size,
+                  publish_rate=params.publish_rate)
+    server = WSGIServer(('127.0.0.1', params.port), api, log=None)
+    server.start()
+    matrix = itertools.product(
+        parse_values(params.workers_max, int),
+        parse_values(params.bulk_save_limit, int),
+        parse_values(params.bulk_save_interval, float))
+    print('{:>12} {:>16} {:>19} {:>8} {:>12} {:>8} {:>8} {:>12}'.format(
+        'workers_max', 'bulk_save_limit', 'bulk_save_interval', 'docs',
+        'docs/sec', 'lag p50', 'lag p99', 'peak RSS MB'))
+    for values in matrix:
+        main_config = dict(BASE_CONFIG)
+        main_config.update(json.loads(params.config))
+        main_config.update(dict(zip(MATRIX_KEYS, values)))
+        main_config['resources_api_server'] = 'http://127.0.0.1:{}'.format(
+            params.port)
+        main_config['storage_latency'] = params.storage_latency
+        api.reset()
+        result = run_child(main_config, params.docs, params.timeout)
+        print('{:>12} {:>16} {:>19} {:>8} {:>12} {:>8} {:>8} {:>12}'.format(
+            values[0], values[1], values[2], result['docs'],
+            result['docs_per_sec'], result['lag_p50'], result['lag_p99'],
+            result['peak_rss_mb']))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Compare installed json backends on generated tender documents: API response
+decoding and storage bodies encoding.
+
+    python -m openprocurement.bridge.basic.benchmarks.serializers \
+        --docs 1000 --lots 3 --bids 5
+"""
+import argparse
+from datetime import datetime, timedelta
+from time import time
+from uuid import uuid4
+from openprocurement.bridge.basic.serializers import BACKENDS
+
+
+def _period(start, days):
+    return {'startDate': start.isoformat(),
+            'endDate': (start + timedelta(days=days)).isoformat()}
+
+
+def _document(date):
+    doc_id = uuid4().hex
+    return {
+        'id': doc_id,
+        'title': u'Тендерна документація.pdf',
+        'format': 'application/pdf',
+        'documentType': 'biddingDocuments',
+        'url': 'https://public.docs.openprocurement.org/get/{}?KeyID=a8968'
+               'c46&Signature=aVGFRPi0GdSV8wGNpwY1dDnMC7CsKxeWgDkxAPLWT0Np'
+               'UB4fXy4WUcw%2BeDRvnbL1EWGaH7cWC3RfpMhaZjJLAg%3D%3D'.format(
+                   doc_id),
+        'hash': 'md5:' + uuid4().hex,
+        'datePublished': date.isoformat(),
+        'dateModified': date.isoformat()
+    }
+
+
+def _organization():
+    return {
+        'name': u'Державне управління справами',
+        'identifier': {'scheme': u'UA-EDR', 'id': u'00037256',
+                       'uri': u'http://www.dus.gov.ua/'},
+        'address': {'countryName': u'Україна', 'postalCode': u'01220',
+                    'region': u'м. Київ', 'locality': u'м. Київ',
+                    'streetAddress': u'вул. Банкова, 11, корпус 1'},
+        'contactPoint': {'name': u'Державне управління справами',
+                         'telephone': u'0440000000'}
+    }
+
+
+def tender_document(lots=3, items=10, bids=5, documents=10):
+    """
+    Generate tender document with structure of public API response data
+    :return: dict
+    """
+    date = datetime(2017, 1, 1)
+    lots_list = [{
+        'id': uuid4().hex,
+        'title': u'Лот {}'.format(i),
+        'description': u'Закупівля обладнання для лоту {}'.format(i),
+        'status': 'active',
+        'value': {'amount': 500000.0 + i, 'currency': 'UAH',
+                  'valueAddedTaxIncluded': True},
+        'minimalStep': {'amount': 5000.0, 'currency': 'UAH',
+                        'valueAddedTaxIncluded': True},
+        'auctionPeriod': _period(date, 1),
+        'date': date.isoformat()
+    } for i in xrange(lots)]
+    return {
+        'id': uuid4().hex,
+        'tenderID': 'UA-2017-01-01-000001',
+        'title': u'Комп’ютерне обладнання',
+        'description': u'Закупівля комп’ютерного обладнання та '
+                       u'периферійних пристроїв' * 3,
+        'status': 'active.tendering',
+        'procurementMethod': 'open',
+        'procurementMethodType': 'aboveThresholdUA',
+        'awardCriteria': 'lowestCost',
+        'submissionMethod': 'electronicAuction',
+        'owner': 'broker',
+        'procuringEntity': _organization(),
+        'value': {'amount': 500000.0 * max(lots, 1), 'currency': 'UAH',
+                  'valueAddedTaxIncluded': True},
+        'enquiryPeriod': _period(date, 10),
+        'tenderPeriod': _period(date, 16),
+        'lots': lots_list,
+        'items': [{
+            'id': uuid4().hex,
+            'description': u'Ноутбук {}'.format(i),
+            'classification': {'scheme': u'ДК021', 'id': u'30213100-6',
+                               'description': u'Портативні комп’ютери'},
+            'additionalClassifications': [{
+                'scheme': u'ДКПП', 'id': u'26.20.1',
+                'description': u'Комп’ютери і периферійне устатковання'}],
+            'unit': {'name': u'штука', 'code': u'H87'},
+            'quantity': 10 + i,
+            'deliveryAddress': _organization()['address'],
+            'deliveryDate': _period(date, 30),
+            'relatedLot': lots_list[i % lots]['id'] if lots else None
+        } for i in xrange(items)],
+        'documents': [_document(date) for _ in xrange(documents)],
+        'bids': [{
+            'id': uuid4().hex,
+            'status': 'active',
+            'date': date.isoformat(),
+            'tenderers': [_organization()],
+            'lotValues': [{'relatedLot': lot['id'],
+                           'value': {'amount': 450000.0 + i,
+                                     'currency': 'UAH',
+                                     'valueAddedTaxIncluded': True}}
+                          for lot in lots_list],
+            'documents': [_document(date)]
+        } for i in xrange(bids)],
+        'date': date.isoformat(),
+        'dateModified': date.isoformat()
+    }
+
+
+def measure(serializer, docs, rounds):
+    """
+    :return: tuple: (encoded MB, encode docs per sec., decode docs per sec.)
+    """
+    bodies = [serializer.dumps(doc) for doc in docs]
+    size = sum(len(body) for body in bodies) / 1024.0 / 1024
+    start = time()
+    for _ in xrange(rounds):
+        for doc in docs:
+            serializer.dumps(doc)
+    encode = len(docs) * rounds / (time() - start)
+    start = time()
+    for _ in xrange(rounds):
+        for body in bodies:
+            serializer.loads(body)
+    decode = len(docs) * rounds / (time() - start)
+    return size, encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- JSON backends benchmark ----')
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--lots', type=int, default=3)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--bids', type=int, default=5)
+    parser.add_argument('--documents', type=int, default=10)
+    params = parser.parse_args()
+
+    docs = [tender_document(params.lots, params.items, params.bids,
+                            params.documents)
+            for _ in xrange(params.docs)]
+    print('{:>12} {:>10} {:>14} {:>14}'.format(
+        'backend', 'size MB', 'dumps doc/s', 'loads doc/s'))
+    for name in sorted(BACKENDS):
+        serializer = BACKENDS[name]()
+        if serializer is None:
+            print('{:>12} not installed'.format(name))
+            continue
+        size, encode, decode = measure(serializer, docs, params.rounds)
+        print('{:>12} {:>10.2f} {:>14.0f} {:>14.0f}'.format(
+            name, size, encode, decode))
+
+
+if __name__ == '__main__':
+    main()
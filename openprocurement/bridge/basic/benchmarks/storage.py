@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from gevent import sleep
+from iso8601 import parse_date
+from openprocurement.bridge.basic.utils import TZ
+
+
+class MemoryStorage(object):
+
+    """
+    In-memory storage with the same interface as storage plugins. Collects
+    lag between document dateModified and its saving time.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.docs = {}
+        self.checkpoints = {}
+        self.lags = []
+
+    def get_doc(self, doc_id):
+        if self.latency:
+            sleep(self.latency)
+        doc = self.docs.get(doc_id)
+        return dict(doc) if doc else None
+
+    def filter_bulk(self, bulk):
+        if self.latency:
+            sleep(self.latency)
+        return dict((doc_id, self.docs[doc_id]['dateModified'])
+                    for doc_id in bulk if doc_id in self.docs)
+
+    def save_bulk(self, bulk):
+        if self.latency:
+            sleep(self.latency)
+        now = datetime.now(TZ)
+        results = []
+        for doc_id, doc in bulk.items():
+            stored = self.docs.get(doc_id)
+            if stored and stored['dateModified'] >= doc['dateModified']:
+                results.append((True, doc_id, 'skipped'))
+                continue
+            self.docs[doc_id] = doc
+            self.lags.append(
+                (now - parse_date(doc['dateModified'])).total_seconds())
+            results.append((True, doc_id, 'updated' if stored else 'created'))
+        return results
+
+    def get_checkpoint(self, name):
+        return self.checkpoints.get(name)
+
+    def save_checkpoint(self, name, state):
+        self.checkpoints[name] = state
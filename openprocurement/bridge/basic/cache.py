@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from openprocurement.bridge.basic.metrics import COALESCED_ITEMS
+
+
+class DateModifiedIndex(object):
+
+    """Bounded LRU index of stored documents dateModified by id"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.items
+
+    def get(self, doc_id):
+        date_modified = self.items.pop(doc_id, None)
+        if date_modified is not None:
+            self.items[doc_id] = date_modified
+        return date_modified
+
+    def set(self, doc_id, date_modified):
+        if self.max_size <= 0:
+            return
+        current = self.items.pop(doc_id, None)
+        if current is not None and current > date_modified:
+            date_modified = current
+        self.items[doc_id] = date_modified
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def delete(self, doc_id):
+        self.items.pop(doc_id, None)
+
+    def lookup(self, bulk):
+        """
+        Split bulk on ids known by index and missed ones
+        :param bulk: dict where key is doc_id and value - dateModified
+        :return: tuple: dict of found doc_id: stored dateModified, dict of
+        missed doc_id: dateModified from bulk
+        """
+        found = {}
+        missed = {}
+        for doc_id, date_modified in bulk.items():
+            stored = self.get(doc_id)
+            if stored is None:
+                missed[doc_id] = date_modified
+            else:
+                found[doc_id] = stored
+        self.hits += len(found)
+        self.misses += len(missed)
+        return found, missed
+
+
+class PendingItems(object):
+
+    """
+    Items waiting in bridge queues (input, main and retry) by id. Item
+    received while the same id is still pending isn't queued again: pending
+    item takes newest dateModified (and fields) and one API fetch is saved.
+    Worker discards item when takes it from queue, so changes received
+    during fetch are queued again.
+    Every queued item is also tracked until it is done: saved to storage,
+    skipped or finally dropped, feed checkpoint waits for it.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.stages = {}
+        # Sequence numbers of queued and not done items by id, oldest first
+        self.units = {}
+        self.seq = 0
+        self.saved = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+    def add(self, item, stage='input', requeued=False):
+        """
+        :param item: dict with id and dateModified, kept by reference
+        :param stage: queue where item was going to, for metrics
+        :param requeued: bool, item was taken from queue and isn't done,
+        it keeps its place for checkpoint or is done when coalesced
+        :return: bool: True if item should be queued, False if it was
+        coalesced with pending one
+        """
+        pending = self.items.get(item['id'])
+        if pending is None:
+            self.items[item['id']] = item
+            self.stages[item['id']] = stage
+            if not requeued:
+                self.seq += 1
+                self.units.setdefault(item['id'], []).append(self.seq)
+            return True
+        if item['dateModified'] > pending['dateModified']:
+            # Pending item stays in queue of its stream
+            pending.update((key, value) for key, value in item.items()
+                           if key != 'stream')
+        if requeued:
+            self.done(item['id'])
+        self.saved += 1
+        COALESCED_ITEMS.inc(stage=stage)
+        return False
+
+    def stage(self, item_id):
+        """
+        :return: str: queue pending item is going to, None if not pending
+        """
+        return self.stages.get(item_id)
+
+    def done(self, item_id):
+        """
+        Oldest not done item of id is saved, skipped or dropped
+        """
+        units = self.units.get(item_id)
+        if units:
+            units.pop(0)
+        if not units:
+            self.units.pop(item_id, None)
+
+    def snapshot(self):
+        """
+        :return: dict: newest not done item sequence number by id, see
+        drained
+        """
+        return dict((item_id, units[-1])
+                    for item_id, units in self.units.iteritems())
+
+    def drained(self, snapshot):
+        """
+        :param snapshot: dict returned by snapshot
+        :return: bool: all snapshot items are done
+        """
+        return all(not self.units.get(item_id) or
+                   self.units[item_id][0] > seq
+                   for item_id, seq in snapshot.iteritems())
+
+    def discard(self, item_id, item=None):
+        """
+        :param item: remove only if this item is pending, item replaced by
+        live change keeps newer one
+        """
+        if item is None or self.items.get(item_id) is item:
+            self.items.pop(item_id, None)
+            self.stages.pop(item_id, None)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+from gevent import getcurrent, spawn
+from gevent.queue import Queue
+from openprocurement_client.resources.sync import ResourceFeeder
+
+logger = logging.getLogger(__name__)
+
+
+class FileCheckpoint(object):
+
+    """Keeps feed checkpoint in local json file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, name):
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path) as checkpoint_file:
+            return json.load(checkpoint_file).get(name)
+
+    def save(self, name, state):
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump({name: state}, checkpoint_file)
+        os.rename(tmp_path, self.path)
+
+
+class StorageCheckpoint(object):
+
+    """Keeps feed checkpoint in configured storage"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def load(self, name):
+        return self.db.get_checkpoint(name)
+
+    def save(self, name, state):
+        self.db.save_checkpoint(name, state)
+
+
+class CheckpointResourceFeeder(ResourceFeeder):
+
+    """
+    ResourceFeeder which can start sync from saved offsets. Items are tagged
+    by 'stream': live changes from forward worker are yielded by
+    get_resource_items and feed history from backward worker by
+    get_backward_items, so slow history consumer doesn't block live changes.
+    """
+
+    def __init__(self, checkpoint=None, **kwargs):
+        super(CheckpointResourceFeeder, self).__init__(**kwargs)
+        self.checkpoint = checkpoint
+        self.backward_queue = Queue(
+            maxsize=self.retrievers_params['queue_size'])
+
+    def handle_response_data(self, data):
+        # First page of feed on sync start is retrieved by backward client
+        if getcurrent() is getattr(self, 'forward_worker', None):
+            stream, queue = 'forward', self.queue
+        else:
+            stream, queue = 'backward', self.backward_queue
+        for item in data:
+            item['stream'] = stream
+            queue.put(item)
+
+    def get_backward_items(self):
+        """
+        :return: iterator of feed history items
+        """
+        while True:
+            yield self.backward_queue.get()
+
+    def get_checkpoint(self):
+        """
+        Return current feed position
+        :return: dict with backward/forward offsets and retrieve mode
+        """
+        backward_worker = getattr(self, 'backward_worker', None)
+        return {
+            'resource': self.resource,
+            'retrieve_mode': self.extra_params.get('mode'),
+            'backward_offset':
+                getattr(self, 'backward_params', {}).get('offset'),
+            'forward_offset': getattr(self, 'forward_params', {}).get('offset'),
+            'backward_finished': bool(
+                backward_worker is not None and backward_worker.ready() and
+                backward_worker.value == 0)
+        }
+
+    def is_backward_crawl(self):
+        """
+        :return: bool: True while backward worker crawls feed history
+        """
+        backward_worker = getattr(self, 'backward_worker', None)
+        return backward_worker is not None and not backward_worker.ready()
+
+    def start_sync(self):
+        # Checkpoint used only once, restart_sync begins from scratch
+        checkpoint, self.checkpoint = self.checkpoint, None
+        if not checkpoint or not checkpoint.get('forward_offset'):
+            return super(CheckpointResourceFeeder, self).start_sync()
+        if not hasattr(self, 'forward_client'):
+            self.init_api_clients()
+        logger.info('Resume sync from checkpoint: {}'.format(checkpoint),
+                    extra={'MESSAGE_ID': 'resume_from_checkpoint'})
+        self.forward_params['offset'] = checkpoint['forward_offset']
+        if (checkpoint.get('backward_offset') and
+                not checkpoint.get('backward_finished')):
+            self.backward_params['offset'] = checkpoint['backward_offset']
+            self.backward_worker = spawn(self.retriever_backward)
+        else:
+            self.backward_worker = spawn(lambda: 0)
+        self.forward_worker = spawn(self.retriever_forward)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import math
+from openprocurement.bridge.basic.utils import monotonic
+
+
+class WorkersController(object):
+
+    """
+    Estimates workers count for queue by Little's law. Each worker serves
+    batch_size items per API request latency, so to keep up with arrivals
+    and drain current backlog during drain_time seconds pool needs
+    (arrival_rate + backlog / drain_time) * latency / batch_size workers.
+    """
+
+    def __init__(self, min_workers, max_workers, drain_time, batch_size=1,
+                 alpha=0.5):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.drain_time = float(drain_time)
+        self.batch_size = max(batch_size, 1)
+        self.alpha = alpha
+        self.arrival_rate = 0.0
+        self.last_total = None
+        self.last_time = None
+
+    def update(self, arrived_total, now=None):
+        """
+        Update smoothed arrival rate from cumulative arrivals counter
+        :return: float: items per second
+        """
+        if now is None:
+            now = monotonic()
+        if self.last_total is not None and now > self.last_time:
+            rate = (arrived_total - self.last_total) / (now - self.last_time)
+            self.arrival_rate += self.alpha * (rate - self.arrival_rate)
+        self.last_total = arrived_total
+        self.last_time = now
+        return self.arrival_rate
+
+    def desired(self, backlog, latency, current):
+        """
+        :param backlog: items waiting in queue
+        :param latency: average API request duration, sec.
+        :param current: current workers count
+        :return: int: workers count within min and max
+        """
+        if latency <= 0:
+            # Nothing is known about service rate yet
+            return min(max(current, self.min_workers), self.max_workers)
+        load = (self.arrival_rate + backlog / self.drain_time) * latency / \
+            self.batch_size
+        return min(max(int(math.ceil(load)), self.min_workers),
+                   self.max_workers)
+
+    def step(self, current, desired):
+        """
+        Workers to add (positive) or remove (negative) during one tick. Pool
+        grows to desired size at once and shrinks by half of excess to damp
+        oscillation.
+        """
+        if desired >= current:
+            return desired - current
+        return -max((current - desired) // 2, 1)
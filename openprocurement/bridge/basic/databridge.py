@@ -8,18 +8,51 @@ import logging.config
 import os
 import argparse
 import uuid
+import zlib
 import gevent.pool
 from yaml import load
 from urlparse import urlparse
+from requests.adapters import HTTPAdapter
 from openprocurement_client.exceptions import RequestFailed
 from openprocurement_client.clients import APIResourceClient as APIClient
-from openprocurement_client.resources.sync import ResourceFeeder
-from openprocurement.bridge.basic.utils import DataBridgeConfigError
+from openprocurement.bridge.basic.utils import (
+    DataBridgeConfigError,
+    MONOTONIC_FALLBACK
+)
 from pkg_resources import iter_entry_points
 from gevent import spawn, sleep
+from gevent.lock import BoundedSemaphore
 from gevent.queue import Queue, Empty
-from datetime import datetime, timedelta
-from .workers import ResourceItemWorker
+from .batching import MicroBatcher
+from .cache import DateModifiedIndex, PendingItems
+from .controller import WorkersController
+from .metrics import (
+    API_CLIENTS,
+    API_REQUEST_DURATION,
+    FEED_ITEMS,
+    FILTER_LOOKUPS,
+    QUEUE_SIZE,
+    RETRIES,
+    RETRY_OLDEST_DUE_AGE,
+    SCALING_ARRIVAL_RATE,
+    SCALING_DECISIONS,
+    SCALING_DESIRED_WORKERS,
+    SKIPPED_ITEMS,
+    STREAM_QUEUE_SIZE,
+    THREADS,
+    start_metrics_server
+)
+from .queues import ClientScheduler, RetryQueue, StreamQueues
+from .ratelimit import RateLimiter
+from .stats import LatencyWindow
+from .serializers import get_serializer, install_client_serializer
+from .checkpoint import (
+    CheckpointResourceFeeder,
+    FileCheckpoint,
+    StorageCheckpoint
+)
+from .supervisor import BridgeSupervisor, report_status
+from .workers import BulkWriter, ResourceItemWorker
 
 try:
     import urllib3.contrib.pyopenssl
@@ -39,7 +72,8 @@ WORKER_CONFIG_KEYS = [
     'retries_count',
     'queue_timeout',
     'bulk_save_limit',
-    'bulk_save_interval'
+    'bulk_save_interval',
+    'fetch_batch_size'
 ]
 
 DEFAULTS = {
@@ -63,7 +97,9 @@ DEFAULTS = {
     'queue_timeout': 3,
     'bulk_save_limit': 1000,
     'bulk_save_interval': 5,
+    'fetch_batch_size': 1,
     'filter_workers_count': 1,
+    'filter_bulk_concurrency': 0,  # 0 - same as filter_workers_count
     'watch_interval': 10,
     'user_agent': 'basicbridge.multi',
     'resource_items_queue_size': 10000,
@@ -87,7 +123,38 @@ DEFAULTS = {
         'queue_size': 101
     },
     'perfomance_window': 300,
-    'resource': 'lots'
+    'perfomance_window_size': 1000,  # max request durations kept per client
+    'resource': 'lots',
+    'shards_count': 1,
+    'shard_index': 0,
+    # Feed offsets are saved once items received before them are saved to
+    # storage, skipped or finally dropped after last retry, see README
+    'checkpoint_storage': None,  # another values: 'storage', 'file'
+    'checkpoint_path': 'feed_checkpoint.json',
+    'checkpoint_interval': 60,
+    'filter_index_size': 100000,
+    'writers_count': 0,
+    'bulk_queue_size': 10000,
+    'metrics_host': '127.0.0.1',
+    'metrics_port': None,
+    'backfill_mode': False,
+    # 'json', 'simplejson', 'ujson' or 'auto'; None leaves
+    # openprocurement_client and couchdb with their own json
+    'json_backend': None,
+    'rate_limit': 0,  # API requests per second for all clients, 0 - off
+    'client_rate_limit': 0,  # API requests per second per client, 0 - off
+    'rate_limit_latency': 0,  # slower responses decrease rate, 0 - off
+    'client_scheduler': 'fifo',  # another value: 'p2c'
+    'workers_controller': 'threshold',  # another value: 'predictive'
+    'workers_controller_interval': 5,
+    'workers_drain_time': 30,  # seconds to drain queue backlog
+    # Share of input and main queues served for feed streams, 0 - only
+    # when other stream is empty
+    'forward_stream_weight': 10,
+    'backward_stream_weight': 1,
+    # Write feed items fields to storage without fetching documents from API
+    'feed_only': False,
+    'feed_opt_fields': []
 }
 
 
@@ -101,6 +168,11 @@ class BasicDataBridge(object):
         self.config = DEFAULTS
         self.workers_config = {}
         self.bridge_id = uuid.uuid4().hex
+        if MONOTONIC_FALLBACK:
+            logger.warning('Monotonic clock is not available, install '
+                           '\'monotonic\' package: latency, rate limit and '
+                           'scaling timings follow wall clock',
+                           extra={'MESSAGE_ID': 'monotonic_fallback'})
 
         # Init config
         for key in DEFAULTS:
@@ -112,30 +184,74 @@ class BasicDataBridge(object):
             raise DataBridgeConfigError('Invalid \'up_wait_sleep\' in '
                                         '\'retrievers_params\'. Value must be '
                                         'grater than 30.')
+        # Check feed only mode
+        if self.feed_only:
+            if self.writers_count <= 0:
+                raise DataBridgeConfigError('Invalid \'writers_count\'. Value '
+                                            'must be greater than 0 in '
+                                            '\'feed_only\' mode.')
+            # Documents aren't fetched from API, writers retry failed ones
+            self.workers_min = 0
+            self.retry_workers_min = 0
+        # Check sharding
+        if not 0 <= self.shard_index < max(self.shards_count, 1):
+            raise DataBridgeConfigError('Invalid \'shard_index\'. Value must '
+                                        'be less than \'shards_count\'.')
         # Workers settings
         for key in WORKER_CONFIG_KEYS:
             self.workers_config[key] = DEFAULTS[key]
 
+        # Workers controller
+        if self.workers_controller == 'predictive':
+            self.main_controller = WorkersController(
+                self.workers_min, self.workers_max, self.workers_drain_time,
+                self.fetch_batch_size)
+            self.retry_controller = WorkersController(
+                self.retry_workers_min, self.retry_workers_max,
+                self.workers_drain_time)
+        elif self.workers_controller != 'threshold':
+            raise DataBridgeConfigError('Invalid \'workers_controller\'. '
+                                        'Value must be \'threshold\' or '
+                                        '\'predictive\'.')
+
         # Pools
         self.workers_pool = gevent.pool.Pool(self.workers_max)
         self.retry_workers_pool = gevent.pool.Pool(self.retry_workers_max)
         self.filter_workers_pool = gevent.pool.Pool(self.filter_workers_count)
-
-        # Queues
-        if self.input_queue_size == -1:
-            self.input_queue = Queue()
-        else:
-            self.input_queue = Queue(self.input_queue_size)
-        if self.resource_items_queue_size == -1:
-            self.resource_items_queue = Queue()
+        # Limits storage filter_bulk requests made by filter workers at once
+        self.filter_bulk_semaphore = BoundedSemaphore(
+            self.filter_bulk_concurrency or self.filter_workers_count)
+        self.writers_pool = gevent.pool.Pool(self.writers_count or None)
+
+        # Queues, live changes and feed history are kept apart
+        streams = (('forward', self.forward_stream_weight),
+                   ('backward', self.backward_stream_weight))
+        self.resource_items_queue = StreamQueues(
+            streams, None if self.resource_items_queue_size == -1
+            else self.resource_items_queue_size)
+        self.input_queue = StreamQueues(
+            streams, None if self.input_queue_size == -1
+            else self.input_queue_size,
+            downstream=self.resource_items_queue)
+        if self.client_scheduler == 'fifo':
+            self.api_clients_queue = Queue()
+        elif self.client_scheduler == 'p2c':
+            self.api_clients_queue = ClientScheduler()
         else:
-            self.resource_items_queue = Queue(self.resource_items_queue_size)
-        self.api_clients_queue = Queue()
+            raise DataBridgeConfigError('Invalid \'client_scheduler\'. '
+                                        'Value must be \'fifo\' or '
+                                        '\'p2c\'.')
         if self.retry_resource_items_queue_size == -1:
-            self.retry_resource_items_queue = Queue()
+            self.retry_resource_items_queue = RetryQueue()
         else:
-            self.retry_resource_items_queue = Queue(
+            self.retry_resource_items_queue = RetryQueue(
                 self.retry_resource_items_queue_size)
+        if self.writers_count <= 0:
+            self.bulk_queue = None
+        elif self.bulk_queue_size == -1:
+            self.bulk_queue = Queue()
+        else:
+            self.bulk_queue = Queue(self.bulk_queue_size)
 
         if (self.resources_api_server != '' and
                     self.resources_api_server is not None):
@@ -147,23 +263,68 @@ class BasicDataBridge(object):
             raise DataBridgeConfigError('In config dictionary empty or missing'
                                         ' \'resource_api_server\'')
 
+        self.serializer = None
+        if self.json_backend is not None:
+            self.serializer = get_serializer(self.json_backend)
+            install_client_serializer(self.serializer)
+
         # Connecting storage plugin
         for entry_point in iter_entry_points(
                 'openprocurement.bridge.basic.plugins', self.storage_db):
             plugin = entry_point.load()
             plugin(self.config)
         self.db = self.config.get('storage_obj')
+        if self.rate_limit > 0 or self.client_rate_limit > 0:
+            self.rate_limiter = RateLimiter(
+                rate=self.rate_limit, client_rate=self.client_rate_limit,
+                latency_threshold=self.rate_limit_latency)
+        else:
+            self.rate_limiter = None
+        if self.filter_index_size > 0:
+            self.date_modified_index = DateModifiedIndex(
+                self.filter_index_size)
+        else:
+            self.date_modified_index = None
+        # Ids waiting in input, main and retry queues
+        self.pending_items = PendingItems()
+
+        # Feed checkpoint
+        if self.checkpoint_storage == 'storage':
+            self.checkpoint_backend = StorageCheckpoint(self.db)
+        elif self.checkpoint_storage == 'file':
+            path = self.checkpoint_path
+            if self.shards_count > 1:
+                path = '{}.{}'.format(path, self.shard_index)
+            self.checkpoint_backend = FileCheckpoint(path)
+        elif self.checkpoint_storage is None:
+            self.checkpoint_backend = None
+        else:
+            raise DataBridgeConfigError('Invalid \'checkpoint_storage\'. '
+                                        'Value must be \'storage\' or '
+                                        '\'file\'.')
+        self.checkpoint_name = 'feed_{}_{}'.format(self.resource,
+                                                   self.shard_index)
         extra_params = {
             'mode': self.retrieve_mode,
             'limit': self.resource_items_limit
         }
-        self.feeder = ResourceFeeder(host=self.resources_api_server,
-                                     version=self.resources_api_version, key='',
-                                     resource=self.resource,
-                                     extra_params=extra_params,
-                                     retrievers_params=self.retrievers_params,
-                                     adaptive=True)
+        if self.feed_only and self.feed_opt_fields:
+            extra_params['opt_fields'] = ','.join(self.feed_opt_fields)
+        self.feeder = CheckpointResourceFeeder(
+            checkpoint=self.load_checkpoint(),
+            host=self.resources_api_server,
+            version=self.resources_api_version, key='',
+            resource=self.resource, extra_params=extra_params,
+            retrievers_params=self.retrievers_params, adaptive=True)
         self.api_clients_info = {}
+        self.counters = {
+            'received_from_sync': 0,
+            'skipped': 0,
+            'add_to_resource_items_queue': 0,
+            'written_from_feed': 0
+        }
+        # Items taken from feeder queues by stream, for checkpoint watermark
+        self.feed_consumed = {'forward': 0, 'backward': 0}
 
     def create_api_client(self):
         client_user_agent = self.user_agent + '/' + self.bridge_id
@@ -175,6 +336,12 @@ class BasicDataBridge(object):
                     user_agent=client_user_agent,
                     api_version=self.resources_api_version, key='',
                     resource=self.resource)
+                if self.fetch_batch_size > 1:
+                    # Keep-alive connections for concurrent batch requests
+                    adapter = HTTPAdapter(pool_connections=1,
+                                          pool_maxsize=self.fetch_batch_size)
+                    api_client.session.mount('http://', adapter)
+                    api_client.session.mount('https://', adapter)
                 client_id = uuid.uuid4().hex
                 logger.info('Started api_client {}'.format(
                     api_client.session.headers['User-Agent']),
@@ -187,7 +354,10 @@ class BasicDataBridge(object):
                 }
                 self.api_clients_info[api_client_dict['id']] = {
                     'drop_cookies': False,
-                    'request_durations': {},
+                    # Durations are kept for one watch after window passed
+                    'request_durations': LatencyWindow(
+                        self.perfomance_window + self.watch_interval,
+                        self.perfomance_window_size),
                     'request_interval': 0,
                     'avg_duration': 0
                 }
@@ -210,76 +380,263 @@ class BasicDataBridge(object):
                     'create_api_client will be sleep {} sec.'.format(timeout))
                 sleep(timeout)
 
+    def load_checkpoint(self):
+        if self.checkpoint_backend is None:
+            return None
+        try:
+            checkpoint = self.checkpoint_backend.load(self.checkpoint_name)
+        except Exception as e:
+            logger.error('Failed load feed checkpoint: {}'.format(repr(e)),
+                         extra={'MESSAGE_ID': 'exceptions'})
+            return None
+        if checkpoint and checkpoint.get('retrieve_mode') != \
+                self.retrieve_mode:
+            logger.warning('Ignored feed checkpoint with retrieve_mode {}'
+                           .format(checkpoint.get('retrieve_mode')))
+            return None
+        return checkpoint
+
+    def _checkpoint_watermark(self):
+        """
+        Items received before feed checkpoint: not done ones and positions
+        of last items in feeder queues
+        :return: tuple: (pending items snapshot, dict of positions by stream)
+        """
+        positions = {
+            'forward': self.feed_consumed['forward'] +
+            self.feeder.queue.qsize(),
+            'backward': self.feed_consumed['backward'] +
+            self.feeder.backward_queue.qsize()
+        }
+        return self.pending_items.snapshot(), positions
+
+    def _checkpoint_reached(self, watermark):
+        """
+        :return: bool: all items received before checkpoint left feeder and
+        are done
+        """
+        pending, positions = watermark
+        return (all(self.feed_consumed[stream] >= position
+                    for stream, position in positions.items()) and
+                self.pending_items.drained(pending))
+
+    def checkpoint_saver(self):
+        # Checkpoint is saved only after items retrieved before it are done,
+        # until then older offsets stay saved
+        previous = None
+        watermark = None
+        while True:
+            sleep(self.checkpoint_interval)
+            if previous and not self._checkpoint_reached(watermark):
+                logger.info('Feed checkpoint postponed, items received '
+                            'before it are still processed',
+                            extra={'MESSAGE_ID': 'postpone_checkpoint'})
+                continue
+            if previous and previous['forward_offset']:
+                try:
+                    self.checkpoint_backend.save(self.checkpoint_name,
+                                                 previous)
+                    logger.info('Saved feed checkpoint {}'.format(previous),
+                                extra={'MESSAGE_ID': 'save_checkpoint'})
+                except Exception as e:
+                    logger.error('Failed save feed checkpoint: {}'.format(
+                        repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+            previous = self.feeder.get_checkpoint()
+            watermark = self._checkpoint_watermark()
+
     def fill_api_clients_queue(self):
         while self.api_clients_queue.qsize() < self.workers_min:
             self.create_api_client()
 
-    def fill_input_queue(self):
-        for resource_item in self.feeder.get_resource_items():
+    def _is_own_resource_item(self, item_id):
+        if self.shards_count <= 1:
+            return True
+        item_hash = zlib.crc32(item_id.encode('utf-8')) & 0xffffffff
+        return item_hash % self.shards_count == self.shard_index
+
+    def fill_input_queue(self, backward=False):
+        if backward:
+            resource_items = self.feeder.get_backward_items()
+        else:
+            resource_items = self.feeder.get_resource_items()
+        stream = 'backward' if backward else 'forward'
+        for resource_item in resource_items:
+            # Item becomes pending before next switch, so consumed item is
+            # either pending or handled
+            self.feed_consumed[stream] += 1
+            if not self._is_own_resource_item(resource_item['id']):
+                continue
+            self.counters['received_from_sync'] += 1
+            FEED_ITEMS.inc()
+            pending = self.pending_items.get(resource_item['id'])
+            if (pending is not None and
+                    resource_item.get('stream') == 'forward' and
+                    (pending.get('stream') == 'backward' or
+                     self.pending_items.stage(pending['id']) == 'retry')):
+                # Live change doesn't wait behind feed history or retry
+                # backoff, pending item will be fetched too
+                self.pending_items.discard(pending['id'], pending)
+            if not self.pending_items.add(resource_item):
+                logger.debug('Coalesced {} {} {} with pending one'.format(
+                    self.workers_config['resource'][:-1], resource_item['id'],
+                    resource_item['dateModified']),
+                    extra={'MESSAGE_ID': 'coalesced'})
+                continue
             self.input_queue.put(resource_item)
             logger.debug('Add to temp queue from sync: {} {} {}'.format(
                 self.workers_config['resource'][:-1], resource_item['id'],
                 resource_item['dateModified']),
                 extra={'MESSAGE_ID': 'received_from_sync'})
 
-    def send_bulk(self, input_dict):
-        resp_dict = self.db.filter_bulk(input_dict)
+    def create_worker(self, resource_items_queue):
+        return ResourceItemWorker.spawn(
+            self.api_clients_queue, resource_items_queue, self.db,
+            self.workers_config, self.retry_resource_items_queue,
+            self.api_clients_info,
+            date_modified_index=self.date_modified_index,
+            bulk_queue=self.bulk_queue, rate_limiter=self.rate_limiter,
+            pending_items=self.pending_items)
+
+    def create_writer(self):
+        return BulkWriter.spawn(
+            self.bulk_queue, self.db, self.workers_config,
+            self.retry_resource_items_queue,
+            date_modified_index=self.date_modified_index,
+            pending_items=self.pending_items, feed_only=self.feed_only)
+
+    def _filter_bulk(self, input_dict):
+        if self.date_modified_index is None:
+            with self.filter_bulk_semaphore:
+                return self.db.filter_bulk(input_dict)
+        resp_dict, missed = self.date_modified_index.lookup(input_dict)
+        FILTER_LOOKUPS.inc(len(resp_dict), result='hit')
+        FILTER_LOOKUPS.inc(len(missed), result='miss')
+        if missed:
+            with self.filter_bulk_semaphore:
+                storage_resp_dict = self.db.filter_bulk(missed)
+            for item_id, date_modified in storage_resp_dict.items():
+                # Elasticsearch storage returns False for missing docs
+                if date_modified:
+                    self.date_modified_index.set(item_id, date_modified)
+            resp_dict.update(storage_resp_dict)
+        return resp_dict
+
+    def _feed_doc(self, item):
+        """
+        Build storage document from feed item and configured opt_fields
+        :return: dict
+        """
+        doc = {'id': item['id'], 'dateModified': item['dateModified']}
+        for field in self.feed_opt_fields:
+            if field in item:
+                doc[field] = item[field]
+        return doc
+
+    def send_bulk(self, input_dict, items=None):
+        """
+        :param items: dict, input queue items of input_dict by id, pending
+        ones by default
+        """
+        if items is None:
+            items = dict((item_id, self.pending_items.get(item_id))
+                         for item_id in input_dict)
+        handled = set()
+        try:
+            self._send_bulk(input_dict, items, handled)
+        except Exception:
+            # Items of failed bulk are lost, their ids must not stay pending
+            # or later feed changes of them would be coalesced forever
+            for item_id in input_dict:
+                if item_id not in handled:
+                    self.pending_items.discard(item_id, items.get(item_id))
+                    self.pending_items.done(item_id)
+            raise
+
+    def _send_bulk(self, input_dict, items, handled):
+        """
+        :param handled: set, filled with ids skipped or passed further
+        """
+        resp_dict = self._filter_bulk(input_dict)
         for item_id, date_modified in input_dict.items():
-            if item_id in resp_dict and date_modified == resp_dict[item_id]:
+            # Pending item could get newer dateModified during filtering
+            item = items.get(item_id) or {
+                'id': item_id, 'dateModified': date_modified}
+            date_modified = item['dateModified']
+            handled.add(item_id)
+            if resp_dict.get(item_id) and resp_dict[item_id] >= date_modified:
+                self.pending_items.discard(item_id, item)
+                self.pending_items.done(item_id)
+                self.counters['skipped'] += 1
+                SKIPPED_ITEMS.inc()
                 logger.debug('Ignored {} {}: SYNC - {}, EDGE - {}'.format(
                     self.workers_config['resource'][:-1], item_id,
                     date_modified, resp_dict[item_id]),
                     extra={'MESSAGE_ID': 'skipped'})
+            elif self.feed_only:
+                self.pending_items.discard(item_id, item)
+                self.bulk_queue.put((self._feed_doc(item), item))
+                self.counters['written_from_feed'] += 1
+                logger.debug('Put to bulk queue from feed {}: {} {}'.format(
+                    self.workers_config['resource'][:-1], item_id,
+                    date_modified),
+                    extra={'MESSAGE_ID': 'written_from_feed'})
             else:
-                self.resource_items_queue.put(
-                    {'id': item_id, 'dateModified': date_modified})
+                self.resource_items_queue.put(item)
+                self.counters['add_to_resource_items_queue'] += 1
                 logger.debug('Put to main queue {}: {} {}'.format(
                     self.workers_config['resource'][:-1], item_id,
                     date_modified),
                     extra={'MESSAGE_ID': 'add_to_resource_items_queue'})
 
     def fill_resource_items_queue(self):
-        start_time = datetime.now()
-        input_dict = {}
+        batcher = MicroBatcher(self.bulk_query_limit, self.bulk_query_interval)
         while True:
             # Get resource_item from temp queue
-            if not self.input_queue.empty():
-                resource_item = self.input_queue.get()
-            else:
-                timeout = self.bulk_query_interval -\
-                    (datetime.now() - start_time).total_seconds()
-                if timeout > self.bulk_query_interval:
-                    timeout = self.bulk_query_interval
-                try:
-                    resource_item = self.input_queue.get(timeout=timeout)
-                except Empty:
-                    resource_item = None
-
-            # Add resource_item to bulk
-            if resource_item is not None:
-                input_dict[resource_item['id']] = resource_item['dateModified']
-
-            if (len(input_dict) >= self.bulk_query_limit or
-                (datetime.now() - start_time).total_seconds() >=
-                    self.bulk_query_interval):
-                if len(input_dict) > 0:
-                    self.send_bulk(input_dict)
-                    input_dict = {}
-                start_time = datetime.now()
+            try:
+                resource_item = self.input_queue.get(
+                    timeout=batcher.timeout())
+                replaced = batcher.get(resource_item['id'])
+                batcher.add(resource_item['id'], resource_item)
+                if replaced is not None:
+                    # History item replaced by live change in batch
+                    self.pending_items.discard(replaced['id'], replaced)
+                    self.pending_items.done(replaced['id'])
+            except Empty:
+                pass
+
+            if batcher.ready():
+                items = batcher.take()
+                self.send_bulk(
+                    dict((item_id, item['dateModified'])
+                         for item_id, item in items.items()), items)
+
+    def _filter_worker_failed(self, greenlet):
+        logger.error('Fill thread error: {}'.format(
+            greenlet.exception.message), extra={'MESSAGE_ID': 'exception'})
+
+    def spawn_filter_workers(self):
+        """
+        Top up filter workers pool to filter_workers_count greenlets
+        :return: int: spawned greenlets count
+        """
+        count = self.filter_workers_count - len(self.filter_workers_pool)
+        for _ in xrange(count):
+            filter_worker = self.filter_workers_pool.spawn(
+                self.fill_resource_items_queue)
+            filter_worker.link_exception(self._filter_worker_failed)
+        return count
 
     def _get_average_requests_duration(self):
         req_durations = []
-        delta = timedelta(seconds=self.perfomance_window)
-        current_date = datetime.now() - delta
         for cid, info in self.api_clients_info.items():
-            if len(info['request_durations']) > 0:
-                if min(info['request_durations'].keys()) <= current_date:
+            durations = info['request_durations']
+            if len(durations) > 0:
+                if durations.age() >= self.perfomance_window:
                     info['grown'] = True
-                avg = round(
-                    sum(info['request_durations'].values()) * 1.0 /
-                    len(info['request_durations']), 3)
+                avg = round(durations.mean(), 3)
                 req_durations.append(avg)
                 info['avg_duration'] = avg
+                info['p95_duration'] = round(durations.percentile(95), 3)
 
         if len(req_durations) > 0:
             return round(sum(req_durations) /
@@ -290,75 +647,167 @@ class BasicDataBridge(object):
     # TODO: Add logic for restart sync if last response grater than some values
     # and no active tasks specific for resource
 
+    def _add_worker(self, pool, queue):
+        self.create_api_client()
+        pool.add(self.create_worker(queue))
+
+    def _remove_worker(self, pool):
+        wi = pool.greenlets.pop()
+        wi.shutdown()
+        if isinstance(self.api_clients_queue, ClientScheduler):
+            api_client_dict = self.api_clients_queue.get(slowest=True)
+            self.api_clients_queue.forget(api_client_dict['id'])
+        else:
+            api_client_dict = self.api_clients_queue.get()
+        del self.api_clients_info[api_client_dict['id']]
+        API_REQUEST_DURATION.remove(client=api_client_dict['id'])
+        if self.rate_limiter is not None:
+            self.rate_limiter.remove_client(api_client_dict['id'])
+
+    def _queue_fill(self, queue, size):
+        """
+        :return: float: queue fill percent or None for unbounded queue
+        """
+        if size <= 0:
+            return None
+        return round(queue.qsize() / (float(size) / 100), 2)
+
+    def _log_queue_fill(self, name, queue, size):
+        filled = self._queue_fill(queue, size)
+        if filled is None:
+            logger.info('{} size {}, queue is unbounded'.format(
+                name, queue.qsize()))
+        else:
+            logger.info('{} filled on {} %'.format(name, filled))
+        return filled
+
     def queues_controller(self):
         while True:
-            if (self.workers_pool.free_count() > 0 and
-                (self.resource_items_queue.qsize() >
-                 ((float(self.resource_items_queue_size) / 100) *
-                  self.workers_inc_threshold))):
-                self.create_api_client()
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
-                self.workers_pool.add(w)
+            filled_resource_items_queue = self._log_queue_fill(
+                'Resource items queue', self.resource_items_queue,
+                self.resource_items_queue_size)
+            self._log_queue_fill(
+                'Retry resource items queue',
+                self.retry_resource_items_queue,
+                self.retry_resource_items_queue_size)
+            if filled_resource_items_queue is None:
+                # Fill thresholds are not defined for unbounded queue
+                pass
+            elif (self.workers_pool.free_count() > 0 and
+                  filled_resource_items_queue > self.workers_inc_threshold):
+                self._add_worker(self.workers_pool, self.resource_items_queue)
                 logger.info('Queue controller: Create main queue worker.')
-            elif (self.resource_items_queue.qsize() <
-                  ((float(self.resource_items_queue_size) / 100) *
-                   self.workers_dec_threshold)):
+            elif filled_resource_items_queue < self.workers_dec_threshold:
                 if len(self.workers_pool) > self.workers_min:
-                    wi = self.workers_pool.greenlets.pop()
-                    wi.shutdown()
-                    api_client_dict = self.api_clients_queue.get()
-                    del self.api_clients_info[api_client_dict['id']]
+                    self._remove_worker(self.workers_pool)
                     logger.info('Queue controller: Kill main queue worker.')
-            filled_resource_items_queue = round(
-                self.resource_items_queue.qsize() /
-                (float(self.resource_items_queue_size) / 100), 2)
-            logger.info('Resource items queue filled on {} %'.format(
-                filled_resource_items_queue))
-            filled_retry_resource_items_queue \
-                = round(self.retry_resource_items_queue.qsize() / float(
-                    self.retry_resource_items_queue_size) / 100, 2)
-            logger.info('Retry resource items queue filled on {} %'.format(
-                filled_retry_resource_items_queue))
             sleep(self.queues_controller_timeout)
 
+    def scale_workers(self):
+        """
+        Resize main and retry workers pools to count estimated by workers
+        controllers from queues arrival rate, backlog and API latency
+        """
+        latency, _ = self._get_average_requests_duration()
+        # Retries which aren't due yet can't be worked, so they don't size
+        # retry pool
+        pools = (
+            ('main', self.workers_pool, self.resource_items_queue,
+             self.main_controller,
+             self.counters['add_to_resource_items_queue'],
+             self.resource_items_queue.qsize),
+            ('retry', self.retry_workers_pool,
+             self.retry_resource_items_queue, self.retry_controller,
+             RETRIES.get(result='scheduled'),
+             self.retry_resource_items_queue.due_count)
+        )
+        for name, pool, queue, controller, arrived, backlog_size in pools:
+            arrival_rate = controller.update(arrived)
+            backlog = backlog_size()
+            current = len(pool)
+            desired = controller.desired(backlog, latency, current)
+            step = controller.step(current, desired)
+            for _ in xrange(step):
+                self._add_worker(pool, queue)
+            for _ in xrange(-step):
+                self._remove_worker(pool)
+            SCALING_DESIRED_WORKERS.set(desired, pool=name)
+            SCALING_ARRIVAL_RATE.set(arrival_rate, pool=name)
+            if step:
+                SCALING_DECISIONS.inc(abs(step), pool=name,
+                                      action='up' if step > 0 else 'down')
+            logger.info(
+                'Workers controller: {} pool {} -> {} workers, arrival rate '
+                '{} items/sec., backlog {}, latency {} sec.'.format(
+                    name, current, current + step, round(arrival_rate, 3),
+                    backlog, latency),
+                extra={'MESSAGE_ID': 'workers_controller',
+                       'POOL': name,
+                       'DESIRED_WORKERS': desired,
+                       'ARRIVAL_RATE': arrival_rate})
+
+    def predictive_controller(self):
+        while True:
+            self.scale_workers()
+            sleep(self.workers_controller_interval)
+
+    def check_backfill(self):
+        """
+        Switch storage to backfill settings while feeder crawls feed history
+        and back to live settings when it reaches forward mode
+        """
+        if not self.backfill_mode or \
+                not hasattr(self.db, 'start_backfill'):
+            return
+        in_backfill = self.feeder.is_backward_crawl()
+        try:
+            if in_backfill and self.db.backfill is not True:
+                self.db.start_backfill()
+            elif not in_backfill and self.db.backfill is not False:
+                self.db.stop_backfill()
+        except Exception as e:
+            logger.error('Failed switch storage backfill mode: {}'.format(
+                repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+
     def gevent_watcher(self):
         self.perfomance_watcher()
+        self.check_backfill()
 
         # Check fill threads
-        input_threads = 1
+        input_threads = 2
         if self.input_queue_filler.exception:
-            input_threads = 0
+            input_threads -= 1
             logger.error('Temp queue filler error: {}'.format(
                 self.input_queue_filler.exception.message),
                 extra={'MESSAGE_ID': 'exception'})
             self.input_queue_filler = spawn(self.fill_input_queue)
+        if self.backward_input_queue_filler.exception:
+            input_threads -= 1
+            logger.error('Backward temp queue filler error: {}'.format(
+                self.backward_input_queue_filler.exception.message),
+                extra={'MESSAGE_ID': 'exception'})
+            self.backward_input_queue_filler = spawn(self.fill_input_queue,
+                                                     backward=True)
         logger.info('Input threads {}'.format(input_threads),
                     extra={'INPUT_THREADS': input_threads})
-        fill_threads = 1
-        if self.filler.exception:
-            fill_threads = 0
-            logger.error('Fill thread error: {}'.format(
-                self.filler.exception.message),
-                extra={'MESSAGE_ID': 'exception'})
-            self.filler = spawn(self.fill_resource_items_queue)
+        THREADS.set(input_threads, pool='input')
+        fill_threads = len(self.filter_workers_pool)
+        if fill_threads < self.filter_workers_count:
+            self.spawn_filter_workers()
+            logger.info('Watcher: Create {} filter workers.'.format(
+                self.filter_workers_count - fill_threads))
         logger.info('Filter threads {}'.format(fill_threads),
                     extra={'FILTER_THREADS': fill_threads})
+        THREADS.set(fill_threads, pool='filter')
 
         main_threads = self.workers_max - self.workers_pool.free_count()
         logger.info('Main threads {}'.format(main_threads),
                     extra={'MAIN_THREADS': main_threads})
+        THREADS.set(main_threads, pool='main')
 
         if len(self.workers_pool) < self.workers_min:
             for i in xrange(0, (self.workers_min - len(self.workers_pool))):
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
+                w = self.create_worker(self.resource_items_queue)
                 self.workers_pool.add(w)
                 logger.info('Watcher: Create main queue worker.')
                 self.create_api_client()
@@ -366,28 +815,96 @@ class BasicDataBridge(object):
             self.retry_workers_pool.free_count()
         logger.info('Retry threads {}'.format(retry_threads),
                     extra={'RETRY_THREADS': retry_threads})
+        THREADS.set(retry_threads, pool='retry')
         if len(self.retry_workers_pool) < self.retry_workers_min:
             for i in xrange(0, self.retry_workers_min -
                             len(self.retry_workers_pool)):
                 self.create_api_client()
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.retry_resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
+                w = self.create_worker(self.retry_resource_items_queue)
                 self.retry_workers_pool.add(w)
                 logger.info('Watcher: Create retry queue worker.')
 
+        if len(self.writers_pool) < self.writers_count:
+            for i in xrange(0, self.writers_count - len(self.writers_pool)):
+                self.writers_pool.add(self.create_writer())
+                logger.info('Watcher: Create bulk writer.')
+        if self.bulk_queue is not None:
+            writer_threads = len(self.writers_pool)
+            logger.info('Writer threads {}'.format(writer_threads),
+                        extra={'WRITER_THREADS': writer_threads})
+            THREADS.set(writer_threads, pool='writer')
+            bulk_queue_size = self.bulk_queue.qsize()
+            logger.info('Bulk queue size {}'.format(bulk_queue_size),
+                        extra={'BULK_QUEUE_SIZE': bulk_queue_size})
+            QUEUE_SIZE.set(bulk_queue_size, queue='bulk')
+
         # Log queues size and API clients count
         main_queue_size = self.resource_items_queue.qsize()
         logger.info('Resource items queue size {}'.format(
             main_queue_size), extra={'MAIN_QUEUE_SIZE': main_queue_size})
+        QUEUE_SIZE.set(main_queue_size, queue='main')
+        QUEUE_SIZE.set(self.input_queue.qsize(), queue='input')
+        for name, queue in (('input', self.input_queue),
+                            ('main', self.resource_items_queue)):
+            for stream, stream_queue in queue.queues.items():
+                STREAM_QUEUE_SIZE.set(stream_queue.qsize(), queue=name,
+                                      stream=stream)
         retry_queue_size = self.retry_resource_items_queue.qsize()
         logger.info('Resource items retry queue size {}'.format(
             retry_queue_size), extra={'RETRY_QUEUE_SIZE': retry_queue_size})
+        QUEUE_SIZE.set(retry_queue_size, queue='retry')
+        retry_oldest_due_age = round(
+            self.retry_resource_items_queue.oldest_due_age(), 3)
+        logger.info('Resource items retry queue oldest due age {} sec.'.format(
+            retry_oldest_due_age),
+            extra={'RETRY_OLDEST_DUE_AGE': retry_oldest_due_age})
+        RETRY_OLDEST_DUE_AGE.set(retry_oldest_due_age)
         api_clients_count = len(self.api_clients_info)
         logger.info('API Clients count: {}'.format(api_clients_count),
                     extra={'API_CLIENTS': api_clients_count})
+        API_CLIENTS.set(api_clients_count)
+        if self.date_modified_index is not None:
+            logger.info(
+                'Filter index size {}, hits {}, misses {}'.format(
+                    len(self.date_modified_index),
+                    self.date_modified_index.hits,
+                    self.date_modified_index.misses),
+                extra={'FILTER_INDEX_SIZE': len(self.date_modified_index),
+                       'FILTER_INDEX_HITS': self.date_modified_index.hits,
+                       'FILTER_INDEX_MISSES': self.date_modified_index.misses})
+        logger.info('Pending items {}, coalesced {}'.format(
+            len(self.pending_items), self.pending_items.saved),
+            extra={'PENDING_ITEMS': len(self.pending_items),
+                   'COALESCED_ITEMS': self.pending_items.saved})
+
+    def get_status(self):
+        """
+        Return bridge health and metrics snapshot, used by supervisor
+        :return: dict
+        """
+        status = {
+            'shard_index': self.shard_index,
+            'input_queue_size': self.input_queue.qsize(),
+            'resource_items_queue_size': self.resource_items_queue.qsize(),
+            'retry_resource_items_queue_size':
+                self.retry_resource_items_queue.qsize(),
+            'retry_oldest_due_age':
+                self.retry_resource_items_queue.oldest_due_age(),
+            'main_threads': self.workers_max - self.workers_pool.free_count(),
+            'retry_threads':
+                self.retry_workers_max - self.retry_workers_pool.free_count(),
+            'api_clients_count': len(self.api_clients_info),
+            'filter_threads': len(self.filter_workers_pool),
+            'writer_threads': len(self.writers_pool),
+            'bulk_queue_size':
+                self.bulk_queue.qsize() if self.bulk_queue is not None else 0
+        }
+        status.update(self.counters)
+        status['coalesced'] = self.pending_items.saved
+        if self.date_modified_index is not None:
+            status['filter_index_hits'] = self.date_modified_index.hits
+            status['filter_index_misses'] = self.date_modified_index.misses
+        return status
 
     def _calculate_st_dev(self, values):
         if len(values) > 0:
@@ -419,35 +936,30 @@ class BasicDataBridge(object):
 
     def perfomance_watcher(self):
             avg_duration, values = self._get_average_requests_duration()
-            for _, info in self.api_clients_info.items():
-                delta = timedelta(
-                    seconds=self.perfomance_window + self.watch_interval)
-                current_date = datetime.now() - delta
-                delete_list = []
-                for key in info['request_durations']:
-                    if key < current_date:
-                        delete_list.append(key)
-                for k in delete_list:
-                    del info['request_durations'][k]
-                delete_list = []
 
             st_dev = self._calculate_st_dev(values)
             if len(values) > 0:
                 min_avg = min(values) * 1000
                 max_avg = max(values) * 1000
+                max_p95 = max(info.get('p95_duration', 0) for info in
+                              self.api_clients_info.values()) * 1000
             else:
                 max_avg = 0
                 min_avg = 0
+                max_p95 = 0
             dev = round(st_dev + avg_duration, 3)
 
             logger.info(
                 'Perfomance watcher:\nREQUESTS_STDEV - {} sec.\n'
                 'REQUESTS_DEV - {} ms.\nREQUESTS_MIN_AVG - {} ms.\n'
-                'REQUESTS_MAX_AVG - {} ms.\nREQUESTS_AVG - {} sec.'.format(
-                    round(st_dev, 3), dev, min_avg, max_avg, avg_duration),
+                'REQUESTS_MAX_AVG - {} ms.\nREQUESTS_MAX_P95 - {} ms.\n'
+                'REQUESTS_AVG - {} sec.'.format(
+                    round(st_dev, 3), dev, min_avg, max_avg, max_p95,
+                    avg_duration),
                 extra={'REQUESTS_DEV': dev * 1000,
                        'REQUESTS_MIN_AVG': min_avg,
                        'REQUESTS_MAX_AVG': max_avg,
+                       'REQUESTS_MAX_P95': max_p95,
                        'REQUESTS_AVG': avg_duration * 1000})
             self._mark_bad_clients(dev)
 
@@ -457,8 +969,21 @@ class BasicDataBridge(object):
         logger.info('Start data sync...',
                     extra={'MESSAGE_ID': 'basic_bridge__data_sync'})
         self.input_queue_filler = spawn(self.fill_input_queue)
-        self.filler = spawn(self.fill_resource_items_queue)
-        spawn(self.queues_controller)
+        self.backward_input_queue_filler = spawn(self.fill_input_queue,
+                                                 backward=True)
+        self.spawn_filter_workers()
+        if self.workers_controller == 'predictive':
+            spawn(self.predictive_controller)
+        else:
+            spawn(self.queues_controller)
+        if self.checkpoint_backend is not None:
+            spawn(self.checkpoint_saver)
+        if self.metrics_port:
+            # Supervisor serves status of all shards on metrics_port, each
+            # shard serves own metrics on next ports
+            offset = self.shard_index + 1 if self.shards_count > 1 else 0
+            start_metrics_server(self.metrics_host,
+                                 self.metrics_port + offset)
         while True:
             self.gevent_watcher()
             sleep(self.watch_interval)
@@ -467,12 +992,27 @@ class BasicDataBridge(object):
 def main():
     parser = argparse.ArgumentParser(description='---- Basic Bridge ----')
     parser.add_argument('config', type=str, help='Path to configuration file')
+    parser.add_argument('--shard-index', type=int, default=None,
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--status-fd', type=int, default=None,
+                        help=argparse.SUPPRESS)
     params = parser.parse_args()
     if os.path.isfile(params.config):
         with open(params.config) as config_file_obj:
             config = load(config_file_obj.read())
         logging.config.dictConfig(config)
-        BasicDataBridge(config).run()
+        shards_count = config['main'].get('shards_count',
+                                          DEFAULTS['shards_count'])
+        if shards_count > 1 and params.shard_index is None:
+            BridgeSupervisor(params.config, config).run()
+            return
+        if params.shard_index is not None:
+            config['main']['shard_index'] = params.shard_index
+        bridge = BasicDataBridge(config)
+        if params.status_fd is not None:
+            spawn(report_status, bridge, params.status_fd,
+                  bridge.watch_interval)
+        bridge.run()
 
 
 ##############################################################
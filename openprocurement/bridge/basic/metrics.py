@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import logging
+from bisect import bisect_left
+from gevent.pywsgi import WSGIServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+
+    metric_type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def remove(self, **labels):
+        self.values.pop(self._key(labels), None)
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield self.name, key, value
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.metric_type)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(labels),
+                                          _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = {
+                'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+        state['buckets'][bisect_left(self.buckets, value)] += 1
+        state['sum'] += value
+        state['count'] += 1
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels))
+
+    def samples(self):
+        for key, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                cumulative += count
+                yield (self.name + '_bucket', key + (('le', _format_value(
+                    bound)),), cumulative)
+            yield self.name + '_sum', key, state['sum']
+            yield self.name + '_count', key, state['count']
+
+
+class Registry(object):
+
+    """Keeps process metrics and renders them in text exposition format"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, cls, name, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args)
+        elif not isinstance(metric, cls):
+            raise ValueError('Metric {} already registered as {}'.format(
+                name, metric.metric_type))
+        return metric
+
+    def counter(self, name, documentation):
+        return self._register(Counter, name, documentation)
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge, name, documentation)
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, buckets)
+
+    def expose(self):
+        return '\n'.join(self.metrics[name].expose()
+                         for name in sorted(self.metrics)) + '\n'
+
+    def wsgi_app(self, environ, start_response):
+        if environ.get('PATH_INFO', '/') not in ('/', '/metrics'):
+            start_response('404 Not Found', [('Content-Type', CONTENT_TYPE)])
+            return ['']
+        body = self.expose()
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+
+REGISTRY = Registry()
+
+FEED_ITEMS = REGISTRY.counter(
+    'bridge_feed_items_total', 'Items received from changes feed.')
+FILTER_LOOKUPS = REGISTRY.counter(
+    'bridge_filter_lookups_total',
+    'Filter index lookups by result (hit or miss).')
+SKIPPED_ITEMS = REGISTRY.counter(
+    'bridge_skipped_items_total', 'Feed items already actual in storage.')
+API_REQUEST_DURATION = REGISTRY.histogram(
+    'bridge_api_request_duration_seconds',
+    'Public API resource item request duration by client.')
+BULK_SIZE = REGISTRY.histogram(
+    'bridge_bulk_size', 'Documents count in saved bulks.',
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000))
+COALESCED_ITEMS = REGISTRY.counter(
+    'bridge_coalesced_items_total',
+    'Items merged into already pending ones, saved API fetches, by stage '
+    '(input or retry).')
+SAVE_RESULTS = REGISTRY.counter(
+    'bridge_save_results_total',
+    'Saved documents by result (created, updated, skipped, failed).')
+RETRIES = REGISTRY.counter(
+    'bridge_retries_total',
+    'Retry queue operations by result (scheduled or dropped).')
+QUEUE_SIZE = REGISTRY.gauge('bridge_queue_size', 'Queue size by queue.')
+STREAM_QUEUE_SIZE = REGISTRY.gauge(
+    'bridge_stream_queue_size',
+    'Queue size by queue and feed stream (forward or backward).')
+RETRY_OLDEST_DUE_AGE = REGISTRY.gauge(
+    'bridge_retry_oldest_due_age_seconds',
+    'Seconds since oldest retry queue item became due.')
+DOCUMENT_LAG = REGISTRY.histogram(
+    'bridge_document_lag_seconds',
+    'Time since document dateModified till it was fetched by feed stream.',
+    buckets=(1, 5, 10, 30, 60, 300, 900, 1800, 3600, 10800, 43200, 86400))
+THREADS = REGISTRY.gauge('bridge_threads', 'Running greenlets by pool.')
+API_CLIENTS = REGISTRY.gauge('bridge_api_clients', 'API clients count.')
+STORAGE_CONNECTIONS = REGISTRY.gauge(
+    'bridge_storage_connections',
+    'Storage HTTP connections by state (in_use, idle or limit).')
+RATE_LIMIT = REGISTRY.gauge(
+    'bridge_rate_limit',
+    'Current API requests per second limit by bucket (global or client).')
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    'bridge_rate_limit_wait_seconds',
+    'Time waited for API request tokens.')
+RATE_LIMIT_DECREASES = REGISTRY.counter(
+    'bridge_rate_limit_decreases_total',
+    'Rate limit decreases by bucket and reason (throttle or latency).')
+SCALING_DESIRED_WORKERS = REGISTRY.gauge(
+    'bridge_scaling_desired_workers',
+    'Workers count estimated by workers controller by pool.')
+SCALING_ARRIVAL_RATE = REGISTRY.gauge(
+    'bridge_scaling_arrival_rate',
+    'Smoothed queue arrival rate, items per second, by pool.')
+SCALING_DECISIONS = REGISTRY.counter(
+    'bridge_scaling_decisions_total',
+    'Workers added or removed by workers controller by pool and action.')
+SHARDS_STATUS = REGISTRY.gauge(
+    'bridge_shards_status',
+    'Status of all shards by key (queue sizes and counters summed, ages '
+    'max), healthy shards and restarts, served by supervisor.')
+
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """
+    Start serving registry metrics over http
+    :return: WSGIServer instance
+    """
+    server = WSGIServer((host, port), registry.wsgi_app, log=None)
+    server.start()
+    logger.info('Metrics served on http://{}:{}/metrics'.format(host, port),
+                extra={'MESSAGE_ID': 'metrics_server_start'})
+    return server
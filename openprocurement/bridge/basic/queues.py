@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import heapq
+import random
+from itertools import count
+from gevent.event import Event
+from gevent.queue import Empty, Queue
+from openprocurement.bridge.basic.utils import monotonic
+
+
+class RetryQueue(object):
+
+    """
+    Delayed retry scheduler. Items are kept in heap ordered by next attempt
+    time and deduplicated by id: only item with newest dateModified stays
+    pending. Compatible with gevent Queue get/put interface used by workers,
+    but empty() reports absence of items which are due now.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.heap = []
+        self.items = {}
+        self.counter = count()
+        self.event = Event()
+
+    def qsize(self):
+        return len(self.items)
+
+    def full(self):
+        return self.maxsize is not None and len(self.items) >= self.maxsize
+
+    def _purge(self):
+        # Drop heap entries which were replaced by newer items
+        while self.heap:
+            due, seq, item_id = self.heap[0]
+            entry = self.items.get(item_id)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self.heap)
+
+    def empty(self):
+        self._purge()
+        return not self.heap or self.heap[0][0] > monotonic()
+
+    def put(self, item, delay=0):
+        """
+        Schedule item for retry after delay seconds
+        :param item: dict with id and dateModified
+        :param delay: seconds before item will be available
+        :return: bool: False if item dropped because queue is full
+        """
+        due = monotonic() + delay
+        current = self.items.get(item['id'])
+        if current is not None:
+            if current[2]['dateModified'] > item['dateModified']:
+                return True
+            due = min(due, current[0])
+        elif self.full():
+            return False
+        seq = next(self.counter)
+        self.items[item['id']] = (due, seq, item)
+        heapq.heappush(self.heap, (due, seq, item['id']))
+        self.event.set()
+        return True
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            self._purge()
+            now = monotonic()
+            if self.heap and self.heap[0][0] <= now:
+                due, seq, item_id = heapq.heappop(self.heap)
+                return self.items.pop(item_id)[2]
+            if not block:
+                raise Empty
+            wait = self.heap[0][0] - now if self.heap else None
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise Empty
+                wait = remaining if wait is None else min(wait, remaining)
+            self.event.clear()
+            self.event.wait(wait)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def due_count(self):
+        """
+        Count items which are due now. Heap is walked only through due
+        entries: children of not due entry aren't due either.
+        :return: int
+        """
+        now = monotonic()
+        ready = 0
+        stack = [0] if self.heap else []
+        while stack:
+            index = stack.pop()
+            due, seq, item_id = self.heap[index]
+            if due > now:
+                continue
+            entry = self.items.get(item_id)
+            if entry is not None and entry[1] == seq:
+                ready += 1
+            stack.extend(child for child in (2 * index + 1, 2 * index + 2)
+                         if child < len(self.heap))
+        return ready
+
+    def oldest_due_age(self):
+        """
+        :return: float: seconds since oldest due item became available
+        """
+        self._purge()
+        if not self.heap:
+            return 0
+        return max(monotonic() - self.heap[0][0], 0)
+
+
+class ClientScheduler(object):
+
+    """
+    Latency aware pool of idle api clients, used as api_clients_queue.
+    get() hands out better of two random ready clients (power of two
+    choices) by moving average of request duration penalized by moving
+    average of errors rate. Clients put back with delay are not handed out
+    until their backoff expires.
+    """
+
+    def __init__(self, alpha=0.3, error_penalty=10):
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.ready = []
+        self.delayed = []
+        self.stats = {}
+        self.counter = count()
+        self.event = Event()
+
+    def qsize(self):
+        return len(self.ready) + len(self.delayed)
+
+    def _promote(self):
+        now = monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self.ready.append(heapq.heappop(self.delayed)[2])
+
+    def empty(self):
+        self._promote()
+        return not self.ready
+
+    def put(self, item, delay=0):
+        """
+        Return client to pool
+        :param item: api client dict
+        :param delay: seconds of client backoff
+        """
+        if delay > 0:
+            heapq.heappush(self.delayed,
+                           (monotonic() + delay, next(self.counter), item))
+        else:
+            self.ready.append(item)
+        self.event.set()
+
+    def score(self, client_id):
+        """
+        :return: float: lower is better, not observed clients have 0
+        """
+        latency, errors = self.stats.get(client_id, (0, 0))
+        return latency * (1 + self.error_penalty * errors)
+
+    def _choose(self, slowest=False):
+        if len(self.ready) == 1:
+            index = 0
+        elif slowest:
+            index = max(xrange(len(self.ready)),
+                        key=lambda i: self.score(self.ready[i]['id']))
+        else:
+            first, second = random.sample(xrange(len(self.ready)), 2)
+            index = first if self.score(self.ready[first]['id']) <= \
+                self.score(self.ready[second]['id']) else second
+        item = self.ready[index]
+        self.ready[index] = self.ready[-1]
+        self.ready.pop()
+        return item
+
+    def get(self, block=True, timeout=None, slowest=False):
+        """
+        :param slowest: take worst client instead, e.g. to destroy it
+        :return: api client dict
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            self._promote()
+            if self.ready:
+                return self._choose(slowest)
+            if not block:
+                raise Empty
+            now = monotonic()
+            wait = self.delayed[0][0] - now if self.delayed else None
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise Empty
+                wait = remaining if wait is None else min(wait, remaining)
+            self.event.clear()
+            self.event.wait(wait)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def observe(self, client_id, duration, failed=False):
+        """Update client moving averages with request result"""
+        stats = self.stats.get(client_id)
+        if stats is None:
+            self.stats[client_id] = [duration, float(failed)]
+            return
+        stats[0] += self.alpha * (duration - stats[0])
+        stats[1] += self.alpha * (float(failed) - stats[1])
+
+    def forget(self, client_id):
+        self.stats.pop(client_id, None)
+
+
+class StreamQueues(object):
+
+    """
+    Separate queues for feed streams (forward - live changes, backward -
+    feed history) behind gevent Queue interface. put() routes item to queue
+    of its 'stream', get() chooses among non-empty streams by smooth
+    weighted round robin, stream with zero weight is served only when others
+    are empty. Stream is skipped while its queue in downstream StreamQueues
+    is full, so backfill backpressure doesn't hold live changes.
+    """
+
+    # Downstream queues don't notify about free slots
+    downstream_poll = 1
+
+    def __init__(self, streams, maxsize=None, downstream=None):
+        """
+        :param streams: sequence of (name, weight), first stream is default
+        :param maxsize: max items count of each stream queue
+        """
+        self.names = [name for name, weight in streams]
+        self.weights = dict(streams)
+        self.current = dict.fromkeys(self.names, 0)
+        self.queues = dict((name, Queue(maxsize)) for name in self.names)
+        self.default = self.names[0]
+        self.downstream = downstream
+        self.event = Event()
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    def empty(self):
+        return not any(queue.qsize() for queue in self.queues.values())
+
+    def put(self, item, block=True, timeout=None):
+        queue = self.queues.get(item.get('stream'), self.queues[self.default])
+        queue.put(item, block, timeout)
+        self.event.set()
+
+    def _choose(self):
+        best = None
+        total = 0
+        for name in self.names:
+            if not self.queues[name].qsize():
+                continue
+            if (self.downstream is not None and
+                    self.downstream.queues[name].full()):
+                continue
+            self.current[name] += self.weights[name]
+            total += self.weights[name]
+            if best is None or self.current[name] > self.current[best]:
+                best = name
+        if best is not None:
+            self.current[best] -= total
+        return best
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            name = self._choose()
+            if name is not None:
+                return self.queues[name].get_nowait()
+            if not block:
+                raise Empty
+            wait = None
+            if deadline is not None:
+                wait = deadline - monotonic()
+                if wait <= 0:
+                    raise Empty
+            if self.downstream is not None:
+                wait = min(wait or self.downstream_poll, self.downstream_poll)
+            self.event.clear()
+            self.event.wait(wait)
+
+    def get_nowait(self):
+        return self.get(block=False)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import logging
+from gevent import sleep
+from openprocurement.bridge.basic.metrics import (
+    RATE_LIMIT,
+    RATE_LIMIT_DECREASES,
+    RATE_LIMIT_WAIT
+)
+from openprocurement.bridge.basic.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_BUCKET = 'global'
+
+
+class TokenBucket(object):
+
+    """
+    Token bucket with adjustable rate. Tokens are reserved in advance, so
+    concurrent greenlets wait in order of reservation instead of polling.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.capacity = float(burst or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.decreased = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        Take one token, going into debt if bucket is empty
+        :return: float: seconds to wait before token may be used
+        """
+        self._refill(monotonic())
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def increase(self, step):
+        """
+        Additive increase: step is spread over rate requests, so rate grows
+        by step per second of successful requests
+        """
+        self.rate = min(self.rate + step / self.rate, self.max_rate)
+
+    def decrease(self, factor, cooldown=1.0):
+        """
+        Multiplicative decrease, applied at most once per cooldown seconds
+        so one burst of failures halves rate only once
+        :return: bool: True if rate was decreased
+        """
+        now = monotonic()
+        if now - self.decreased < cooldown:
+            return False
+        self._refill(now)
+        self.decreased = now
+        self.rate = max(self.rate * factor, self.min_rate)
+        return True
+
+
+class RateLimiter(object):
+
+    """
+    Global and per api client token buckets with AIMD rate adaptation from
+    observed 429 responses and request latency
+    """
+
+    def __init__(self, rate=0, client_rate=0, min_rate=0.5,
+                 increase_step=1.0, decrease_factor=0.5,
+                 latency_threshold=0):
+        """
+        :param rate: global requests per second, 0 - unlimited
+        :param client_rate: requests per second per api client,
+            0 - unlimited
+        :param latency_threshold: seconds, slower successful responses
+            decrease rate as 429 does, 0 - ignore latency
+        """
+        self.client_rate = client_rate
+        self.min_rate = min_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_threshold = latency_threshold
+        self.global_bucket = TokenBucket(rate, min_rate=min_rate) \
+            if rate > 0 else None
+        self.buckets = {}
+        if self.global_bucket is not None:
+            RATE_LIMIT.set(self.global_bucket.rate, bucket=GLOBAL_BUCKET)
+
+    def _buckets(self, client_id):
+        buckets = []
+        if self.global_bucket is not None:
+            buckets.append((GLOBAL_BUCKET, self.global_bucket))
+        if self.client_rate > 0:
+            bucket = self.buckets.get(client_id)
+            if bucket is None:
+                bucket = self.buckets[client_id] = TokenBucket(
+                    self.client_rate, min_rate=self.min_rate)
+                RATE_LIMIT.set(bucket.rate, bucket=client_id)
+            buckets.append((client_id, bucket))
+        return buckets
+
+    def acquire(self, client_id):
+        """
+        Wait for global and client tokens
+        :return: float: waited seconds
+        """
+        wait = max([bucket.reserve()
+                    for _, bucket in self._buckets(client_id)] or [0])
+        RATE_LIMIT_WAIT.observe(wait)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def on_success(self, client_id, duration=0):
+        if self.latency_threshold and duration > self.latency_threshold:
+            self._decrease(client_id, 'latency')
+            return
+        for name, bucket in self._buckets(client_id):
+            if bucket.rate < bucket.max_rate:
+                bucket.increase(self.increase_step)
+                RATE_LIMIT.set(bucket.rate, bucket=name)
+
+    def on_throttle(self, client_id):
+        self._decrease(client_id, 'throttle')
+
+    def _decrease(self, client_id, reason):
+        for name, bucket in self._buckets(client_id):
+            if bucket.decrease(self.decrease_factor):
+                RATE_LIMIT.set(bucket.rate, bucket=name)
+                RATE_LIMIT_DECREASES.inc(
+                    bucket='client' if name != GLOBAL_BUCKET else name,
+                    reason=reason)
+                logger.info('Rate limiter: decreased {} rate to {} req/sec '
+                            'on {}'.format(name, round(bucket.rate, 3),
+                                           reason),
+                            extra={'MESSAGE_ID': 'rate_limit_decrease'})
+
+    def remove_client(self, client_id):
+        self.buckets.pop(client_id, None)
+        RATE_LIMIT.remove(bucket=client_id)
+
+    def get_rates(self):
+        """
+        :return: dict: key: bucket name, value: current rate
+        """
+        rates = dict((client_id, bucket.rate)
+                     for client_id, bucket in self.buckets.items())
+        if self.global_bucket is not None:
+            rates[GLOBAL_BUCKET] = self.global_bucket.rate
+        return rates
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+from functools import partial
+from openprocurement.bridge.basic.utils import DataBridgeConfigError
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'json'
+# Order of preference for 'auto' backend
+AUTO_BACKENDS = ('ujson', 'simplejson', 'json')
+# openprocurement_client modules which decode API responses with module
+# level loads
+CLIENT_MODULES = ('openprocurement_client.clients',
+                  'openprocurement_client.api_base_client')
+
+
+class Serializer(object):
+
+    """JSON encoder and decoder pair of one backend"""
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return '<Serializer {}>'.format(self.name)
+
+
+def _json():
+    return Serializer('json', json.dumps, json.loads)
+
+
+def _simplejson():
+    if simplejson is None:
+        return None
+    return Serializer('simplejson', simplejson.dumps, simplejson.loads)
+
+
+def _ujson():
+    if ujson is None:
+        return None
+    return Serializer('ujson', partial(ujson.dumps,
+                                       escape_forward_slashes=False),
+                      ujson.loads)
+
+
+BACKENDS = {
+    'json': _json,
+    'simplejson': _simplejson,
+    'ujson': _ujson
+}
+
+
+def get_serializer(name=DEFAULT_BACKEND):
+    """
+    Get serializer by backend name. 'auto' selects fastest installed
+    backend and falls back to stdlib json.
+    :param name: 'json', 'simplejson', 'ujson' or 'auto'
+    :return: Serializer instance
+    """
+    if name == 'auto':
+        for backend in AUTO_BACKENDS:
+            serializer = BACKENDS[backend]()
+            if serializer is not None:
+                return serializer
+    if name not in BACKENDS:
+        raise DataBridgeConfigError('Invalid \'json_backend\'. Value must be '
+                                    'one of {}.'.format(
+                                        ', '.join(sorted(BACKENDS) +
+                                                  ['auto'])))
+    serializer = BACKENDS[name]()
+    if serializer is None:
+        raise DataBridgeConfigError('JSON backend \'{}\' is not '
+                                    'installed.'.format(name))
+    return serializer
+
+
+def install_client_serializer(serializer):
+    """
+    Make openprocurement_client decode API responses with serializer
+    :return: list of patched module names
+    """
+    patched = []
+    for module_name in CLIENT_MODULES:
+        try:
+            module = __import__(module_name, fromlist=['loads'])
+        except ImportError:
+            continue
+        if hasattr(module, 'loads'):
+            module.loads = serializer.loads
+            patched.append(module_name)
+    logger.info('API responses decoded with {} backend'.format(
+        serializer.name), extra={'MESSAGE_ID': 'json_backend'})
+    return patched
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import math
+from array import array
+from openprocurement.bridge.basic.utils import monotonic
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class LatencyWindow(object):
+
+    """
+    Fixed size ring buffer of request durations observed during last window
+    seconds. Insert is O(1), expired samples are dropped from the oldest end
+    and running sums give mean and stdev without scanning samples.
+    When more than size requests are made during window only last size
+    samples are kept.
+    """
+
+    def __init__(self, window, size=1000):
+        self.window = window
+        self.size = size
+        self.times = array('d', [0]) * size
+        self.values = array('d', [0]) * size
+        self.clear()
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.first = None
+
+    def _pop(self):
+        value = self.values[self.start]
+        self.start = (self.start + 1) % self.size
+        self.count -= 1
+        if self.count:
+            self.total -= value
+            self.total_sq -= value * value
+        else:
+            # Reset accumulated float error
+            self.total = self.total_sq = 0.0
+
+    def _expire(self, now):
+        deadline = now - self.window
+        while self.count and self.times[self.start] < deadline:
+            self._pop()
+
+    def add(self, value, now=None):
+        if now is None:
+            now = monotonic()
+        if self.count == self.size:
+            self._pop()
+        index = (self.start + self.count) % self.size
+        self.times[index] = now
+        self.values[index] = value
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if self.first is None:
+            self.first = now
+
+    def __len__(self):
+        self._expire(monotonic())
+        return self.count
+
+    def samples(self):
+        self._expire(monotonic())
+        return [self.values[(self.start + i) % self.size]
+                for i in xrange(self.count)]
+
+    def age(self):
+        """
+        :return: float: seconds since first sample after creation or clear
+        """
+        if self.first is None:
+            return 0
+        return monotonic() - self.first
+
+    def mean(self):
+        if not len(self):
+            return 0
+        return self.total / self.count
+
+    def stdev(self):
+        if not len(self):
+            return 0
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0))
+
+    def percentile(self, percent):
+        return percentile(self.samples(), percent)
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
 from couchdb import Server, Session
+from couchdb import json as couch_json
 from couchdb.design import ViewDefinition
+from couchdb.http import ConnectionPool
+from gevent import getcurrent
+from gevent.lock import BoundedSemaphore
+from hashlib import sha1
 from time import sleep
 from httplib import IncompleteRead
+from openprocurement.bridge.basic.metrics import STORAGE_CONNECTIONS
+from openprocurement.bridge.basic.serializers import (
+    DEFAULT_BACKEND,
+    get_serializer
+)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -13,6 +24,105 @@ VALIDATE_BULK_DOCS_UPDATE = """function(newDoc, oldDoc, userCtx) {
         throw({forbidden: 'New doc with oldest dateModified.' });
     };
 }"""
+DIGEST_FIELD = 'doc_digest'
+DIGEST_IGNORED_FIELDS = ('dateModified', DIGEST_FIELD)
+# Database keeping confirmed dateModified of unchanged docs, it isn't
+# replicated with resource docs
+CONFIRMATIONS_DB = '{}_confirmations'
+
+
+def doc_digest(doc):
+    """
+    Content digest of document without service fields and dateModified.
+    Always computed with stdlib json to keep digests stable across
+    json_backend changes.
+    :param doc: dict
+    :return: str: hex digest
+    """
+    content = dict((k, v) for k, v in doc.items()
+                   if not k.startswith('_') and k not in DIGEST_IGNORED_FIELDS)
+    return sha1(json.dumps(content, sort_keys=True,
+                           separators=(',', ':'))).hexdigest()
+
+
+class BoundedConnectionPool(ConnectionPool):
+
+    """
+    HTTP connection pool which limits count of connections in use, waiting
+    for free one when limit reached, and optionally closes connections
+    instead of keeping them alive
+    """
+
+    def __init__(self, timeout, size=10, keep_alive=True):
+        ConnectionPool.__init__(self, timeout)
+        self.size = size
+        self.keep_alive = keep_alive
+        self.semaphore = BoundedSemaphore(size)
+        self.in_use = {}  # connection: greenlet which holds it
+        STORAGE_CONNECTIONS.set(size, state='limit')
+
+    def _update_metrics(self):
+        STORAGE_CONNECTIONS.set(len(self.in_use), state='in_use')
+        STORAGE_CONNECTIONS.set(sum(len(c) for c in self.conns.values()),
+                                state='idle')
+
+    def utilization(self):
+        return float(len(self.in_use)) / self.size
+
+    def get(self, url):
+        self.semaphore.acquire()
+        try:
+            conn = ConnectionPool.get(self, url)
+        except Exception:
+            self.semaphore.release()
+            raise
+        self.in_use[conn] = getcurrent()
+        self._update_metrics()
+        return conn
+
+    def release(self, url, conn):
+        if self.in_use.pop(conn, None) is None:
+            return
+        if self.keep_alive:
+            ConnectionPool.release(self, url, conn)
+        else:
+            conn.close()
+        self.semaphore.release()
+        self._update_metrics()
+
+    def discard(self, conn):
+        if self.in_use.pop(conn, None) is None:
+            return
+        conn.close()
+        self.semaphore.release()
+        self._update_metrics()
+
+    def held_by(self, greenlet):
+        return [conn for conn, holder in self.in_use.items()
+                if holder is greenlet]
+
+
+class PooledSession(Session):
+
+    """Session over BoundedConnectionPool shared by all greenlets"""
+
+    def __init__(self, pool_size=10, keep_alive=True, timeout=None,
+                 **kwargs):
+        super(PooledSession, self).__init__(timeout=timeout, **kwargs)
+        self.connection_pool = BoundedConnectionPool(timeout, pool_size,
+                                                     keep_alive)
+
+    def request(self, *args, **kwargs):
+        current = getcurrent()
+        held = self.connection_pool.held_by(current)
+        try:
+            return super(PooledSession, self).request(*args, **kwargs)
+        except Exception:
+            # Session doesn't release connection after socket errors
+            for conn in self.connection_pool.held_by(current):
+                if conn not in held:
+                    self.connection_pool.discard(conn)
+            raise
 
 
 class CouchDBStorage(object):
@@ -29,18 +139,41 @@ class CouchDBStorage(object):
                 **self.config['storage'])
         self.db_name = self.config['storage'].get('db_name', 'bridge_db')
         self.resource = resource
+        self.skip_unchanged = self.config['storage'].get('skip_unchanged',
+                                                         False)
+        json_backend = self.config.get('json_backend')
+        self.serializer = get_serializer(json_backend or DEFAULT_BACKEND)
+        if json_backend is not None:
+            # couchdb-python encodes request and decodes response bodies
+            # with process wide json backend
+            couch_json.use(decode=self.serializer.loads,
+                           encode=self.serializer.dumps)
         self._prepare_couchdb()
         self.view_path = '_design/{}/_view/by_dateModified'.format(
             self.resource)
+        self.id_view_path = '_design/{}/_view/by_id'.format(self.resource)
+        self.digest_view_path = '_design/{}/_view/by_digest'.format(
+            self.resource)
 
     def _prepare_couchdb(self):
-        server = Server(self.couch_url,
-                        session=Session(retry_delays=range(10)))
+        self.session = PooledSession(
+            pool_size=self.config['storage'].get('pool_size', 10),
+            keep_alive=self.config['storage'].get('keep_alive', True),
+            timeout=self.config['storage'].get('timeout'),
+            retry_delays=range(10))
+        server = Server(self.couch_url, session=self.session)
         try:
             if self.db_name not in server:
                 self.db = server.create(self.db_name)
             else:
                 self.db = server[self.db_name]
+            if self.skip_unchanged:
+                confirmations_db_name = CONFIRMATIONS_DB.format(self.db_name)
+                if confirmations_db_name not in server:
+                    self.confirmations_db = server.create(
+                        confirmations_db_name)
+                else:
+                    self.confirmations_db = server[confirmations_db_name]
         except Exception as e:
             LOGGER.error('Database error: {}'.format(repr(e)))
             raise
@@ -59,6 +192,22 @@ class CouchDBStorage(object):
                     doc_type=self.resource[:-1])
         )
         by_date_modified_view.sync(self.db)
+        # Compact id index for filter_bulk, emits only dateModified
+        by_id_view = ViewDefinition(
+            self.resource, 'by_id', '''function(doc) {
+        if (doc.doc_type == '%(resource)s') {
+            emit(doc._id, doc.dateModified);
+        }}''' % dict(resource=self.resource[:-1].title())
+        )
+        by_id_view.sync(self.db)
+        if self.skip_unchanged:
+            by_digest_view = ViewDefinition(
+                self.resource, 'by_digest', '''function(doc) {
+        if (doc.doc_type == '%(resource)s') {
+            emit(doc._id, [doc._rev, doc.%(field)s]);
+        }}''' % dict(resource=self.resource[:-1].title(), field=DIGEST_FIELD)
+            )
+            by_digest_view.sync(self.db)
 
         validate_doc = self.db.get(VALIDATE_BULK_DOCS_ID,
                                    {'_id': VALIDATE_BULK_DOCS_ID})
@@ -83,14 +232,16 @@ class CouchDBStorage(object):
         """
         Receiving list of docs ids and checking existing in storage, return
         dict where key is doc_id and value - dateModified if doc exist
-        :param keys: List of docs ids
+        :param bulk: Dict where key: doc_id, value: dateModified
         :return: dict: key: doc_id, value: dateModified
         """
         sleep_before_retry = 2
         for i in xrange(0, 3):
             try:
-                rows = self.db.view(self.view_path, keys=bulk.values())
-                resp_dict = {k.id: k.key for k in rows}
+                rows = self.db.view(self.id_view_path, keys=bulk.keys())
+                resp_dict = {k.id: k.value for k in rows}
+                if self.skip_unchanged:
+                    self._add_confirmed(bulk, resp_dict)
                 return resp_dict
             except (IncompleteRead, Exception) as e:
                 LOGGER.error('Error while send bulk {}'.format(e.message),
@@ -100,15 +251,123 @@ class CouchDBStorage(object):
                 sleep(sleep_before_retry)
                 sleep_before_retry *= 2
 
+    def _get_revisions(self, doc_ids):
+        """
+        Fetch current revisions of stored docs with one request
+        :param doc_ids: List of docs ids
+        :return: dict: key: doc_id, value: _rev
+        """
+        if not doc_ids:
+            return {}
+        rows = self.db.view('_all_docs', keys=doc_ids)
+        return {row.id: row.value['rev'] for row in rows
+                if row.value and not row.value.get('deleted')}
+
+    def _get_digests(self, doc_ids):
+        """
+        Fetch current revisions and content digests of stored docs with one
+        request
+        :param doc_ids: List of docs ids
+        :return: dict: key: doc_id, value: tuple (_rev, digest)
+        """
+        if not doc_ids:
+            return {}
+        rows = self.db.view(self.digest_view_path, keys=doc_ids)
+        return {row.id: tuple(row.value) for row in rows}
+
+    def _add_confirmed(self, bulk, resp_dict):
+        """
+        Replace dateModified of stored docs older than bulk ones with
+        dateModified up to which their content is confirmed unchanged
+        :param resp_dict: filter_bulk result, updated in place
+        """
+        stale = [doc_id for doc_id, date_modified in bulk.items()
+                 if resp_dict.get(doc_id) and
+                 resp_dict[doc_id] < date_modified]
+        if not stale:
+            return
+        rows = self.confirmations_db.view('_all_docs', keys=stale,
+                                          include_docs=True)
+        for row in rows:
+            if row.doc and row.doc['dateModified'] > resp_dict[row.key]:
+                resp_dict[row.key] = row.doc['dateModified']
+
+    def _save_confirmations(self, docs):
+        """
+        Save dateModified of unchanged docs to confirmations database, so
+        they aren't reported stale by filter_bulk and fetched again after
+        restart. Failure only costs such fetch and isn't raised.
+        :param docs: unchanged docs
+        """
+        try:
+            rows = self.confirmations_db.view(
+                '_all_docs', keys=[doc['_id'] for doc in docs],
+                include_docs=True)
+            stored = dict((row.key, row.doc) for row in rows if row.doc)
+            confirmations = []
+            for doc in docs:
+                confirmation = stored.get(doc['_id'], {'_id': doc['_id']})
+                if confirmation.get('dateModified') >= doc['dateModified']:
+                    continue
+                confirmation['dateModified'] = doc['dateModified']
+                confirmations.append(confirmation)
+            if confirmations:
+                self.confirmations_db.update(confirmations)
+        except Exception as e:
+            LOGGER.error('Error while saving confirmations {}'.format(
+                repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+
+    def _skip_unchanged_docs(self, docs):
+        """
+        Set content digest to docs and split out ones which content is same
+        as stored apart from dateModified
+        :return: tuple: (list of docs to save, list of unchanged docs)
+        """
+        for doc in docs:
+            doc[DIGEST_FIELD] = doc_digest(doc)
+        stored = self._get_digests([doc['_id'] for doc in docs])
+        to_save = []
+        unchanged = []
+        for doc in docs:
+            if doc['_id'] not in stored:
+                to_save.append(doc)
+                continue
+            rev, digest = stored[doc['_id']]
+            if digest == doc[DIGEST_FIELD]:
+                unchanged.append(doc)
+                continue
+            doc['_rev'] = rev
+            to_save.append(doc)
+        return to_save, unchanged
+
     def save_bulk(self, bulk):
         """
-        Save to storage bulk data
+        Save to storage bulk data. Revisions of stored docs are fetched for
+        whole bulk, older docs are rejected by validate_doc_update. With
+        skip_unchanged docs which content digest is same as stored are not
+        written and reported as unchanged, only their new dateModified is
+        saved to confirmations database.
         :param bulk: Dict where key: doc_id, value: document
         :return: list: List of tuples with id, success: boolean, reason:
         if success is str: state else exception object
         """
-        res = self.db.update(bulk.values())
+        docs = bulk.values()
         results = []
+        if self.skip_unchanged:
+            docs, unchanged = self._skip_unchanged_docs(docs)
+            if unchanged:
+                self._save_confirmations(unchanged)
+                results.extend((True, doc['_id'], 'unchanged')
+                               for doc in unchanged)
+            if not docs:
+                return results
+        else:
+            revisions = self._get_revisions(
+                [doc['_id'] for doc in docs if '_rev' not in doc])
+            for doc in docs:
+                if doc['_id'] in revisions:
+                    doc['_rev'] = revisions[doc['_id']]
+        res = self.db.update(docs)
         for success, doc_id, reason in res:
             if success:
                 if not reason.startswith('1-'):
@@ -122,6 +381,26 @@ class CouchDBStorage(object):
             results.append((success, doc_id, reason))
         return results
 
+    def get_checkpoint(self, name):
+        """
+        Return saved feed checkpoint, stored as local (not replicated) doc
+        :param name: checkpoint name
+        :return: dict: or None
+        """
+        doc = self.db.get('_local/{}'.format(name))
+        return doc.get('state') if doc else None
+
+    def save_checkpoint(self, name, state):
+        """
+        Save feed checkpoint
+        :param name: checkpoint name
+        :param state: dict with feed position
+        """
+        doc_id = '_local/{}'.format(name)
+        doc = self.db.get(doc_id, {'_id': doc_id})
+        doc['state'] = state
+        self.db.save(doc)
+
 
 def includme(config):
     resource = config.get('resource', 'tenders')
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
 import logging
+from copy import deepcopy
+from datetime import datetime
 from elasticsearch import Elasticsearch
 from functools import partial
+from gevent.pool import Pool
+from iso8601 import UTC, parse_date
+from openprocurement.bridge.basic.serializers import (
+    DEFAULT_BACKEND,
+    get_serializer
+)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -9,17 +17,46 @@ STORAGE_DEFAULTS = {
     'host': '127.0.0.1',
     'port': '9200',
     'db_name': 'bridge_db',
-    'alias': 'bridge'
+    'alias': 'bridge',
+    'bulk_chunk_size': 500,
+    'bulk_max_bytes': 10 * 1024 * 1024,
+    'bulk_concurrency': 2,
+    'external_version': False,
+    # Index settings while bridge crawls feed history, values found before
+    # backfill are restored in live mode
+    'backfill_settings': {
+        'index.refresh_interval': '-1',
+        'index.number_of_replicas': 0
+    },
+    'mapping': None  # explicit properties of resource doc type
 }
+CHECKPOINT_DOC_TYPE = 'Checkpoint'
+# Checkpoints are kept out of resource index and alias read by consumers
+CHECKPOINT_INDEX = '{}_checkpoints'
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def date_modified_to_version(date_modified):
+    """
+    Convert dateModified to monotonic external version
+    :param date_modified: iso formatted date
+    :return: int: microseconds since epoch
+    """
+    delta = parse_date(date_modified) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + \
+        delta.microseconds
 
 
 class ElasticsearchStorage(object):
 
     def __init__(self, conf, resource):
-        STORAGE_DEFAULTS.update(conf.get('storage', {}))
-        for name, value in STORAGE_DEFAULTS.items():
+        settings = deepcopy(STORAGE_DEFAULTS)
+        settings.update(conf.get('storage', {}))
+        for name, value in settings.items():
             setattr(self, name, value)
         self.doc_type = resource
+        self.serializer = get_serializer(
+            conf.get('json_backend') or DEFAULT_BACKEND)
         self.db = Elasticsearch('{}:{}'.format(self.host, self.port))
         self.db.indices.create(index=self.db_name, ignore=400)
         self.db.indices.put_alias(index=self.db_name, name=self.alias)
@@ -32,6 +69,15 @@ class ElasticsearchStorage(object):
             self.db.indices.put_settings(
                 body={'index.mapping.total_fields.limit': 4000},
                 index=self.db_name)
+        if self.mapping:
+            self.db.indices.put_mapping(
+                index=self.db_name, doc_type=self.doc_type.title(),
+                body={'properties': self.mapping})
+        # Unknown until bridge applies backfill or live settings
+        self.backfill = None
+        self.live_settings = None
+        self.checkpoint_index = CHECKPOINT_INDEX.format(self.db_name)
+        self.checkpoint_index_ready = False
         self.db.index_get = partial(self.db.get, index=self.alias)
         self.db.index_bulk = partial(self.db.bulk, index=self.alias)
 
@@ -53,30 +99,81 @@ class ElasticsearchStorage(object):
         return resp_dict
 
 
-    def save_bulk(self, bulk):
+    def _get_versions(self, doc_ids):
         """
-        Save to storage bulk data
-        :param bulk: Dict where key: doc_id, value: document
-        :return: list: List of tuples with id, success: boolean, message: str
+        Fetch versions and dateModified of stored docs with one request
+        :param doc_ids: List of docs ids
+        :return: dict: key: doc_id, value: tuple (_version, dateModified)
+        """
+        if not doc_ids:
+            return {}
+        rows = self.db.mget(
+            index=self.alias, doc_type=self.doc_type.title(),
+            body={"ids": doc_ids}, _source_include="dateModified"
+        )
+        return {k['_id']: (k['_version'],
+                           k.get('_source', {}).get('dateModified'))
+                for k in rows['docs'] if k.get('found')}
+
+    def _bulk_actions(self, bulk, stored, results):
+        """
+        Lazily serialize bulk docs into bulk API action lines. Docs which are
+        not newer than stored are added to results as skipped.
+        :return: generator of tuples (doc_id, serialized action and doc)
         """
-        body = []
         for k, v in bulk.items():
-            doc = v.copy()
-            del doc['_id']
-            if '_ver' in doc:
-                body.append({
-                    "index": {"_id": k, "_type": self.doc_type.title(),
-                              "_index": self.alias, '_version': doc['_ver']}
-                })
-                del doc['_ver']
-            else:
-                body.append({
-                    "index": {"_id": k, "_type": self.doc_type.title(),
-                              "_index": self.alias}
-                })
-            body.append(doc)
-        res = self.db.index_bulk(body=body,
-                                 doc_type=self.doc_type.title())
+            version = v.get('_ver')
+            if k in stored:
+                version, date_modified = stored[k]
+                if date_modified >= v.get('dateModified'):
+                    results.append((True, k, 'skipped'))
+                    continue
+            action = {"_id": k, "_type": self.doc_type.title(),
+                      "_index": self.alias}
+            if self.external_version and v.get('dateModified'):
+                action['_version'] = date_modified_to_version(
+                    v['dateModified'])
+                action['_version_type'] = 'external'
+            elif version is not None:
+                action['_version'] = version
+            source = self.serializer.dumps(
+                {f: value for f, value in v.items()
+                 if f not in ('_id', '_ver')})
+            yield k, '{}\n{}\n'.format(self.serializer.dumps({"index": action}),
+                                         source)
+
+    def _bulk_chunks(self, actions):
+        """
+        Group serialized actions into chunks limited by docs count and size
+        :return: generator of lists of tuples (doc_id, serialized data)
+        """
+        chunk = []
+        chunk_bytes = 0
+        for doc_id, data in actions:
+            if chunk and (len(chunk) >= self.bulk_chunk_size or
+                          chunk_bytes + len(data) > self.bulk_max_bytes):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append((doc_id, data))
+            chunk_bytes += len(data)
+        if chunk:
+            yield chunk
+
+    def _send_chunk(self, chunk):
+        """
+        Send one chunk with bulk API. Failed request marks as failed only
+        docs of this chunk.
+        :return: list: List of tuples with id, success: boolean, message: str
+        """
+        try:
+            res = self.db.index_bulk(body=''.join(data for _, data in chunk),
+                                     doc_type=self.doc_type.title())
+        except Exception as e:
+            LOGGER.error('Error while sending bulk chunk of {} docs: '
+                         '{}'.format(len(chunk), repr(e)),
+                         extra={'MESSAGE_ID': 'exceptions'})
+            return [(False, doc_id, e) for doc_id, _ in chunk]
         results = []
         for item in res['items']:
             success = item['index']['status'] in [200, 201]
@@ -84,13 +181,86 @@ class ElasticsearchStorage(object):
             result = item['index']['result'] if 'result' in item[
                 'index'] else \
                 item['index']['error']['reason']
-            if not success and result != u'Mapping reason message':
+            if self.external_version:
+                # Elasticsearch rejects stale docs with version conflict
+                if item['index']['status'] == 409:
+                    result = 'skipped'
+                    success = True
+            elif not success and result != u'Mapping reason message':
                 # TODO: Catch real mapping message and replace ^
                 result = 'skipped'
                 success = True
             results.append((success, doc_id, result))
         return results
 
+    def save_bulk(self, bulk):
+        """
+        Save to storage bulk data. Versions of stored docs are fetched for
+        whole bulk, docs which are not newer than stored are skipped. With
+        external_version docs are indexed with version derived from
+        dateModified and stale ones are rejected by Elasticsearch. Docs
+        are serialized lazily and sent in chunks limited by bulk_chunk_size
+        and bulk_max_bytes, up to bulk_concurrency chunks in parallel.
+        :param bulk: Dict where key: doc_id, value: document
+        :return: list: List of tuples with id, success: boolean, message: str
+        """
+        if self.external_version:
+            stored = {}
+        else:
+            stored = self._get_versions(
+                [k for k, v in bulk.items() if '_ver' not in v])
+        results = []
+        chunks = self._bulk_chunks(self._bulk_actions(bulk, stored, results))
+        pool = Pool(self.bulk_concurrency)
+        for chunk_results in pool.imap_unordered(self._send_chunk, chunks):
+            results.extend(chunk_results)
+        return results
+
+    def _get_live_settings(self):
+        """
+        Read current values of settings changed by backfill. None resets
+        setting to index default: it wasn't set or was left by interrupted
+        backfill.
+        :return: dict: setting name -> value
+        """
+        names = sorted(self.backfill_settings)
+        resp = self.db.indices.get_settings(index=self.db_name,
+                                            name=','.join(names),
+                                            flat_settings=True)
+        current = resp.get(self.db_name, {}).get('settings', {})
+        live_settings = {}
+        for name in names:
+            value = current.get(name)
+            if value is not None and \
+                    str(value) == str(self.backfill_settings[name]):
+                value = None
+            live_settings[name] = value
+        return live_settings
+
+    def start_backfill(self):
+        """Apply index settings tuned for bulk backfill"""
+        self.live_settings = self._get_live_settings()
+        self.db.indices.put_settings(body=self.backfill_settings,
+                                     index=self.db_name)
+        self.backfill = True
+        LOGGER.info('Index {} switched to backfill settings {}'.format(
+            self.db_name, self.backfill_settings),
+            extra={'MESSAGE_ID': 'storage_backfill_start'})
+
+    def stop_backfill(self):
+        """Restore live index settings and make backfilled docs searchable"""
+        if self.backfill is not True:
+            # Index wasn't switched by bridge, its settings are kept
+            self.backfill = False
+            return
+        self.db.indices.put_settings(body=self.live_settings,
+                                     index=self.db_name)
+        self.db.indices.refresh(index=self.db_name)
+        self.backfill = False
+        LOGGER.info('Index {} switched to live settings {}'.format(
+            self.db_name, self.live_settings),
+            extra={'MESSAGE_ID': 'storage_backfill_stop'})
+
     def get_doc(self, doc_id):
         """
         Trying get doc with doc_id from storage and return doc dict if
@@ -110,6 +280,30 @@ class ElasticsearchStorage(object):
             doc = None
         return doc
 
+    def get_checkpoint(self, name):
+        """
+        Return saved feed checkpoint
+        :param name: checkpoint name
+        :return: dict: or None
+        """
+        doc = self.db.get(index=self.checkpoint_index,
+                          doc_type=CHECKPOINT_DOC_TYPE, id=name, ignore=[404])
+        if doc and '_source' in doc:
+            return doc['_source']
+        return None
+
+    def save_checkpoint(self, name, state):
+        """
+        Save feed checkpoint
+        :param name: checkpoint name
+        :param state: dict with feed position
+        """
+        if not self.checkpoint_index_ready:
+            self.db.indices.create(index=self.checkpoint_index, ignore=400)
+            self.checkpoint_index_ready = True
+        self.db.index(index=self.checkpoint_index,
+                      doc_type=CHECKPOINT_DOC_TYPE, id=name, body=state)
+
 
 def includme(config):
     resource = config.get('resource', 'tenders')[:-1]
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import json
+import logging
+import os
+import signal
+import sys
+from gevent import spawn, sleep
+from gevent.os import make_nonblocking, nb_read, nb_write
+from gevent.subprocess import Popen
+from time import time
+from openprocurement.bridge.basic.metrics import (
+    SHARDS_STATUS,
+    start_metrics_server
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_SUM_KEYS = [
+    'input_queue_size',
+    'resource_items_queue_size',
+    'retry_resource_items_queue_size',
+    'main_threads',
+    'retry_threads',
+    'filter_threads',
+    'api_clients_count',
+    'writer_threads',
+    'bulk_queue_size',
+    'received_from_sync',
+    'skipped',
+    'add_to_resource_items_queue',
+    'written_from_feed',
+    'coalesced',
+    'filter_index_hits',
+    'filter_index_misses'
+]
+STATUS_MAX_KEYS = [
+    'retry_oldest_due_age'
+]
+
+
+def report_status(bridge, status_fd, interval):
+    """
+    Periodically write bridge status as json line to supervisor pipe
+    :param bridge: BasicDataBridge instance
+    :param status_fd: writable end of supervisor pipe
+    :param interval: seconds between reports
+    """
+    make_nonblocking(status_fd)
+    while True:
+        line = json.dumps(bridge.get_status()) + '\n'
+        try:
+            nb_write(status_fd, line)
+        except OSError as e:
+            logger.critical('Lost connection with supervisor: {}'.format(
+                repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+            sys.exit(1)
+        sleep(interval)
+
+
+class BridgeShard(object):
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.status_fd = None
+        self.status = {}
+        self.updated = 0
+        self.restarts = 0
+
+
+class BridgeSupervisor(object):
+
+    """Runs BasicDataBridge shards in separate processes"""
+
+    def __init__(self, config_path, config):
+        self.config_path = config_path
+        self.shards_count = config['main']['shards_count']
+        self.watch_interval = config['main'].get('watch_interval', 10)
+        self.metrics_host = config['main'].get('metrics_host', '127.0.0.1')
+        self.metrics_port = config['main'].get('metrics_port')
+        self.shards = [BridgeShard(i) for i in xrange(self.shards_count)]
+        self.exit = False
+
+    def _shard_args(self, shard, status_fd):
+        return [sys.executable, '-m',
+                'openprocurement.bridge.basic.databridge', self.config_path, '--shard-index', str(shard.index),
+                '--status-fd', str(status_fd)]
+
+    def _shard_env(self):
+        """
+        Environment of shard process. Interpreter of buildout script doesn't
+        find eggs by itself, so shard gets sys.path of supervisor.
+        :return: dict
+        """
+        return dict(os.environ, PYTHONPATH=os.pathsep.join(
+            path for path in sys.path if path))
+
+    def start_shard(self, shard):
+        read_fd, write_fd = os.pipe()
+        # Status pipe is passed as shard stdin, so all other descriptors of
+        # supervisor are closed in shard (pass_fds isn't supported by gevent
+        # 1.0 subprocess)
+        shard.process = Popen(self._shard_args(shard, 0), stdin=write_fd,
+                              close_fds=True, env=self._shard_env())
+        os.close(write_fd)
+        shard.status_fd = read_fd
+        shard.status = {}
+        shard.updated = time()
+        spawn(self._read_status, shard, read_fd)
+        logger.info('Supervisor: started shard {} with pid {}'.format(
+            shard.index, shard.process.pid),
+            extra={'MESSAGE_ID': 'supervisor_start_shard'})
+
+    def _read_status(self, shard, read_fd):
+        make_nonblocking(read_fd)
+        buf = ''
+        while True:
+            try:
+                data = nb_read(read_fd, 4096)
+            except OSError:
+                data = ''
+            if not data:
+                break
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                try:
+                    shard.status = json.loads(line)
+                except ValueError:
+                    logger.warning('Supervisor: invalid status from shard '
+                                   '{}'.format(shard.index))
+                    continue
+                shard.updated = time()
+        os.close(read_fd)
+
+    def check_shards(self):
+        for shard in self.shards:
+            returncode = shard.process.poll()
+            if returncode is not None:
+                logger.error(
+                    'Supervisor: shard {} (pid {}) exited with code {}, '
+                    'restarting.'.format(shard.index, shard.process.pid,
+                                         returncode),
+                    extra={'MESSAGE_ID': 'supervisor_restart_shard'})
+                shard.restarts += 1
+                self.start_shard(shard)
+
+    def aggregate_status(self):
+        """
+        Sum shards statuses and count healthy shards. Shard is healthy if
+        it reported status during last three watch intervals.
+        :return: dict
+        """
+        aggregated = dict((key, 0)
+                          for key in STATUS_SUM_KEYS + STATUS_MAX_KEYS)
+        healthy = 0
+        deadline = time() - self.watch_interval * 3
+        for shard in self.shards:
+            if shard.updated >= deadline and shard.status:
+                healthy += 1
+            else:
+                logger.warning('Supervisor: shard {} is unhealthy, last '
+                               'status {} sec. ago'.format(
+                                   shard.index,
+                                   round(time() - shard.updated, 3)),
+                               extra={'MESSAGE_ID': 'supervisor_unhealthy'})
+            for key in STATUS_SUM_KEYS:
+                aggregated[key] += shard.status.get(key, 0)
+            for key in STATUS_MAX_KEYS:
+                aggregated[key] = max(aggregated[key],
+                                      shard.status.get(key, 0))
+        aggregated['healthy_shards'] = healthy
+        aggregated['restarts'] = sum(s.restarts for s in self.shards)
+        return aggregated
+
+    def watcher(self):
+        self.check_shards()
+        aggregated = self.aggregate_status()
+        for key, value in aggregated.items():
+            SHARDS_STATUS.set(value, key=key)
+        logger.info('Supervisor: {} of {} shards healthy'.format(
+            aggregated['healthy_shards'], self.shards_count),
+            extra=dict((k.upper(), v) for k, v in aggregated.items()))
+
+    def shutdown(self, signum=None, frame=None):
+        self.exit = True
+        for shard in self.shards:
+            if shard.process and shard.process.poll() is None:
+                shard.process.terminate()
+        logger.info('Supervisor: shards terminated.')
+
+    def run(self):
+        logger.info('Start Basic Bridge supervisor with {} shards'.format(
+            self.shards_count),
+            extra={'MESSAGE_ID': 'basic_bridge_start_supervisor'})
+        signal.signal(signal.SIGTERM, self.shutdown)
+        if self.metrics_port:
+            start_metrics_server(self.metrics_host, self.metrics_port)
+        for shard in self.shards:
+            self.start_shard(shard)
+        try:
+            while not self.exit:
+                self.watcher()
+                sleep(self.watch_interval)
+        except KeyboardInterrupt:
+            self.shutdown()
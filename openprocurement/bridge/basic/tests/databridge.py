@@ -8,15 +8,19 @@ import os
 import logging
 import uuid
 from copy import deepcopy
-from gevent import sleep
+from gevent import joinall, sleep, spawn
 from gevent.queue import Queue
 from couchdb import Server
 from mock import MagicMock, patch
 from munch import munchify
 from openprocurement_client.exceptions import RequestFailed
 from openprocurement.bridge.basic.databridge import BasicDataBridge
+from openprocurement.bridge.basic.metrics import RETRY_OLDEST_DUE_AGE
+from openprocurement.bridge.basic.queues import ClientScheduler
+from openprocurement.bridge.basic.stats import LatencyWindow
 from openprocurement.bridge.basic.storages.couchdb_plugin import CouchDBStorage
-from openprocurement.bridge.basic.utils import DataBridgeConfigError
+from openprocurement.bridge.basic.utils import DataBridgeConfigError, monotonic
+from openprocurement.bridge.basic.workers import ResourceItemWorker
 
 
 logger = logging.getLogger()
@@ -62,7 +66,9 @@ class TestBasicDataBridge(unittest.TestCase):
             'queue_timeout': 0.01,
             'bulk_save_limit': 3,
             'bulk_save_interval': 1,
+            'fetch_batch_size': 1,
             'filter_workers_count': 1,
+            'filter_bulk_concurrency': 0,
             'watch_interval': 0.1,
             'user_agent': 'basicbridge.multi',
             'resource_items_queue_size': -1,
@@ -86,7 +92,31 @@ class TestBasicDataBridge(unittest.TestCase):
                 'queue_size': 101
             },
             'perfomance_window': 0.1,
-            'resource': 'lots'
+            'perfomance_window_size': 1000,
+            'resource': 'lots',
+            'shards_count': 1,
+            'shard_index': 0,
+            'checkpoint_storage': None,
+            'checkpoint_path': 'feed_checkpoint.json',
+            'checkpoint_interval': 0.1,
+            'filter_index_size': 100,
+            'writers_count': 0,
+            'bulk_queue_size': -1,
+            'metrics_host': '127.0.0.1',
+            'metrics_port': None,
+            'backfill_mode': False,
+            'json_backend': None,
+            'rate_limit': 0,
+            'client_rate_limit': 0,
+            'rate_limit_latency': 0,
+            'client_scheduler': 'fifo',
+            'workers_controller': 'threshold',
+            'workers_controller_interval': 0.1,
+            'workers_drain_time': 1,
+            'forward_stream_weight': 10,
+            'backward_stream_weight': 1,
+            'feed_only': False,
+            'feed_opt_fields': []
         },
         'version': 1
     }
@@ -155,6 +185,135 @@ class TestBasicDataBridge(unittest.TestCase):
             "grater than 30."
         )
 
+        config = deepcopy(self.config)
+        config['main']['shards_count'] = 2
+        config['main']['shard_index'] = 2
+        with self.assertRaises(DataBridgeConfigError) as e:
+            BasicDataBridge(config)
+        self.assertEqual(
+            e.exception.message,
+            "Invalid 'shard_index'. Value must be less than 'shards_count'."
+        )
+
+        config = deepcopy(self.config)
+        config['main']['checkpoint_storage'] = 'redis'
+        with self.assertRaises(DataBridgeConfigError) as e:
+            BasicDataBridge(config)
+        self.assertEqual(
+            e.exception.message,
+            "Invalid 'checkpoint_storage'. Value must be 'storage' or 'file'."
+        )
+
+        config = deepcopy(self.config)
+        config['main']['client_scheduler'] = 'p2c'
+        bridge = BasicDataBridge(config)
+        self.assertIsInstance(bridge.api_clients_queue, ClientScheduler)
+        config['main']['client_scheduler'] = 'random'
+        with self.assertRaises(DataBridgeConfigError) as e:
+            BasicDataBridge(config)
+        self.assertEqual(
+            e.exception.message,
+            "Invalid 'client_scheduler'. Value must be 'fifo' or 'p2c'."
+        )
+
+    @patch('openprocurement.bridge.basic.databridge.'
+           'install_client_serializer')
+    def test_init_json_backend(self, mock_install):
+        bridge = BasicDataBridge(self.config)
+        self.assertIsNone(bridge.serializer)
+        self.assertEqual(mock_install.call_count, 0)
+
+        config = deepcopy(self.config)
+        config['main']['json_backend'] = 'json'
+        bridge = BasicDataBridge(config)
+        self.assertEqual(bridge.serializer.name, 'json')
+        mock_install.assert_called_once_with(bridge.serializer)
+
+    def test_load_checkpoint(self):
+        bridge = BasicDataBridge(self.config)
+        self.assertIs(bridge.load_checkpoint(), None)
+        self.assertEqual(bridge.checkpoint_name, 'feed_lots_0')
+
+        bridge.checkpoint_backend = MagicMock()
+        checkpoint = {'retrieve_mode': '_all_', 'forward_offset': '1'}
+        bridge.checkpoint_backend.load.return_value = checkpoint
+        self.assertEqual(bridge.load_checkpoint(), checkpoint)
+
+        checkpoint['retrieve_mode'] = 'test'
+        self.assertIs(bridge.load_checkpoint(), None)
+
+        bridge.checkpoint_backend.load.side_effect = Exception('test')
+        self.assertIs(bridge.load_checkpoint(), None)
+
+    @patch('openprocurement.bridge.basic.databridge.sleep')
+    def test_checkpoint_saver(self, mocked_sleep):
+        bridge = BasicDataBridge(self.config)
+        bridge.checkpoint_backend = MagicMock()
+        bridge.feeder.get_checkpoint = MagicMock(side_effect=[
+            {'forward_offset': None}, {'forward_offset': '1'},
+            {'forward_offset': '2'}])
+        mocked_sleep.side_effect = [None, None, None, Exception('stop')]
+        with self.assertRaises(Exception):
+            bridge.checkpoint_saver()
+        bridge.checkpoint_backend.save.assert_called_once_with(
+            'feed_lots_0', {'forward_offset': '1'})
+
+    @patch('openprocurement.bridge.basic.databridge.sleep')
+    def test_checkpoint_saver_postponed(self, mocked_sleep):
+        bridge = BasicDataBridge(self.config)
+        bridge.checkpoint_backend = MagicMock()
+        bridge.feeder.get_checkpoint = MagicMock(side_effect=[
+            {'forward_offset': '1'}, {'forward_offset': '2'}])
+        item = {'id': uuid.uuid4().hex,
+                'dateModified': datetime.datetime.utcnow().isoformat()}
+        bridge.pending_items.add(item)
+        bridge.feeder.queue.put({'id': uuid.uuid4().hex})
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                bridge.pending_items.discard(item['id'], item)
+                bridge.pending_items.done(item['id'])
+            elif len(sleeps) == 4:
+                bridge.feed_consumed['forward'] += 1
+            elif len(sleeps) == 5:
+                raise Exception('stop')
+
+        mocked_sleep.side_effect = sleep
+        with self.assertRaises(Exception):
+            bridge.checkpoint_saver()
+        # Saved only when items received before checkpoint left queues
+        bridge.checkpoint_backend.save.assert_called_once_with(
+            'feed_lots_0', {'forward_offset': '1'})
+        self.assertEqual(bridge.feeder.get_checkpoint.call_count, 2)
+
+    def test_checkpoint_retry_queue(self):
+        bridge = BasicDataBridge(self.config)
+        worker = ResourceItemWorker(
+            config_dict=bridge.workers_config,
+            retry_resource_items_queue=bridge.retry_resource_items_queue,
+            pending_items=bridge.pending_items)
+        item = {'id': uuid.uuid4().hex,
+                'dateModified': datetime.datetime.utcnow().isoformat()}
+        bridge.pending_items.add(item)
+        bridge.input_queue.put(item)
+        watermark = bridge._checkpoint_watermark()
+        bridge.input_queue.get()
+        bridge.pending_items.discard(item['id'], item)
+
+        # Item failed on fetch isn't done while it waits for retry
+        worker.add_to_retry_queue(item)
+        self.assertEqual(bridge.retry_resource_items_queue.qsize(), 1)
+        self.assertFalse(bridge._checkpoint_reached(watermark))
+
+        # Saved after retry
+        retry_item = bridge.retry_resource_items_queue.get(timeout=10)
+        bridge.pending_items.discard(retry_item['id'], retry_item)
+        self.assertFalse(bridge._checkpoint_reached(watermark))
+        bridge.pending_items.done(retry_item['id'])
+        self.assertTrue(bridge._checkpoint_reached(watermark))
+
     @patch('openprocurement.bridge.basic.databridge.APIClient')
     def test_fill_api_clients_queue(self, mock_APIClient):
         bridge = BasicDataBridge(self.config)
@@ -175,6 +334,156 @@ class TestBasicDataBridge(unittest.TestCase):
         self.assertEqual(bridge.input_queue.qsize(), 1)
         self.assertEqual(bridge.input_queue.get(), return_value[0])
 
+    def test_fill_input_queue_backward(self):
+        bridge = BasicDataBridge(self.config)
+        item_id = uuid.uuid4().hex
+        backward_item = {'id': item_id, 'stream': 'backward',
+                         'dateModified': '2017-01-01T00:00:00+02:00'}
+        forward_item = {'id': item_id, 'stream': 'forward',
+                        'dateModified': '2017-01-02T00:00:00+02:00'}
+        bridge.feeder.get_backward_items = MagicMock(
+            return_value=[backward_item])
+        bridge.feeder.get_resource_items = MagicMock(
+            return_value=[forward_item])
+        bridge.fill_input_queue(backward=True)
+        self.assertEqual(bridge.input_queue.queues['backward'].qsize(), 1)
+        # Live change isn't coalesced with pending history item
+        bridge.fill_input_queue()
+        self.assertEqual(bridge.input_queue.queues['forward'].qsize(), 1)
+        self.assertIs(bridge.pending_items.get(item_id), forward_item)
+        self.assertIs(bridge.input_queue.get(), forward_item)
+
+    def test_fill_input_queue_retry_pending(self):
+        bridge = BasicDataBridge(self.config)
+        item_id = uuid.uuid4().hex
+        retry_item = {'id': item_id, 'stream': 'forward',
+                      'dateModified': '2017-01-01T00:00:00+02:00'}
+        forward_item = {'id': item_id, 'stream': 'forward',
+                        'dateModified': '2017-01-02T00:00:00+02:00'}
+        bridge.pending_items.add(retry_item, stage='retry')
+        bridge.retry_resource_items_queue.put(retry_item, delay=60)
+        bridge.feeder.get_resource_items = MagicMock(
+            return_value=[forward_item])
+        # Live change doesn't wait out retry backoff
+        bridge.fill_input_queue()
+        self.assertIs(bridge.input_queue.get(), forward_item)
+        self.assertIs(bridge.pending_items.get(item_id), forward_item)
+        self.assertEqual(retry_item['dateModified'],
+                         '2017-01-01T00:00:00+02:00')
+
+    def test_fill_input_queue_coalesced(self):
+        bridge = BasicDataBridge(self.config)
+        item_id = uuid.uuid4().hex
+        return_value = [
+            {'id': item_id, 'dateModified': '2017-01-01T00:00:00+02:00'},
+            {'id': item_id, 'dateModified': '2017-01-03T00:00:00+02:00'},
+            {'id': item_id, 'dateModified': '2017-01-02T00:00:00+02:00'}
+        ]
+        bridge.feeder.get_resource_items = MagicMock(return_value=return_value)
+        bridge.fill_input_queue()
+        self.assertEqual(bridge.input_queue.qsize(), 1)
+        self.assertEqual(bridge.counters['received_from_sync'], 3)
+        self.assertEqual(bridge.get_status()['coalesced'], 2)
+
+        # Pending item is updated in place
+        self.assertEqual(bridge.input_queue.get()['dateModified'],
+                         '2017-01-03T00:00:00+02:00')
+
+        # Filtered with stale dateModified, queued with newest one
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.return_value = {
+            item_id: '2017-01-02T00:00:00+02:00'}
+        bridge.date_modified_index = None
+        bridge.send_bulk({item_id: '2017-01-01T00:00:00+02:00'})
+        self.assertEqual(bridge.resource_items_queue.get()['dateModified'],
+                         '2017-01-03T00:00:00+02:00')
+        self.assertIn(item_id, bridge.pending_items)
+
+        # Actual item isn't pending anymore
+        bridge.db.filter_bulk.return_value = {
+            item_id: '2017-01-03T00:00:00+02:00'}
+        bridge.send_bulk({item_id: '2017-01-03T00:00:00+02:00'})
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+        self.assertNotIn(item_id, bridge.pending_items)
+
+    def test_send_bulk_failed(self):
+        bridge = BasicDataBridge(self.config)
+        bridge.date_modified_index = None
+        date_modified = datetime.datetime.utcnow().isoformat()
+        input_dict = {}
+        for _ in range(2):
+            item = {'id': uuid.uuid4().hex, 'dateModified': date_modified}
+            bridge.pending_items.add(item)
+            input_dict[item['id']] = date_modified
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.side_effect = Exception('test')
+        with self.assertRaises(Exception) as e:
+            bridge.send_bulk(input_dict)
+        self.assertEqual(e.exception.message, 'test')
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+        # Lost items don't block later changes of same ids
+        self.assertEqual(len(bridge.pending_items), 0)
+        item_id = input_dict.keys()[0]
+        self.assertTrue(bridge.pending_items.add(
+            {'id': item_id, 'dateModified': date_modified}))
+
+    def test_fill_input_queue_sharded(self):
+        bridge = BasicDataBridge(self.config)
+        bridge.shards_count = 2
+        return_value = [
+            {'id': uuid.uuid4().hex,
+             'dateModified': datetime.datetime.utcnow().isoformat()}
+            for _ in xrange(20)
+        ]
+        bridge.feeder.get_resource_items = MagicMock(return_value=return_value)
+        own = [i for i in return_value
+               if bridge._is_own_resource_item(i['id'])]
+        bridge.fill_input_queue()
+        self.assertEqual(bridge.input_queue.qsize(), len(own))
+        self.assertEqual(bridge.counters['received_from_sync'], len(own))
+        bridge.shard_index = 1
+        self.assertEqual(
+            [i for i in return_value
+             if bridge._is_own_resource_item(i['id'])],
+            [i for i in return_value if i not in own])
+
+    def test_check_backfill(self):
+        bridge = BasicDataBridge(self.config)
+        bridge.db = MagicMock()
+        bridge.db.backfill = None
+        bridge.feeder = MagicMock()
+        bridge.feeder.is_backward_crawl.return_value = True
+
+        # Backfill mode disabled
+        bridge.check_backfill()
+        self.assertEqual(bridge.db.start_backfill.call_count, 0)
+        self.assertEqual(bridge.db.stop_backfill.call_count, 0)
+
+        bridge.backfill_mode = True
+        bridge.check_backfill()
+        bridge.db.start_backfill.assert_called_once_with()
+        bridge.db.backfill = True
+        bridge.check_backfill()
+        self.assertEqual(bridge.db.start_backfill.call_count, 1)
+
+        # Feed reached forward mode
+        bridge.feeder.is_backward_crawl.return_value = False
+        bridge.db.stop_backfill.side_effect = Exception('test')
+        bridge.check_backfill()
+        bridge.db.stop_backfill.side_effect = None
+        bridge.check_backfill()
+        self.assertEqual(bridge.db.stop_backfill.call_count, 2)
+
+    def test_get_status(self):
+        bridge = BasicDataBridge(self.config)
+        bridge.input_queue.put({'id': uuid.uuid4().hex})
+        status = bridge.get_status()
+        self.assertEqual(status['shard_index'], 0)
+        self.assertEqual(status['input_queue_size'], 1)
+        self.assertEqual(status['resource_items_queue_size'], 0)
+        self.assertEqual(status['received_from_sync'], 0)
+        self.assertEqual(status['retry_oldest_due_age'], 0)
+
     def test_send_bulk(self):
         old_date_modified = datetime.datetime.utcnow().isoformat()
         id_1 = uuid.uuid4().hex
@@ -183,8 +492,8 @@ class TestBasicDataBridge(unittest.TestCase):
         date_modified_2 = datetime.datetime.utcnow().isoformat()
         input_dict = {id_1: date_modified_1, id_2: date_modified_2}
         return_value = [
-            munchify({'id': id_1, 'key': date_modified_1}),
-            munchify({'id': id_2, 'key': old_date_modified})
+            munchify({'id': id_1, 'key': id_1, 'value': date_modified_1}),
+            munchify({'id': id_2, 'key': id_2, 'value': old_date_modified})
         ]
         bridge = BasicDataBridge(self.config)
         bridge.db.db.view = MagicMock(return_value=return_value)
@@ -193,11 +502,114 @@ class TestBasicDataBridge(unittest.TestCase):
         self.assertEqual(bridge.resource_items_queue.qsize(), 1)
         bridge.db.db.view.side_effect = [Exception(), Exception(),
                                       Exception('test')]
-        input_dict = {}
+        input_dict = {uuid.uuid4().hex: date_modified_1}
         with self.assertRaises(Exception) as e:
             bridge.send_bulk(input_dict)
         self.assertEqual(e.exception.message, 'test')
 
+    def test_send_bulk_with_index(self):
+        id_1 = uuid.uuid4().hex
+        id_2 = uuid.uuid4().hex
+        id_3 = uuid.uuid4().hex
+        date_modified = datetime.datetime.utcnow().isoformat()
+        bridge = BasicDataBridge(self.config)
+        bridge.date_modified_index.set(id_1, date_modified)
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.return_value = {id_2: date_modified}
+        bridge.send_bulk({id_1: date_modified, id_2: date_modified,
+                          id_3: date_modified})
+        bridge.db.filter_bulk.assert_called_once_with(
+            {id_2: date_modified, id_3: date_modified})
+        self.assertEqual(bridge.resource_items_queue.qsize(), 1)
+        self.assertEqual(bridge.resource_items_queue.get()['id'], id_3)
+        self.assertEqual(bridge.date_modified_index.hits, 1)
+        self.assertEqual(bridge.date_modified_index.misses, 2)
+        self.assertEqual(bridge.date_modified_index.get(id_2), date_modified)
+
+        # All ids known by index
+        bridge.db.filter_bulk.reset_mock()
+        bridge.send_bulk({id_1: date_modified, id_2: date_modified})
+        self.assertEqual(bridge.db.filter_bulk.call_count, 0)
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+
+        # Stored doc newer than feed item
+        bridge.send_bulk({id_1: '2017-01-01T00:00:00+02:00'})
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+
+    def test_send_bulk_concurrency(self):
+        config = deepcopy(self.config)
+        config['main']['filter_workers_count'] = 3
+        config['main']['filter_bulk_concurrency'] = 2
+        bridge = BasicDataBridge(config)
+        in_flight = []
+        max_in_flight = []
+
+        def filter_bulk(input_dict):
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            sleep(0.01)
+            in_flight.pop()
+            return {}
+
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.side_effect = filter_bulk
+        bridge.date_modified_index = None
+        date_modified = datetime.datetime.utcnow().isoformat()
+        joinall([spawn(bridge.send_bulk, {uuid.uuid4().hex: date_modified})
+                 for _ in xrange(3)])
+        self.assertEqual(bridge.db.filter_bulk.call_count, 3)
+        self.assertEqual(max(max_in_flight), 2)
+        self.assertEqual(bridge.resource_items_queue.qsize(), 3)
+
+    @patch('openprocurement.bridge.basic.databridge.BasicDataBridge.'
+           'fill_resource_items_queue')
+    def test_spawn_filter_workers(self, mock_fill):
+        config = deepcopy(self.config)
+        config['main']['filter_workers_count'] = 3
+        bridge = BasicDataBridge(config)
+        mock_fill.side_effect = lambda: sleep(1)
+        self.assertEqual(bridge.spawn_filter_workers(), 3)
+        self.assertEqual(len(bridge.filter_workers_pool), 3)
+        self.assertEqual(bridge.spawn_filter_workers(), 0)
+        bridge.filter_workers_pool.kill()
+        self.assertEqual(len(bridge.filter_workers_pool), 0)
+        self.assertEqual(bridge.spawn_filter_workers(), 3)
+        bridge.filter_workers_pool.kill()
+
+    def test_feed_only(self):
+        config = deepcopy(self.config)
+        config['main']['feed_only'] = True
+        with self.assertRaises(DataBridgeConfigError) as e:
+            BasicDataBridge(config)
+        self.assertEqual(
+            e.exception.message,
+            'Invalid \'writers_count\'. Value must be greater than 0 in '
+            '\'feed_only\' mode.')
+
+        config['main'].update({'writers_count': 1, 'workers_min': 1,
+                               'feed_opt_fields': ['status', 'title']})
+        bridge = BasicDataBridge(config)
+        self.assertEqual(bridge.workers_min, 0)
+        self.assertEqual(bridge.retry_workers_min, 0)
+        self.assertEqual(bridge.feeder.extra_params['opt_fields'],
+                         'status,title')
+        item_id = uuid.uuid4().hex
+        date_modified = datetime.datetime.utcnow().isoformat()
+        bridge.pending_items.add({'id': item_id, 'stream': 'forward',
+                                  'dateModified': date_modified,
+                                  'status': 'active', 'owner': 'broker'})
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.return_value = {}
+        bridge.date_modified_index = None
+        bridge.send_bulk({item_id: date_modified})
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+        doc, item = bridge.bulk_queue.get()
+        self.assertEqual(doc, {'id': item_id, 'dateModified': date_modified,
+                               'status': 'active'})
+        self.assertEqual(item['stream'], 'forward')
+        self.assertNotIn(item_id, bridge.pending_items)
+        self.assertEqual(bridge.get_status()['written_from_feed'], 1)
+
     def test_fill_resource_items_queue(self):
         bridge = BasicDataBridge(self.config)
         db_dict_list = [
@@ -221,7 +633,8 @@ class TestBasicDataBridge(unittest.TestCase):
         view_return_list = [
             munchify({
                 'id': db_dict_list[0]['id'],
-                'key': db_dict_list[0]['dateModified']
+                'key': db_dict_list[0]['id'],
+                'value': db_dict_list[0]['dateModified']
             })
         ]
         bridge.db.db.view = MagicMock(return_value=view_return_list)
@@ -229,26 +642,69 @@ class TestBasicDataBridge(unittest.TestCase):
             bridge.fill_resource_items_queue()
         self.assertEqual(bridge.resource_items_queue.qsize(), 1)
 
+    def test_send_bulk_replaced_pending(self):
+        bridge = BasicDataBridge(self.config)
+        bridge.db = MagicMock()
+        bridge.db.filter_bulk.return_value = {}
+        bridge.date_modified_index = None
+        item_id = uuid.uuid4().hex
+        backward_item = {'id': item_id, 'stream': 'backward',
+                         'dateModified': '2017-01-01T00:00:00+02:00'}
+        forward_item = {'id': item_id, 'stream': 'forward',
+                        'dateModified': '2017-01-02T00:00:00+02:00'}
+        bridge.pending_items.add(forward_item)
+        # History item doesn't evict live change replaced it
+        bridge.send_bulk({item_id: backward_item['dateModified']},
+                         {item_id: backward_item})
+        self.assertIs(bridge.resource_items_queue.get(), backward_item)
+        self.assertIs(bridge.pending_items.get(item_id), forward_item)
+
     @patch('openprocurement.bridge.basic.databridge.spawn')
     @patch('openprocurement.bridge.basic.databridge.ResourceItemWorker.spawn')
     @patch('openprocurement.bridge.basic.databridge.APIClient')
     def test_gevent_watcher(self, mock_APIClient, mock_riw_spawn, mock_spawn):
         bridge = BasicDataBridge(self.config)
-        bridge.filler = MagicMock()
-        bridge.filler.exception = Exception('test_filler')
         bridge.input_queue_filler = MagicMock()
         bridge.input_queue_filler.exception = Exception('test_temp_filler')
+        bridge.backward_input_queue_filler = MagicMock(exception=None)
         self.assertEqual(bridge.workers_pool.free_count(),
                          bridge.workers_max)
         self.assertEqual(bridge.retry_workers_pool.free_count(),
                          bridge.retry_workers_max)
+        self.assertEqual(len(bridge.filter_workers_pool), 0)
+        bridge.retry_resource_items_queue.put(
+            {'id': uuid.uuid4().hex, 'dateModified': '2017-01-01'})
+        sleep(0.1)
         bridge.gevent_watcher()
+        self.assertEqual(len(bridge.filter_workers_pool),
+                         bridge.filter_workers_count)
+        self.assertGreaterEqual(RETRY_OLDEST_DUE_AGE.get(), 0.1)
         self.assertEqual(bridge.workers_pool.free_count(),
                          bridge.workers_max - bridge.workers_min)
         self.assertEqual(bridge.retry_workers_pool.free_count(),
                          bridge.retry_workers_max - bridge.retry_workers_min)
         del bridge
 
+    @patch('openprocurement.bridge.basic.databridge.spawn')
+    @patch('openprocurement.bridge.basic.databridge.BulkWriter.spawn')
+    @patch('openprocurement.bridge.basic.databridge.ResourceItemWorker.spawn')
+    @patch('openprocurement.bridge.basic.databridge.APIClient')
+    def test_gevent_watcher_with_writers(self, mock_APIClient, mock_riw_spawn,
+                                         mock_writer_spawn, mock_spawn):
+        config = deepcopy(self.config)
+        config['main']['writers_count'] = 2
+        bridge = BasicDataBridge(config)
+        bridge.input_queue_filler = MagicMock(exception=None)
+        bridge.backward_input_queue_filler = MagicMock(exception=None)
+        self.assertIsInstance(bridge.bulk_queue, Queue)
+        bridge.create_worker(bridge.resource_items_queue)
+        self.assertIs(mock_riw_spawn.call_args[1]['bulk_queue'],
+                      bridge.bulk_queue)
+        bridge.gevent_watcher()
+        self.assertEqual(mock_writer_spawn.call_count, 2)
+        self.assertEqual(len(bridge.writers_pool), 2)
+        self.assertEqual(bridge.get_status()['writer_threads'], 2)
+
     @patch('openprocurement.bridge.basic.databridge.APIClient')
     @patch('openprocurement.bridge.basic.databridge.ResourceItemWorker.spawn')
     def test_queues_controller(self, mock_riw_spawn, mock_APIClient):
@@ -272,6 +728,71 @@ class TestBasicDataBridge(unittest.TestCase):
         self.assertEqual(len(bridge.workers_pool), 1)
         self.assertEqual(bridge.resource_items_queue.qsize(), 0)
 
+        # Fill thresholds are not applied to unbounded queue
+        bridge.resource_items_queue_size = -1
+        bridge.resource_items_queue = Queue()
+        for i in xrange(0, 10):
+            bridge.resource_items_queue.put('a')
+        with patch('__builtin__.True', AlmostAlwaysTrue()):
+            bridge.queues_controller()
+        self.assertEqual(len(bridge.workers_pool), 1)
+
+    def test__queue_fill(self):
+        bridge = BasicDataBridge(self.config)
+        queue = Queue()
+        for i in xrange(0, 5):
+            queue.put('a')
+        self.assertEqual(bridge._queue_fill(queue, 20), 25)
+        self.assertIs(bridge._queue_fill(queue, -1), None)
+
+    @patch('openprocurement.bridge.basic.databridge.APIClient')
+    @patch('openprocurement.bridge.basic.databridge.ResourceItemWorker.spawn')
+    def test_scale_workers(self, mock_riw_spawn, mock_APIClient):
+        config = deepcopy(self.config)
+        config['main']['workers_controller'] = 'predictive'
+        config['main']['workers_max'] = 10
+        bridge = BasicDataBridge(config)
+        bridge._get_average_requests_duration = MagicMock(
+            return_value=(0.1, [0.1]))
+        mock_riw_spawn.side_effect = lambda *args, **kwargs: MagicMock()
+        bridge.main_controller.update(0, now=0)
+        bridge.main_controller.last_time = monotonic() - 1
+        # 40 items/sec. arrived, backlog of 30 to drain in 1 sec.:
+        # (20 + 30) * 0.1 = 5 workers
+        bridge.counters['add_to_resource_items_queue'] = 40
+        for i in xrange(0, 30):
+            bridge.resource_items_queue.put('a')
+        bridge.scale_workers()
+        self.assertEqual(len(bridge.workers_pool), 5)
+        self.assertEqual(len(bridge.retry_workers_pool), 1)
+        self.assertEqual(len(bridge.api_clients_info), 6)
+
+        # Pool shrinks by half of excess
+        for i in xrange(0, 30):
+            bridge.resource_items_queue.get()
+        bridge.main_controller.arrival_rate = 0
+        bridge.main_controller.last_time = monotonic() - 1
+        bridge.scale_workers()
+        self.assertEqual(len(bridge.workers_pool), 3)
+        self.assertEqual(len(bridge.api_clients_info), 4)
+
+        # Retries which aren't due yet don't grow retry pool
+        for i in xrange(0, 50):
+            bridge.retry_resource_items_queue.put(
+                {'id': str(i), 'dateModified': '2017-01-01'}, delay=60)
+        bridge.retry_controller.last_time = monotonic() - 1
+        bridge.scale_workers()
+        self.assertEqual(len(bridge.retry_workers_pool), 1)
+
+        config['main']['workers_controller'] = 'pid'
+        with self.assertRaises(DataBridgeConfigError) as e:
+            BasicDataBridge(config)
+        self.assertEqual(
+            e.exception.message,
+            "Invalid 'workers_controller'. Value must be 'threshold' or "
+            "'predictive'."
+        )
+
     @patch('openprocurement.bridge.basic.databridge.APIClient')
     def test_create_api_client(self, mock_APIClient):
         mock_APIClient.side_effect = [RequestFailed(), munchify({
@@ -284,6 +805,16 @@ class TestBasicDataBridge(unittest.TestCase):
 
         del bridge
 
+    @patch('openprocurement.bridge.basic.databridge.APIClient')
+    def test_create_api_client_with_fetch_batch(self, mock_APIClient):
+        bridge = BasicDataBridge(self.config)
+        bridge.fetch_batch_size = 5
+        bridge.create_api_client()
+        session = mock_APIClient.return_value.session
+        self.assertEqual(session.mount.call_count, 2)
+        adapter = session.mount.call_args[0][1]
+        self.assertEqual(adapter._pool_maxsize, 5)
+
     @patch('openprocurement.bridge.basic.databridge.APIClient')
     def test__get_average_request_duration(self, mocked_api_client):
         bridge = BasicDataBridge(self.config)
@@ -295,17 +826,17 @@ class TestBasicDataBridge(unittest.TestCase):
         request_duration = 1
         for k in bridge.api_clients_info:
             for i in xrange(0, 3):
-                bridge.api_clients_info[k]['request_durations'][
-                    datetime.datetime.now()] = request_duration
+                bridge.api_clients_info[k]['request_durations'].add(
+                    request_duration)
             request_duration += 1
         res, res_list = bridge._get_average_requests_duration()
         self.assertEqual(res, 2)
         self.assertEqual(len(res_list), 3)
 
-        delta = datetime.timedelta(seconds=301)
-        grown_date = datetime.datetime.now() - delta
+        grown_durations = LatencyWindow(0.2)
+        grown_durations.add(1, now=monotonic() - 0.15)
         bridge.api_clients_info[uuid.uuid4().hex] = {
-            'request_durations': {grown_date: 1},
+            'request_durations': grown_durations,
             'destroy': False,
             'request_interval': 0,
             'avg_duration': 0
@@ -364,13 +895,14 @@ class TestBasicDataBridge(unittest.TestCase):
             bridge.create_api_client()
         req_duration = 1
         for _, info in bridge.api_clients_info.items():
-            info['request_durations'][datetime.datetime.now()] = req_duration
+            # Older than perfomance_window, but kept for one more watch
+            info['request_durations'].add(req_duration,
+                                          now=monotonic() - 0.15)
             req_duration += 1
             self.assertEqual(info.get('grown', False), False)
             self.assertEqual(len(info['request_durations']), 1)
         self.assertEqual(len(bridge.api_clients_info), 3)
         self.assertEqual(bridge.api_clients_queue.qsize(), 3)
-        sleep(1)
 
         bridge.perfomance_watcher()
         grown = 0
@@ -380,11 +912,13 @@ class TestBasicDataBridge(unittest.TestCase):
                 grown += 1
             if info['drop_cookies']:
                 with_new_cookies += 1
-            self.assertEqual(len(info['request_durations']), 0)
         self.assertEqual(len(bridge.api_clients_info), 3)
         self.assertEqual(bridge.api_clients_queue.qsize(), 3)
         self.assertEqual(grown, 3)
         self.assertEqual(with_new_cookies, 1)
+        sleep(0.1)
+        for info in bridge.api_clients_info.values():
+            self.assertEqual(len(info['request_durations']), 0)
 
     @patch('openprocurement.bridge.basic.databridge.BasicDataBridge.'
            'fill_input_queue')
@@ -405,7 +939,8 @@ class TestBasicDataBridge(unittest.TestCase):
         self.assertEqual(mock_fill.call_count, 1)
         self.assertEqual(mock_controller.call_count, 1)
         self.assertEqual(mock_gevent.call_count, 1)
-        self.assertEqual(mock_fill_input_queue.call_count, 1)
+        self.assertEqual(mock_fill_input_queue.call_count, 2)
+        mock_fill_input_queue.assert_called_with(backward=True)
 
 
 def suite():
@@ -2,7 +2,23 @@
 
 import unittest
 
-from openprocurement.bridge.basic.tests import databridge, workers, test_couchdb_storage, test_elasticsearch_storage
+from openprocurement.bridge.basic.tests import (
+    databridge,
+    workers,
+    test_couchdb_storage,
+    test_elasticsearch_storage,
+    test_supervisor,
+    test_checkpoint,
+    test_cache,
+    test_queues,
+    test_benchmarks,
+    test_metrics,
+    test_serializers,
+    test_ratelimit,
+    test_stats,
+    test_controller,
+    test_batching
+)
 
 
 def suite():
@@ -11,6 +27,17 @@ def suite():
     tests.addTest(databridge.suite())
     tests.addTest(test_couchdb_storage.suite())
     tests.addTest(test_elasticsearch_storage.suite())
+    tests.addTest(test_supervisor.suite())
+    tests.addTest(test_checkpoint.suite())
+    tests.addTest(test_cache.suite())
+    tests.addTest(test_queues.suite())
+    tests.addTest(test_benchmarks.suite())
+    tests.addTest(test_metrics.suite())
+    tests.addTest(test_serializers.suite())
+    tests.addTest(test_ratelimit.suite())
+    tests.addTest(test_stats.suite())
+    tests.addTest(test_controller.suite())
+    tests.addTest(test_batching.suite())
     return tests
 
 
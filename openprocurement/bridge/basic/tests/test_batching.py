@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import patch
+from openprocurement.bridge.basic.batching import MicroBatcher
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch('openprocurement.bridge.basic.batching.monotonic',
+                        self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_size(self):
+        batcher = MicroBatcher(3, 10)
+        self.assertEqual(len(batcher), 0)
+        self.assertFalse(batcher.ready())
+        batcher.add('a', 1)
+        batcher.add('b', 2)
+        # Item with same key replaces previous one
+        batcher.add('a', 3)
+        self.assertEqual(len(batcher), 2)
+        self.assertFalse(batcher.ready())
+        self.assertIn('a', batcher)
+        self.assertEqual(batcher['a'], 3)
+        self.assertEqual(batcher.get('c'), None)
+        self.assertEqual(sorted(batcher), ['a', 'b'])
+        batcher.add('c', 4)
+        self.assertTrue(batcher.ready())
+        self.assertEqual(batcher.take(), {'a': 3, 'b': 2, 'c': 4})
+        self.assertEqual(len(batcher), 0)
+        self.assertFalse(batcher.ready())
+
+    def test_latency(self):
+        batcher = MicroBatcher(100, 10)
+        self.assertEqual(batcher.timeout(), 10)
+        batcher.add('a', 1)
+        self.clock.now += 4
+        batcher.add('b', 2)
+        # Deadline is counted from first item in batch
+        self.assertEqual(batcher.timeout(), 6)
+        self.assertFalse(batcher.ready())
+        self.clock.now += 6
+        self.assertTrue(batcher.ready())
+        self.assertEqual(batcher.timeout(), 0)
+        self.clock.now += 1
+        self.assertEqual(batcher.timeout(), 0)
+        self.assertEqual(batcher.take(), {'a': 1, 'b': 2})
+        self.assertEqual(batcher.timeout(), 10)
+        batcher.add('c', 3)
+        self.assertEqual(batcher.timeout(), 10)
+
+
+def suite():
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.makeSuite(TestMicroBatcher))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from mock import MagicMock
+from openprocurement.bridge.basic.benchmarks.fake_api import FakeAPI
+from openprocurement.bridge.basic.benchmarks.runner import percentile
+from openprocurement.bridge.basic.benchmarks.storage import MemoryStorage
+
+
+class TestFakeAPI(unittest.TestCase):
+
+    def request(self, api, path, query='', cookie=''):
+        start_response = MagicMock()
+        body = api({'PATH_INFO': path, 'QUERY_STRING': query,
+                    'HTTP_COOKIE': cookie}, start_response)
+        self.headers = dict(start_response.call_args[0][1])
+        status = start_response.call_args[0][0]
+        return status, json.loads(body[0]) if body[0] else None
+
+    def test_feed(self):
+        api = FakeAPI(docs_count=5)
+        status, page = self.request(api, '/api/0/tenders',
+                                    'feed=changes&descending=1&limit=3')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual([i['id'] for i in page['data']],
+                         [api.ids[4], api.ids[3], api.ids[2]])
+        self.assertEqual(page['prev_page']['offset'], '5')
+        status, page = self.request(
+            api, '/api/0/tenders',
+            'descending=1&limit=3&offset={}'.format(
+                page['next_page']['offset']))
+        self.assertEqual([i['id'] for i in page['data']],
+                         [api.ids[1], api.ids[0]])
+        status, page = self.request(
+            api, '/api/0/tenders',
+            'descending=1&offset={}'.format(page['next_page']['offset']))
+        self.assertEqual(page['data'], [])
+
+        # Forward feed
+        status, page = self.request(api, '/api/0/tenders', 'offset=3')
+        self.assertEqual([i['id'] for i in page['data']],
+                         [api.ids[3], api.ids[4]])
+        self.assertEqual(page['next_page']['offset'], '5')
+
+        # Feed with opt_fields
+        status, page = self.request(api, '/api/0/tenders',
+                                    'offset=4&opt_fields=status,unknown')
+        self.assertEqual(page['data'], [
+            {'id': api.ids[4], 'dateModified': page['data'][0]['dateModified'],
+             'status': 'active.tendering'}])
+
+    def test_publish_rate(self):
+        api = FakeAPI(docs_count=5, publish_rate=0.001)
+        self.assertEqual(api.published(), 1)
+        status, page = self.request(api, '/api/0/tenders', 'descending=1')
+        self.assertEqual(len(page['data']), 1)
+        status, body = self.request(api, '/api/0/tenders/' + api.ids[1])
+        self.assertEqual(status, '404 Not Found')
+
+    def test_item(self):
+        api = FakeAPI(docs_count=2, doc_size=10)
+        status, body = self.request(api, '/api/0/tenders/' + api.ids[1])
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body['data']['id'], api.ids[1])
+        self.assertEqual(len(body['data']['description']), 10)
+        status, body = self.request(api, '/api/0/tenders/unknown')
+        self.assertEqual(status, '404 Not Found')
+        status, body = self.request(api, '/api/0/spore')
+        self.assertEqual(status, '200 OK')
+
+        api.rate_429 = 1
+        status, body = self.request(api, '/api/0/tenders/' + api.ids[1])
+        self.assertEqual(status, '429 Too Many Requests')
+        self.assertEqual(api.requests_count, 4)
+
+    def test_backends(self):
+        api = FakeAPI(docs_count=1, backend_latencies=[0, 0.001])
+        self.request(api, '/api/0/spore')
+        self.assertEqual(self.headers['Set-Cookie'], 'SERVER_ID=0; Path=/')
+        self.request(api, '/api/0/spore')
+        self.assertEqual(self.headers['Set-Cookie'], 'SERVER_ID=1; Path=/')
+        # Session stays on own backend
+        self.request(api, '/api/0/spore', cookie='SERVER_ID=1')
+        self.assertEqual(self.headers['Set-Cookie'], 'SERVER_ID=1; Path=/')
+        self.request(api, '/api/0/spore', cookie='SERVER_ID=7')
+        self.assertEqual(self.headers['Set-Cookie'], 'SERVER_ID=0; Path=/')
+
+
+class TestMemoryStorage(unittest.TestCase):
+
+    def test_save_bulk(self):
+        storage = MemoryStorage()
+        doc = {'id': '1', 'dateModified': '2017-01-01T00:00:00+02:00'}
+        self.assertEqual(storage.save_bulk({'1': doc}),
+                         [(True, '1', 'created')])
+        self.assertEqual(storage.save_bulk({'1': doc}),
+                         [(True, '1', 'skipped')])
+        new_doc = {'id': '1', 'dateModified': '2017-01-02T00:00:00+02:00'}
+        self.assertEqual(storage.save_bulk({'1': new_doc}),
+                         [(True, '1', 'updated')])
+        self.assertEqual(len(storage.lags), 2)
+        self.assertEqual(storage.get_doc('1'), new_doc)
+        self.assertIs(storage.get_doc('2'), None)
+        self.assertEqual(storage.filter_bulk({'1': '', '2': ''}),
+                         {'1': new_doc['dateModified']})
+        storage.save_checkpoint('feed', {'forward_offset': '1'})
+        self.assertEqual(storage.get_checkpoint('feed'),
+                         {'forward_offset': '1'})
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(range(101), 99), 99)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestFakeAPI))
+    suite.addTest(unittest.makeSuite(TestMemoryStorage))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
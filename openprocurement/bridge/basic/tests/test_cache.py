@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import unittest
+from openprocurement.bridge.basic.cache import (
+    DateModifiedIndex,
+    PendingItems
+)
+from openprocurement.bridge.basic.metrics import COALESCED_ITEMS
+
+
+class TestDateModifiedIndex(unittest.TestCase):
+
+    def test_set_get(self):
+        index = DateModifiedIndex(2)
+        index.set('1', '2017-01-01')
+        index.set('2', '2017-01-02')
+        self.assertEqual(index.get('1'), '2017-01-01')
+        # '2' is least recently used and will be evicted
+        index.set('3', '2017-01-03')
+        self.assertEqual(len(index), 2)
+        self.assertIs(index.get('2'), None)
+        self.assertIn('1', index)
+        self.assertIn('3', index)
+
+        # Older dateModified doesn't replace newer one
+        index.set('1', '2016-12-31')
+        self.assertEqual(index.get('1'), '2017-01-01')
+        index.set('1', '2017-02-01')
+        self.assertEqual(index.get('1'), '2017-02-01')
+
+        index.delete('1')
+        index.delete('4')
+        self.assertNotIn('1', index)
+
+    def test_disabled(self):
+        index = DateModifiedIndex(0)
+        index.set('1', '2017-01-01')
+        self.assertEqual(len(index), 0)
+
+    def test_lookup(self):
+        index = DateModifiedIndex(10)
+        index.set('1', '2017-01-01')
+        index.set('2', '2017-01-02')
+        found, missed = index.lookup({'1': '2017-01-01', '2': '2017-01-03',
+                                      '3': '2017-01-03'})
+        self.assertEqual(found, {'1': '2017-01-01', '2': '2017-01-02'})
+        self.assertEqual(missed, {'3': '2017-01-03'})
+        self.assertEqual(index.hits, 2)
+        self.assertEqual(index.misses, 1)
+
+
+class TestPendingItems(unittest.TestCase):
+
+    def test_add(self):
+        pending = PendingItems()
+        retry_coalesced = COALESCED_ITEMS.get(stage='retry')
+        item = {'id': '1', 'dateModified': '2017-01-02'}
+        self.assertTrue(pending.add(item))
+        self.assertIn('1', pending)
+        self.assertIs(pending.get('1'), item)
+
+        # Older item is dropped
+        self.assertFalse(pending.add({'id': '1',
+                                      'dateModified': '2017-01-01'}))
+        self.assertEqual(item['dateModified'], '2017-01-02')
+        # Newer item updates pending one except its stream
+        self.assertFalse(pending.add({'id': '1', 'status': 'complete',
+                                      'stream': 'backward',
+                                      'dateModified': '2017-01-03'},
+                                     stage='retry'))
+        self.assertEqual(item, {'id': '1', 'status': 'complete',
+                                'dateModified': '2017-01-03'})
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending.saved, 2)
+        self.assertEqual(COALESCED_ITEMS.get(stage='retry'),
+                         retry_coalesced + 1)
+
+        # Item taken from queue may be queued again
+        pending.discard('1')
+        pending.discard('2')
+        self.assertNotIn('1', pending)
+        self.assertIs(pending.get('1'), None)
+        self.assertTrue(pending.add({'id': '1',
+                                     'dateModified': '2017-01-04'}))
+
+        # Only same pending item is discarded by reference
+        pending.discard('1', item)
+        self.assertIn('1', pending)
+        pending.discard('1', pending.get('1'))
+        self.assertNotIn('1', pending)
+
+    def test_drained(self):
+        pending = PendingItems()
+        item = {'id': '1', 'dateModified': '2017-01-01'}
+        pending.add(item)
+        snapshot = pending.snapshot()
+        pending.add({'id': '2', 'dateModified': '2017-01-01'})
+        # Coalesced item is still same pending one
+        pending.add({'id': '1', 'dateModified': '2017-01-02'})
+        self.assertFalse(pending.drained(snapshot))
+        # Item taken from queue isn't done until saved
+        pending.discard('1', item)
+        self.assertFalse(pending.drained(snapshot))
+        # Item queued again after snapshot is newer than it
+        pending.add({'id': '1', 'dateModified': '2017-01-03'})
+        self.assertFalse(pending.drained(snapshot))
+        pending.done('1')
+        self.assertTrue(pending.drained(snapshot))
+        self.assertEqual(pending.units['1'], [3])
+        pending.done('1')
+        self.assertNotIn('1', pending.units)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDateModifiedIndex))
+    suite.addTest(unittest.makeSuite(TestPendingItems))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from gevent import spawn
+from mock import MagicMock, patch
+from openprocurement.bridge.basic.checkpoint import (
+    CheckpointResourceFeeder,
+    FileCheckpoint,
+    StorageCheckpoint
+)
+
+
+class TestFileCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_save(self):
+        checkpoint = FileCheckpoint(self.path)
+        self.assertIs(checkpoint.load('feed_tenders_0'), None)
+        state = {'forward_offset': '1', 'backward_offset': '2'}
+        checkpoint.save('feed_tenders_0', state)
+        self.assertEqual(checkpoint.load('feed_tenders_0'), state)
+        self.assertIs(checkpoint.load('feed_tenders_1'), None)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+
+class TestStorageCheckpoint(unittest.TestCase):
+
+    def test_load_save(self):
+        db = MagicMock()
+        db.get_checkpoint.return_value = {'forward_offset': '1'}
+        checkpoint = StorageCheckpoint(db)
+        self.assertEqual(checkpoint.load('feed_tenders_0'),
+                         {'forward_offset': '1'})
+        checkpoint.save('feed_tenders_0', {'forward_offset': '2'})
+        db.save_checkpoint.assert_called_once_with('feed_tenders_0',
+                                                   {'forward_offset': '2'})
+
+
+class TestCheckpointResourceFeeder(unittest.TestCase):
+
+    def get_feeder(self, checkpoint):
+        feeder = CheckpointResourceFeeder(
+            checkpoint=checkpoint, host='http://127.0.0.1', version='2.3',
+            key='', resource='tenders',
+            extra_params={'mode': '_all_', 'limit': 1000})
+        feeder.forward_client = MagicMock()
+        feeder.backward_params = {}
+        feeder.forward_params = {}
+        feeder.retriever_backward = MagicMock(return_value=0)
+        feeder.retriever_forward = MagicMock(return_value=1)
+        return feeder
+
+    @patch('openprocurement.bridge.basic.checkpoint.ResourceFeeder.'
+           'start_sync')
+    def test_start_sync_without_checkpoint(self, mocked_start_sync):
+        feeder = self.get_feeder(None)
+        feeder.start_sync()
+        mocked_start_sync.assert_called_once_with()
+
+    def test_start_sync_from_checkpoint(self):
+        feeder = self.get_feeder({'forward_offset': 'f1',
+                                  'backward_offset': 'b1',
+                                  'backward_finished': False,
+                                  'retrieve_mode': '_all_'})
+        self.assertFalse(feeder.is_backward_crawl())
+        feeder.start_sync()
+        self.assertTrue(feeder.is_backward_crawl())
+        feeder.backward_worker.join()
+        feeder.forward_worker.join()
+        self.assertFalse(feeder.is_backward_crawl())
+        self.assertEqual(feeder.forward_params['offset'], 'f1')
+        self.assertEqual(feeder.backward_params['offset'], 'b1')
+        self.assertEqual(feeder.retriever_backward.call_count, 1)
+        self.assertEqual(feeder.retriever_forward.call_count, 1)
+        self.assertIs(feeder.checkpoint, None)
+        self.assertEqual(feeder.get_checkpoint(), {
+            'resource': 'tenders',
+            'retrieve_mode': '_all_',
+            'backward_offset': 'b1',
+            'forward_offset': 'f1',
+            'backward_finished': True
+        })
+
+    def test_start_sync_from_checkpoint_backward_finished(self):
+        feeder = self.get_feeder({'forward_offset': 'f1',
+                                  'backward_offset': 'b1',
+                                  'backward_finished': True,
+                                  'retrieve_mode': '_all_'})
+        feeder.start_sync()
+        feeder.backward_worker.join()
+        self.assertEqual(feeder.backward_worker.value, 0)
+        self.assertEqual(feeder.retriever_backward.call_count, 0)
+        self.assertNotIn('offset', feeder.backward_params)
+
+    def test_handle_response_data_streams(self):
+        feeder = self.get_feeder(None)
+        feeder.retriever_forward = lambda: feeder.handle_response_data(
+            [{'id': '2'}])
+        # First page on sync start and history go to backward queue
+        feeder.handle_response_data([{'id': '1'}])
+        feeder.forward_worker = spawn(feeder.retriever_forward)
+        feeder.forward_worker.join()
+        self.assertEqual(feeder.queue.get(), {'id': '2', 'stream': 'forward'})
+        self.assertEqual(next(feeder.get_backward_items()),
+                         {'id': '1', 'stream': 'backward'})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestFileCheckpoint))
+    suite.addTest(unittest.makeSuite(TestStorageCheckpoint))
+    suite.addTest(unittest.makeSuite(TestCheckpointResourceFeeder))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
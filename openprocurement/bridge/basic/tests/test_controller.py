@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import unittest
+from openprocurement.bridge.basic.controller import WorkersController
+
+
+class TestWorkersController(unittest.TestCase):
+
+    def test_update(self):
+        controller = WorkersController(1, 10, 10, alpha=0.5)
+        self.assertEqual(controller.update(100, now=10), 0)
+        self.assertEqual(controller.update(200, now=11), 50)
+        self.assertEqual(controller.update(300, now=12), 75)
+        # Same time, rate is not changed
+        self.assertEqual(controller.update(400, now=12), 75)
+
+    def test_desired(self):
+        controller = WorkersController(1, 10, 10)
+        controller.arrival_rate = 20
+        # Unknown latency keeps current count within limits
+        self.assertEqual(controller.desired(0, 0, 3), 3)
+        self.assertEqual(controller.desired(0, 0, 0), 1)
+        self.assertEqual(controller.desired(0, 0.1, 5), 2)
+        self.assertEqual(controller.desired(100, 0.1, 5), 3)
+        self.assertEqual(controller.desired(10000, 0.1, 5), 10)
+        controller.arrival_rate = 0
+        self.assertEqual(controller.desired(0, 0.1, 5), 1)
+
+        # Batch requests serve several items per request
+        controller = WorkersController(1, 10, 10, batch_size=4)
+        controller.arrival_rate = 80
+        self.assertEqual(controller.desired(0, 0.1, 1), 2)
+
+    def test_step(self):
+        controller = WorkersController(1, 10, 10)
+        self.assertEqual(controller.step(2, 7), 5)
+        self.assertEqual(controller.step(3, 3), 0)
+        self.assertEqual(controller.step(9, 1), -4)
+        self.assertEqual(controller.step(2, 1), -1)
+
+
+def suite():
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.makeSuite(TestWorkersController))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
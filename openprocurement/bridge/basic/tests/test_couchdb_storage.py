@@ -4,7 +4,14 @@ from copy import deepcopy
 from uuid import uuid4
 from couchdb.http import Unauthorized
 from mock import patch, MagicMock, call
-from openprocurement.bridge.basic.storages.couchdb_plugin import CouchDBStorage
+from munch import munchify
+from gevent import sleep, spawn
+from openprocurement.bridge.basic.storages.couchdb_plugin import (
+    BoundedConnectionPool,
+    CouchDBStorage,
+    PooledSession,
+    doc_digest
+)
 
 
 class TestCouchDBStorage(unittest.TestCase):
@@ -58,10 +65,212 @@ class TestCouchDBStorage(unittest.TestCase):
         doc = db.get_doc('1')
         self.assertEqual(mocked_doc, doc)
 
+    @patch('openprocurement.bridge.basic.storages.couchdb_plugin.Server')
+    def test_filter_bulk(self, mocked_server):
+        db = CouchDBStorage(self.storage_conf, 'tenders')
+        db.db = MagicMock()
+        db.db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': '2017-01-01'})
+        ]
+        resp_dict = db.filter_bulk({'1': '2017-01-02', '2': '2017-01-02'})
+        self.assertEqual(resp_dict, {'1': '2017-01-01'})
+        self.assertEqual(db.db.view.call_args[0][0],
+                         '_design/tenders/_view/by_id')
+        self.assertEqual(sorted(db.db.view.call_args[1]['keys']), ['1', '2'])
+
+        # Unchanged doc is actual up to its confirmed dateModified
+        db.skip_unchanged = True
+        db.confirmations_db = MagicMock()
+        db.db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': '2017-01-01'}),
+            munchify({'id': '2', 'key': '2', 'value': '2017-01-03'})
+        ]
+        db.confirmations_db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': {'rev': '1-a'},
+                      'doc': {'_id': '1', 'dateModified': '2017-01-03'}})
+        ]
+        resp_dict = db.filter_bulk({'1': '2017-01-03', '2': '2017-01-03'})
+        self.assertEqual(resp_dict, {'1': '2017-01-03', '2': '2017-01-03'})
+        # Confirmations are requested only for stale docs
+        db.confirmations_db.view.assert_called_once_with(
+            '_all_docs', keys=['1'], include_docs=True)
+
+    @patch('openprocurement.bridge.basic.storages.couchdb_plugin.Server')
+    def test_save_bulk(self, mocked_server):
+        db = CouchDBStorage(self.storage_conf, 'tenders')
+        db.db = MagicMock()
+        db.db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': {'rev': '1-a'}}),
+            munchify({'id': '3', 'key': '3',
+                      'value': {'rev': '2-c', 'deleted': True}}),
+            munchify({'key': '4', 'error': 'not_found', 'value': None})
+        ]
+        db.db.update.return_value = [
+            (True, '1', '2-b'),
+            (True, '2', '2-a'),
+            (True, '3', '1-d'),
+            (False, '4', Exception(u'New doc with oldest dateModified.'))
+        ]
+        bulk = {
+            '1': {'_id': '1', 'id': '1'},
+            '2': {'_id': '2', 'id': '2', '_rev': '1-a'},
+            '3': {'_id': '3', 'id': '3'},
+            '4': {'_id': '4', 'id': '4'}
+        }
+        results = db.save_bulk(bulk)
+        # Revisions fetched with one request for docs without _rev
+        self.assertEqual(db.db.view.call_count, 1)
+        self.assertEqual(db.db.view.call_args[0][0], '_all_docs')
+        self.assertEqual(sorted(db.db.view.call_args[1]['keys']),
+                         ['1', '3', '4'])
+        self.assertEqual(bulk['1']['_rev'], '1-a')
+        self.assertNotIn('_rev', bulk['3'])
+        self.assertNotIn('_rev', bulk['4'])
+        self.assertEqual(results, [(True, '1', 'updated'),
+                                   (True, '2', 'updated'),
+                                   (True, '3', 'created'),
+                                   (True, '4', 'skipped')])
+
+    def test_doc_digest(self):
+        doc = {'_id': '1', 'id': '1', 'title': u'Тендер',
+               'dateModified': '2017-01-01T00:00:00'}
+        digest = doc_digest(doc)
+        doc.update({'_rev': '1-a', 'dateModified': '2017-01-02T00:00:00'})
+        doc['doc_digest'] = digest
+        self.assertEqual(doc_digest(doc), digest)
+        doc['title'] = u'Інший'
+        self.assertNotEqual(doc_digest(doc), digest)
+
+    @patch('openprocurement.bridge.basic.storages.couchdb_plugin.Server')
+    def test_save_bulk_skip_unchanged(self, mocked_server):
+        conf = deepcopy(self.storage_conf)
+        conf['storage']['skip_unchanged'] = True
+        db = CouchDBStorage(conf, 'tenders')
+        db.db = MagicMock()
+        bulk = {
+            '1': {'_id': '1', 'id': '1', 'status': 'active',
+                  'dateModified': '2017-01-02T00:00:00'},
+            '2': {'_id': '2', 'id': '2', 'status': 'complete',
+                  'dateModified': '2017-01-02T00:00:00'},
+            '3': {'_id': '3', 'id': '3', 'status': 'active',
+                  'dateModified': '2017-01-02T00:00:00'}
+        }
+        unchanged = doc_digest({'id': '1', 'status': 'active'})
+        db.db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': ['1-a', unchanged]}),
+            munchify({'id': '2', 'key': '2', 'value': ['1-b', unchanged]})
+        ]
+        db.db.update.return_value = [(True, '2', '2-b'), (True, '3', '1-c')]
+        db.confirmations_db = MagicMock()
+        db.confirmations_db.view.return_value = [
+            munchify({'key': '1', 'error': 'not_found', 'value': None,
+                      'doc': None})]
+        results = db.save_bulk(bulk)
+        self.assertEqual(db.db.view.call_args[0][0],
+                         '_design/tenders/_view/by_digest')
+        self.assertEqual(sorted(db.db.view.call_args[1]['keys']),
+                         ['1', '2', '3'])
+        # Unchanged doc isn't written to replicated database
+        saved = db.db.update.call_args[0][0]
+        self.assertEqual(sorted(doc['_id'] for doc in saved), ['2', '3'])
+        db.confirmations_db.update.assert_called_once_with(
+            [{'_id': '1', 'dateModified': '2017-01-02T00:00:00'}])
+        self.assertEqual(bulk['2']['_rev'], '1-b')
+        self.assertNotIn('_rev', bulk['3'])
+        self.assertEqual(bulk['3']['doc_digest'], doc_digest(bulk['3']))
+        self.assertEqual(results, [(True, '1', 'unchanged'),
+                                   (True, '2', 'updated'),
+                                   (True, '3', 'created')])
+
+        # Nothing to write, existing confirmation is updated
+        db.db.update.reset_mock()
+        db.confirmations_db.update.reset_mock()
+        bulk['1']['dateModified'] = '2017-01-03T00:00:00'
+        db.db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': ['1-a', unchanged]})]
+        db.confirmations_db.view.return_value = [
+            munchify({'id': '1', 'key': '1', 'value': {'rev': '1-d'},
+                      'doc': {'_id': '1', '_rev': '1-d',
+                              'dateModified': '2017-01-02T00:00:00'}})]
+        results = db.save_bulk({'1': bulk['1']})
+        self.assertEqual(results, [(True, '1', 'unchanged')])
+        self.assertEqual(db.db.update.call_count, 0)
+        db.confirmations_db.update.assert_called_once_with(
+            [{'_id': '1', '_rev': '1-d',
+              'dateModified': '2017-01-03T00:00:00'}])
+
+        # Failed confirmation only costs fetch after restart
+        db.confirmations_db.update.side_effect = Exception('conflict')
+        bulk['1']['dateModified'] = '2017-01-04T00:00:00'
+        results = db.save_bulk({'1': bulk['1']})
+        self.assertEqual(results, [(True, '1', 'unchanged')])
+
+    @patch('openprocurement.bridge.basic.storages.couchdb_plugin.Server')
+    def test_checkpoint(self, mocked_server):
+        db = CouchDBStorage(self.storage_conf, 'tenders')
+        db.db = MagicMock()
+        db.db.get.return_value = None
+        self.assertIs(db.get_checkpoint('feed_tenders_0'), None)
+        db.db.get.assert_called_once_with('_local/feed_tenders_0')
+
+        db.db.get.return_value = {'_id': '_local/feed_tenders_0'}
+        db.save_checkpoint('feed_tenders_0', {'forward_offset': '1'})
+        db.db.save.assert_called_once_with({
+            '_id': '_local/feed_tenders_0',
+            'state': {'forward_offset': '1'}
+        })
+        db.db.get.return_value = {'_id': '_local/feed_tenders_0',
+                                  'state': {'forward_offset': '1'}}
+        self.assertEqual(db.get_checkpoint('feed_tenders_0'),
+                         {'forward_offset': '1'})
+
+
+@patch('couchdb.http.HTTPConnection')
+class TestBoundedConnectionPool(unittest.TestCase):
+
+    url = 'http://127.0.0.1:5984/bridge_db'
+
+    def test_get_release(self, mocked_connection):
+        mocked_connection.side_effect = lambda *a, **kw: MagicMock()
+        pool = BoundedConnectionPool(None, size=2)
+        conn_1 = pool.get(self.url)
+        conn_2 = pool.get(self.url)
+        self.assertEqual(pool.utilization(), 1)
+
+        # Third greenlet waits for free connection
+        waiter = spawn(pool.get, self.url)
+        sleep(0)
+        self.assertFalse(waiter.ready())
+        pool.release(self.url, conn_1)
+        self.assertIs(waiter.get(timeout=1), conn_1)
+
+        # Double release is ignored
+        pool.release(self.url, conn_2)
+        pool.release(self.url, conn_2)
+        self.assertEqual(pool.utilization(), 0.5)
+        self.assertEqual(mocked_connection.call_count, 2)
+
+    def test_without_keep_alive(self, mocked_connection):
+        pool = BoundedConnectionPool(None, size=1, keep_alive=False)
+        conn = pool.get(self.url)
+        pool.release(self.url, conn)
+        conn.close.assert_called_once_with()
+        self.assertEqual(pool.conns.get(('http', '127.0.0.1:5984')), [])
+
+    def test_session_discards_failed_connection(self, mocked_connection):
+        session = PooledSession(pool_size=1, retry_delays=[])
+        conn = mocked_connection()
+        conn.getresponse.side_effect = IOError('connection reset')
+        with self.assertRaises(IOError):
+            session.request('GET', self.url)
+        conn.close.assert_called_once_with()
+        self.assertEqual(session.connection_pool.utilization(), 0)
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestCouchDBStorage))
+    suite.addTest(unittest.makeSuite(TestBoundedConnectionPool))
     return suite
 
 
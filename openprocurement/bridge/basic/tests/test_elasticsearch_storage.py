@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+import json
 import unittest
 from datetime import datetime
 from mock import patch
 from openprocurement.bridge.basic.storages.elasticsearch_plugin import \
-    ElasticsearchStorage, includme
+    ElasticsearchStorage, includme, date_modified_to_version, \
+    STORAGE_DEFAULTS
 
 
 class TestElasticsearchStorage(unittest.TestCase):
@@ -149,6 +151,176 @@ class TestElasticsearchStorage(unittest.TestCase):
         self.assertEqual([1, 1, 1, 1],
                          [created, updated, skipped, add_to_retry])
 
+    @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
+           'Elasticsearch')
+    def test_save_bulk_with_stored_versions(self, mocked_elastic):
+        mocked_elastic().indices.get_settings.return_value = {}
+        db = ElasticsearchStorage({}, 'tenders')
+        date_modified = datetime.now().isoformat()
+        db.db.mget.return_value = {'docs': [
+            {'_id': self.id_1, 'found': True, '_version': 3,
+             '_source': {'dateModified': date_modified}},
+            {'_id': self.id_2, 'found': True, '_version': 1,
+             '_source': {'dateModified': '2017-01-01T00:00:00+02:00'}}
+        ]}
+        db.db.bulk.return_value = {'items': [
+            {'index': {'status': 200, 'result': 'updated', '_id': self.id_2}}
+        ]}
+        bulk = {
+            self.id_1: {'_id': self.id_1, 'id': self.id_1,
+                        'dateModified': date_modified},
+            self.id_2: {'_id': self.id_2, 'id': self.id_2,
+                        'dateModified': date_modified}
+        }
+        results = db.save_bulk(bulk)
+        self.assertEqual(sorted(results), sorted([
+            (True, self.id_1, 'skipped'), (True, self.id_2, 'updated')]))
+        self.assertEqual(db.db.mget.call_count, 1)
+        body = [json.loads(line) for line in
+                db.db.bulk.call_args[1]['body'].splitlines()]
+        self.assertEqual(body[0]['index']['_id'], self.id_2)
+        self.assertEqual(body[0]['index']['_version'], 1)
+        self.assertNotIn('_ver', body[1])
+        self.assertNotIn('_id', body[1])
+
+        # Nothing to save
+        db.db.bulk.reset_mock()
+        results = db.save_bulk({self.id_1: bulk[self.id_1]})
+        self.assertEqual(results, [(True, self.id_1, 'skipped')])
+        self.assertEqual(db.db.bulk.call_count, 0)
+
+    @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
+           'Elasticsearch')
+    def test_save_bulk_chunks(self, mocked_elastic):
+        mocked_elastic().indices.get_settings.return_value = {}
+        db = ElasticsearchStorage({}, 'tenders')
+        db.bulk_chunk_size = 2
+        db.bulk_max_bytes = 10 * 1024 * 1024
+        db.db.mget.return_value = {'docs': []}
+        bulk = dict(('id{}'.format(i), {'_id': 'id{}'.format(i),
+                                        'id': 'id{}'.format(i),
+                                        'description': 'x' * 100})
+                    for i in xrange(5))
+
+        def bulk_response(body, doc_type, index):
+            ids = [json.loads(line)['index']['_id']
+                   for line in body.splitlines()[::2]]
+            if 'id0' in ids:
+                raise Exception('Request too large')
+            return {'items': [
+                {'index': {'status': 201, 'result': 'created', '_id': i}}
+                for i in ids]}
+
+        db.db.bulk.side_effect = bulk_response
+        results = db.save_bulk(bulk)
+        self.assertEqual(db.db.bulk.call_count, 3)
+        self.assertEqual(len(results), 5)
+        failed = [doc_id for success, doc_id, _ in results if not success]
+        # Only docs of failed chunk are marked as failed
+        self.assertIn('id0', failed)
+        self.assertEqual(len(failed), 2)
+
+        # Chunks limited by size
+        db.db.bulk.reset_mock()
+        db.db.bulk.side_effect = None
+        db.db.bulk.return_value = {'items': []}
+        db.bulk_chunk_size = 500
+        db.bulk_max_bytes = 300
+        db.save_bulk(bulk)
+        self.assertEqual(db.db.bulk.call_count, 5)
+
+    @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
+           'Elasticsearch')
+    def test_save_bulk_external_version(self, mocked_elastic):
+        mocked_elastic().indices.get_settings.return_value = {}
+        db = ElasticsearchStorage({}, 'tenders')
+        db.external_version = True
+        db.db.bulk.return_value = {'items': [
+            {'index': {'status': 201, 'result': 'created', '_id': self.id_1}},
+            {'index': {'status': 409, '_id': self.id_2, 'error': {
+                'type': 'version_conflict_engine_exception',
+                'reason': 'version conflict'}}},
+            {'index': {'status': 403, '_id': 'id_3', 'error': {
+                'reason': 'Forbidden'}}}
+        ]}
+        bulk = {
+            self.id_1: {'_id': self.id_1, 'id': self.id_1,
+                        'dateModified': '2017-01-01T00:00:00.000001+02:00'}
+        }
+        results = db.save_bulk(bulk)
+        # Stored versions aren't requested
+        self.assertEqual(db.db.mget.call_count, 0)
+        action = json.loads(
+            db.db.bulk.call_args[1]['body'].splitlines()[0])['index']
+        self.assertEqual(action['_version_type'], 'external')
+        self.assertEqual(action['_version'], 1483221600000001)
+        self.assertEqual(results[0], (True, self.id_1, 'created'))
+        self.assertEqual(results[1], (True, self.id_2, 'skipped'))
+        self.assertEqual(results[2], (False, 'id_3', 'Forbidden'))
+
+    def test_date_modified_to_version(self):
+        self.assertEqual(
+            date_modified_to_version('1970-01-01T00:00:01.5+00:00'),
+            1500000)
+        self.assertLess(
+            date_modified_to_version('2017-01-01T00:00:00.999999+02:00'),
+            date_modified_to_version('2017-01-01T00:00:01+02:00'))
+
+    @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
+           'Elasticsearch')
+    def test_backfill(self, mocked_elastic):
+        mocked_elastic().indices.get_settings.return_value = {}
+        mapping = {'dateModified': {'type': 'date'}}
+        db = ElasticsearchStorage(
+            {'storage': {'mapping': mapping,
+                         'backfill_settings': {'index.refresh_interval': '-1',
+                                               'index.number_of_replicas': 0}}},
+            'tenders')
+        # Storage config doesn't change module defaults
+        self.assertIsNone(STORAGE_DEFAULTS['mapping'])
+        self.assertIsNot(db.backfill_settings,
+                         STORAGE_DEFAULTS['backfill_settings'])
+        db.db.indices.put_mapping.assert_called_once_with(
+            index=db.db_name, doc_type='Tenders',
+            body={'properties': mapping})
+        self.assertIs(db.backfill, None)
+
+        # Not switched index keeps its settings
+        db.db.indices.put_settings.reset_mock()
+        db.stop_backfill()
+        self.assertIs(db.backfill, False)
+        self.assertEqual(db.db.indices.put_settings.call_count, 0)
+
+        db.db.indices.get_settings.return_value = {
+            db.db_name: {'settings': {'index.number_of_replicas': '2'}}}
+        db.start_backfill()
+        self.assertIs(db.backfill, True)
+        db.db.indices.get_settings.assert_called_with(
+            index=db.db_name,
+            name='index.number_of_replicas,index.refresh_interval',
+            flat_settings=True)
+        db.db.indices.put_settings.assert_called_with(
+            body={'index.refresh_interval': '-1',
+                  'index.number_of_replicas': 0},
+            index=db.db_name)
+        db.stop_backfill()
+        self.assertIs(db.backfill, False)
+        # Settings found before backfill are restored, not set one is reset
+        db.db.indices.put_settings.assert_called_with(
+            body={'index.refresh_interval': None,
+                  'index.number_of_replicas': '2'},
+            index=db.db_name)
+        db.db.indices.refresh.assert_called_once_with(index=db.db_name)
+
+        # Settings left by interrupted backfill are reset to defaults
+        db.db.indices.get_settings.return_value = {
+            db.db_name: {'settings': {'index.refresh_interval': '-1',
+                                      'index.number_of_replicas': '0'}}}
+        db.start_backfill()
+        self.assertEqual(db.live_settings,
+                         {'index.refresh_interval': None,
+                          'index.number_of_replicas': None})
+
     @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
            'Elasticsearch')
     def test_get_doc(self, mocked_elastic):
@@ -162,6 +334,29 @@ class TestElasticsearchStorage(unittest.TestCase):
         doc = db.get_doc(self.id_2)
         self.assertEqual(doc, {'id': self.id_2, '_ver': 1})
 
+    @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
+           'Elasticsearch')
+    def test_checkpoint(self, mocked_elastic):
+        mocked_elastic().indices.get_settings.return_value = {}
+        db = ElasticsearchStorage({}, 'tenders')
+        db.db.get.return_value = {'found': False}
+        self.assertIs(db.get_checkpoint('feed_tenders_0'), None)
+        db.db.get.return_value = {'_source': {'forward_offset': '1'}}
+        self.assertEqual(db.get_checkpoint('feed_tenders_0'),
+                         {'forward_offset': '1'})
+        db.db.get.assert_called_with(
+            index='bridge_db_checkpoints', doc_type='Checkpoint',
+            id='feed_tenders_0', ignore=[404])
+        db.db.indices.create.reset_mock()
+        db.save_checkpoint('feed_tenders_0', {'forward_offset': '2'})
+        db.save_checkpoint('feed_tenders_0', {'forward_offset': '3'})
+        # Separate index isn't covered by consumers alias
+        db.db.indices.create.assert_called_once_with(
+            index='bridge_db_checkpoints', ignore=400)
+        db.db.index.assert_called_with(
+            index='bridge_db_checkpoints', doc_type='Checkpoint',
+            id='feed_tenders_0', body={'forward_offset': '3'})
+
     @patch('openprocurement.bridge.basic.storages.elasticsearch_plugin.'
            'Elasticsearch')
     def test_includme(self, mocked_elastic):
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import MagicMock
+from openprocurement.bridge.basic.metrics import Registry
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_counter_gauge(self):
+        registry = Registry()
+        counter = registry.counter('items_total', 'Items.')
+        self.assertIs(registry.counter('items_total', 'Items.'), counter)
+        with self.assertRaises(ValueError):
+            registry.gauge('items_total', 'Items.')
+        counter.inc()
+        counter.inc(2, result='hit')
+        self.assertEqual(counter.get(), 1)
+        self.assertEqual(counter.get(result='hit'), 2)
+        gauge = registry.gauge('queue_size', 'Queue size.')
+        gauge.set(5, queue='main')
+        gauge.dec(queue='main')
+        self.assertEqual(gauge.get(queue='main'), 4)
+        self.assertEqual(registry.expose(), '\n'.join([
+            '# HELP items_total Items.',
+            '# TYPE items_total counter',
+            'items_total 1.0',
+            'items_total{result="hit"} 2.0',
+            '# HELP queue_size Queue size.',
+            '# TYPE queue_size gauge',
+            'queue_size{queue="main"} 4.0'
+        ]) + '\n')
+
+    def test_histogram(self):
+        registry = Registry()
+        histogram = registry.histogram('duration', 'Duration.',
+                                       buckets=(0.1, 1))
+        histogram.observe(0.05, client='1')
+        histogram.observe(0.5, client='1')
+        histogram.observe(5, client='1')
+        self.assertEqual(histogram.get(client='1')['count'], 3)
+        self.assertEqual(registry.expose(), '\n'.join([
+            '# HELP duration Duration.',
+            '# TYPE duration histogram',
+            'duration_bucket{client="1",le="0.1"} 1.0',
+            'duration_bucket{client="1",le="1.0"} 2.0',
+            'duration_bucket{client="1",le="+Inf"} 3.0',
+            'duration_sum{client="1"} 5.55',
+            'duration_count{client="1"} 3.0'
+        ]) + '\n')
+        histogram.remove(client='1')
+        self.assertIs(histogram.get(client='1'), None)
+
+    def test_wsgi_app(self):
+        registry = Registry()
+        registry.counter('items_total', 'Items.').inc()
+        start_response = MagicMock()
+        body = registry.wsgi_app({'PATH_INFO': '/metrics'}, start_response)
+        self.assertIn('items_total 1.0', body[0])
+        self.assertEqual(start_response.call_args[0][0], '200 OK')
+        registry.wsgi_app({'PATH_INFO': '/other'}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '404 Not Found')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRegistry))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
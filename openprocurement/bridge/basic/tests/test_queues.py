@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import unittest
+from gevent import sleep, spawn
+from gevent.queue import Empty
+from openprocurement.bridge.basic.queues import (
+    ClientScheduler,
+    RetryQueue,
+    StreamQueues
+)
+
+
+class TestRetryQueue(unittest.TestCase):
+
+    def test_put_get_by_due_time(self):
+        queue = RetryQueue()
+        queue.put({'id': '1', 'dateModified': '2017-01-01'}, delay=0.2)
+        queue.put({'id': '2', 'dateModified': '2017-01-01'}, delay=0.1)
+        self.assertEqual(queue.qsize(), 2)
+        self.assertTrue(queue.empty())
+        with self.assertRaises(Empty):
+            queue.get_nowait()
+        with self.assertRaises(Empty):
+            queue.get(timeout=0.01)
+        self.assertEqual(queue.get()['id'], '2')
+        self.assertEqual(queue.get()['id'], '1')
+        self.assertEqual(queue.qsize(), 0)
+        self.assertEqual(queue.oldest_due_age(), 0)
+
+    def test_dedup_keeps_newest(self):
+        queue = RetryQueue()
+        queue.put({'id': '1', 'dateModified': '2017-01-02'}, delay=0.1)
+        # Older item ignored
+        queue.put({'id': '1', 'dateModified': '2017-01-01'})
+        self.assertEqual(queue.qsize(), 1)
+        self.assertTrue(queue.empty())
+        # Newer item replaces pending one
+        queue.put({'id': '1', 'dateModified': '2017-01-03'}, delay=1)
+        self.assertEqual(queue.qsize(), 1)
+        item = queue.get(timeout=0.5)
+        self.assertEqual(item['dateModified'], '2017-01-03')
+        self.assertEqual(queue.qsize(), 0)
+        self.assertTrue(queue.empty())
+
+    def test_maxsize(self):
+        queue = RetryQueue(1)
+        self.assertTrue(queue.put({'id': '1', 'dateModified': '1'}))
+        self.assertTrue(queue.full())
+        self.assertFalse(queue.put({'id': '2', 'dateModified': '1'}))
+        self.assertTrue(queue.put({'id': '1', 'dateModified': '2'}))
+        self.assertEqual(queue.qsize(), 1)
+
+    def test_get_wakes_on_put(self):
+        queue = RetryQueue()
+        getter = spawn(queue.get)
+        sleep(0.01)
+        queue.put({'id': '1', 'dateModified': '1'})
+        self.assertEqual(getter.get(timeout=1)['id'], '1')
+
+    def test_due_count(self):
+        queue = RetryQueue()
+        self.assertEqual(queue.due_count(), 0)
+        for i in xrange(5):
+            queue.put({'id': str(i), 'dateModified': '1'},
+                      delay=0 if i % 2 else 10)
+        # Replaced item is counted once
+        queue.put({'id': '1', 'dateModified': '2'}, delay=10)
+        self.assertEqual(queue.qsize(), 5)
+        self.assertEqual(queue.due_count(), 2)
+        queue.get_nowait()
+        self.assertEqual(queue.due_count(), 1)
+
+    def test_oldest_due_age(self):
+        queue = RetryQueue()
+        queue.put({'id': '1', 'dateModified': '1'})
+        sleep(0.05)
+        self.assertFalse(queue.empty())
+        self.assertGreaterEqual(queue.oldest_due_age(), 0.05)
+
+
+class TestClientScheduler(unittest.TestCase):
+
+    def test_prefers_fast_clients(self):
+        scheduler = ClientScheduler()
+        clients = [{'id': str(i)} for i in xrange(4)]
+        for client in clients:
+            scheduler.put(client)
+        self.assertEqual(scheduler.qsize(), 4)
+        scheduler.observe('0', 0.01)
+        scheduler.observe('1', 0.01)
+        scheduler.observe('2', 0.5)
+        scheduler.observe('3', 0.1, failed=True)
+        self.assertGreater(scheduler.score('3'), scheduler.score('2'))
+        self.assertEqual(scheduler.score('unknown'), 0)
+
+        # Worst client never wins a pair, so it is taken last
+        taken = [scheduler.get()['id'] for _ in xrange(3)]
+        self.assertNotIn('3', taken)
+        self.assertEqual(scheduler.get_nowait()['id'], '3')
+        self.assertTrue(scheduler.empty())
+        with self.assertRaises(Empty):
+            scheduler.get(timeout=0.01)
+
+        for client in clients:
+            scheduler.put(client)
+        self.assertEqual(scheduler.get(slowest=True)['id'], '3')
+        scheduler.forget('3')
+        self.assertEqual(scheduler.score('3'), 0)
+
+    def test_moving_average(self):
+        scheduler = ClientScheduler(alpha=0.5)
+        scheduler.observe('1', 1.0)
+        scheduler.observe('1', 0.0, failed=True)
+        self.assertEqual(scheduler.stats['1'], [0.5, 0.5])
+
+    def test_backoff(self):
+        scheduler = ClientScheduler()
+        scheduler.put({'id': '1'}, delay=0.05)
+        self.assertEqual(scheduler.qsize(), 1)
+        self.assertTrue(scheduler.empty())
+        with self.assertRaises(Empty):
+            scheduler.get_nowait()
+        getter = spawn(scheduler.get)
+        sleep(0.01)
+        self.assertFalse(getter.ready())
+        self.assertEqual(getter.get(timeout=1)['id'], '1')
+        self.assertEqual(scheduler.qsize(), 0)
+
+
+class TestStreamQueues(unittest.TestCase):
+
+    def fill(self, queues, count):
+        for i in xrange(count):
+            queues.put({'id': str(i), 'stream': 'forward'})
+            queues.put({'id': str(i), 'stream': 'backward'})
+
+    def test_weights(self):
+        queues = StreamQueues((('forward', 2), ('backward', 1)))
+        self.fill(queues, 4)
+        self.assertEqual(queues.qsize(), 8)
+        self.assertEqual(queues.queues['forward'].qsize(), 4)
+        self.assertEqual(
+            [queues.get()['stream'] for _ in xrange(6)],
+            ['forward', 'backward', 'forward'] * 2)
+        # Only backward items left
+        self.assertEqual([queues.get()['stream'] for _ in xrange(2)],
+                         ['backward', 'backward'])
+        self.assertTrue(queues.empty())
+        with self.assertRaises(Empty):
+            queues.get(timeout=0.01)
+
+        # Item without stream goes to first one
+        queues.put({'id': '1'})
+        self.assertEqual(queues.queues['forward'].qsize(), 1)
+
+    def test_strict_priority(self):
+        queues = StreamQueues((('forward', 1), ('backward', 0)))
+        self.fill(queues, 3)
+        self.assertEqual([queues.get()['stream'] for _ in xrange(6)],
+                         ['forward'] * 3 + ['backward'] * 3)
+
+    def test_downstream(self):
+        downstream = StreamQueues((('forward', 10), ('backward', 1)),
+                                  maxsize=1)
+        queues = StreamQueues((('forward', 10), ('backward', 1)),
+                              downstream=downstream)
+        downstream.put({'id': '1', 'stream': 'backward'})
+        queues.put({'id': '2', 'stream': 'backward'})
+        # Backward stream waits for free slot in downstream
+        with self.assertRaises(Empty):
+            queues.get_nowait()
+        getter = spawn(queues.get)
+        queues.put({'id': '3', 'stream': 'forward'})
+        self.assertEqual(getter.get(timeout=1)['id'], '3')
+        downstream.get()
+        self.assertEqual(queues.get(timeout=1)['id'], '2')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRetryQueue))
+    suite.addTest(unittest.makeSuite(TestClientScheduler))
+    suite.addTest(unittest.makeSuite(TestStreamQueues))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import patch
+from openprocurement.bridge.basic.metrics import RATE_LIMIT
+from openprocurement.bridge.basic.ratelimit import (
+    GLOBAL_BUCKET,
+    RateLimiter,
+    TokenBucket
+)
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch('openprocurement.bridge.basic.ratelimit.monotonic',
+                        self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reserve(self):
+        bucket = TokenBucket(2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        # Reservations in debt wait in order
+        self.assertEqual(bucket.reserve(), 0.5)
+        self.assertEqual(bucket.reserve(), 1.0)
+        self.clock.now += 10
+        # Refill is limited by capacity
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_aimd(self):
+        bucket = TokenBucket(10, min_rate=1)
+        self.assertTrue(bucket.decrease(0.5))
+        self.assertEqual(bucket.rate, 5)
+        # Burst of failures decreases rate once
+        self.assertFalse(bucket.decrease(0.5))
+        self.assertEqual(bucket.rate, 5)
+        self.clock.now += 1
+        self.assertTrue(bucket.decrease(0.1))
+        self.assertEqual(bucket.rate, 1)
+
+        # Rate grows by step per second of successful requests: 1 + 1 + 1/2
+        bucket.increase(1.0)
+        bucket.increase(1.0)
+        self.assertEqual(bucket.rate, 2.5)
+        for _ in xrange(1000):
+            bucket.increase(1.0)
+        self.assertEqual(bucket.rate, 10)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch('openprocurement.bridge.basic.ratelimit.monotonic',
+                        self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('openprocurement.bridge.basic.ratelimit.sleep')
+    def test_acquire(self, mocked_sleep):
+        limiter = RateLimiter(rate=10, client_rate=1)
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertEqual(limiter.acquire('b'), 0)
+        # Client bucket is empty
+        self.assertEqual(limiter.acquire('a'), 1.0)
+        mocked_sleep.assert_called_once_with(1.0)
+        self.assertEqual(sorted(limiter.get_rates()), ['a', 'b', 'global'])
+
+        limiter = RateLimiter()
+        self.assertEqual(limiter.acquire('a'), 0)
+        self.assertEqual(limiter.get_rates(), {})
+
+    def test_throttle_and_recover(self):
+        limiter = RateLimiter(rate=8, client_rate=4, min_rate=1)
+        limiter.acquire('a')
+        limiter.on_throttle('a')
+        self.assertEqual(limiter.get_rates(), {'a': 2, GLOBAL_BUCKET: 4})
+        self.assertEqual(RATE_LIMIT.get(bucket='a'), 2)
+        for _ in xrange(100):
+            limiter.on_success('a', 0.1)
+        self.assertEqual(limiter.get_rates(), {'a': 4, GLOBAL_BUCKET: 8})
+
+        limiter.remove_client('a')
+        self.assertEqual(limiter.get_rates(), {GLOBAL_BUCKET: 8})
+        self.assertEqual(RATE_LIMIT.get(bucket='a'), 0)
+
+    def test_latency(self):
+        limiter = RateLimiter(rate=8, latency_threshold=1)
+        limiter.on_success('a', 0.5)
+        self.assertEqual(limiter.get_rates(), {GLOBAL_BUCKET: 8})
+        limiter.on_success('a', 2)
+        self.assertEqual(limiter.get_rates(), {GLOBAL_BUCKET: 4})
+
+
+def suite():
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.makeSuite(TestTokenBucket))
+    tests.addTest(unittest.makeSuite(TestRateLimiter))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
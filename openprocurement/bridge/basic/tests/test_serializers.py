@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import json
+import sys
+import types
+import unittest
+from mock import patch
+from openprocurement.bridge.basic import serializers
+from openprocurement.bridge.basic.benchmarks.serializers import (
+    measure,
+    tender_document
+)
+from openprocurement.bridge.basic.serializers import (
+    Serializer,
+    get_serializer,
+    install_client_serializer
+)
+from openprocurement.bridge.basic.utils import DataBridgeConfigError
+
+
+class TestSerializers(unittest.TestCase):
+
+    def test_get_serializer(self):
+        serializer = get_serializer()
+        self.assertEqual(serializer.name, 'json')
+        doc = tender_document(lots=1, items=1, bids=1, documents=1)
+        self.assertEqual(serializer.loads(serializer.dumps(doc)), doc)
+
+        with self.assertRaises(DataBridgeConfigError):
+            get_serializer('yaml')
+
+    @patch.object(serializers, 'ujson', None)
+    @patch.object(serializers, 'simplejson', None)
+    def test_auto_fallback(self):
+        self.assertEqual(get_serializer('auto').name, 'json')
+        with self.assertRaises(DataBridgeConfigError):
+            get_serializer('ujson')
+        with self.assertRaises(DataBridgeConfigError):
+            get_serializer('simplejson')
+
+    def test_auto_prefers_fastest(self):
+        fake_ujson = types.ModuleType('ujson')
+        fake_ujson.dumps = lambda obj, **kwargs: json.dumps(obj)
+        fake_ujson.loads = json.loads
+        with patch.object(serializers, 'ujson', fake_ujson):
+            serializer = get_serializer('auto')
+        self.assertEqual(serializer.name, 'ujson')
+        self.assertEqual(serializer.loads(serializer.dumps({'a': 1})),
+                         {'a': 1})
+
+    def test_install_client_serializer(self):
+        module = types.ModuleType('openprocurement_client.clients')
+        module.loads = json.loads
+        serializer = Serializer('test', json.dumps, lambda s: 'decoded')
+        with patch.dict(sys.modules, {
+                'openprocurement_client': types.ModuleType(
+                    'openprocurement_client'),
+                'openprocurement_client.clients': module,
+                'openprocurement_client.api_base_client': None}):
+            patched = install_client_serializer(serializer)
+        self.assertEqual(patched, ['openprocurement_client.clients'])
+        self.assertEqual(module.loads('{}'), 'decoded')
+
+    def test_benchmark_measure(self):
+        docs = [tender_document(lots=2, items=2, bids=2, documents=2)]
+        size, encode, decode = measure(get_serializer(), docs, 1)
+        self.assertGreater(size, 0)
+        self.assertGreater(encode, 0)
+        self.assertGreater(decode, 0)
+
+
+def suite():
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.makeSuite(TestSerializers))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import patch
+from openprocurement.bridge.basic.stats import LatencyWindow, percentile
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLatencyWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch('openprocurement.bridge.basic.stats.monotonic',
+                        self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_window(self):
+        window = LatencyWindow(10, size=100)
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.mean(), 0)
+        self.assertEqual(window.stdev(), 0)
+        self.assertEqual(window.percentile(95), 0)
+        self.assertEqual(window.age(), 0)
+
+        for value in (1, 2, 3, 4):
+            window.add(value)
+            self.clock.now += 3
+        # First sample expired
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.samples(), [2, 3, 4])
+        self.assertEqual(window.mean(), 3)
+        self.assertAlmostEqual(window.stdev(), 0.8165, places=4)
+        self.assertEqual(window.percentile(50), 3)
+        self.assertEqual(window.age(), 12)
+
+        self.clock.now += 100
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.mean(), 0)
+        self.assertEqual(window.age(), 112)
+
+        window.add(5)
+        window.clear()
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.age(), 0)
+
+    def test_size(self):
+        window = LatencyWindow(10, size=3)
+        for value in xrange(10):
+            window.add(value)
+        self.assertEqual(window.samples(), [7, 8, 9])
+        self.assertEqual(window.mean(), 8)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 99), 0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertEqual(percentile(range(101), 95), 95)
+
+
+def suite():
+    tests = unittest.TestSuite()
+    tests.addTest(unittest.makeSuite(TestLatencyWindow))
+    return tests
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
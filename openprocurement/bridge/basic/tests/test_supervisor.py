@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import sys
+import unittest
+from mock import MagicMock, patch
+from time import time
+from openprocurement.bridge.basic.metrics import SHARDS_STATUS
+from openprocurement.bridge.basic.supervisor import BridgeSupervisor
+
+
+class TestBridgeSupervisor(unittest.TestCase):
+
+    config = {'main': {'shards_count': 2, 'watch_interval': 0.1}}
+
+    def test_init(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        self.assertEqual(supervisor.shards_count, 2)
+        self.assertEqual([s.index for s in supervisor.shards], [0, 1])
+        self.assertEqual(
+            supervisor._shard_args(supervisor.shards[1], 5)[-4:],
+            ['--shard-index', '1', '--status-fd', '5'])
+
+    @patch('openprocurement.bridge.basic.supervisor.spawn')
+    @patch('openprocurement.bridge.basic.supervisor.Popen')
+    def test_start_shard(self, mocked_popen, mocked_spawn):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        shard = supervisor.shards[0]
+        supervisor.start_shard(shard)
+        self.assertIs(shard.process, mocked_popen.return_value)
+        self.assertEqual(mocked_popen.call_args[0][0][-2:],
+                         ['--status-fd', '0'])
+        kwargs = mocked_popen.call_args[1]
+        self.assertTrue(kwargs['close_fds'])
+        # Status pipe write end is shard stdin and is closed in supervisor
+        with self.assertRaises(OSError):
+            os.fstat(kwargs['stdin'])
+        self.assertEqual(kwargs['env']['PYTHONPATH'].split(os.pathsep),
+                         [path for path in sys.path if path])
+        mocked_spawn.assert_called_once_with(supervisor._read_status, shard,
+                                             shard.status_fd)
+        os.close(shard.status_fd)
+
+    def test_read_status(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        shard = supervisor.shards[0]
+        read_fd, write_fd = os.pipe()
+        status = {'input_queue_size': 3, 'shard_index': 0}
+        os.write(write_fd, 'invalid\n' + json.dumps(status) + '\n')
+        os.close(write_fd)
+        supervisor._read_status(shard, read_fd)
+        self.assertEqual(shard.status, status)
+        self.assertGreater(shard.updated, 0)
+
+    def test_check_shards(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        supervisor.start_shard = MagicMock()
+        for shard in supervisor.shards:
+            shard.process = MagicMock()
+            shard.process.poll.return_value = None
+        supervisor.shards[1].process.poll.return_value = 1
+        supervisor.check_shards()
+        supervisor.start_shard.assert_called_once_with(supervisor.shards[1])
+        self.assertEqual(supervisor.shards[1].restarts, 1)
+
+    def test_aggregate_status(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        supervisor.shards[0].status = {'input_queue_size': 3,
+                                       'received_from_sync': 10,
+                                       'retry_oldest_due_age': 1.5}
+        supervisor.shards[0].updated = time()
+        supervisor.shards[1].status = {'input_queue_size': 2,
+                                       'received_from_sync': 5,
+                                       'retry_oldest_due_age': 0.5}
+        supervisor.shards[1].updated = time() - 1
+        aggregated = supervisor.aggregate_status()
+        self.assertEqual(aggregated['input_queue_size'], 5)
+        self.assertEqual(aggregated['received_from_sync'], 15)
+        self.assertEqual(aggregated['retry_oldest_due_age'], 1.5)
+        self.assertEqual(aggregated['healthy_shards'], 1)
+        self.assertEqual(aggregated['restarts'], 0)
+
+    def test_watcher(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        supervisor.check_shards = MagicMock()
+        supervisor.shards[0].status = {'input_queue_size': 3}
+        supervisor.shards[0].updated = time()
+        supervisor.watcher()
+        # Aggregated status is served by supervisor metrics endpoint
+        self.assertEqual(SHARDS_STATUS.get(key='input_queue_size'), 3)
+        self.assertEqual(SHARDS_STATUS.get(key='healthy_shards'), 1)
+
+    @patch('openprocurement.bridge.basic.supervisor.start_metrics_server')
+    @patch('openprocurement.bridge.basic.supervisor.signal')
+    def test_run_metrics_server(self, mocked_signal, mocked_server):
+        config = {'main': dict(self.config['main'], metrics_port=9100)}
+        supervisor = BridgeSupervisor('bridge.yaml', config)
+        supervisor.start_shard = MagicMock()
+        supervisor.exit = True
+        supervisor.run()
+        mocked_server.assert_called_once_with('127.0.0.1', 9100)
+        self.assertEqual(supervisor.start_shard.call_count, 2)
+
+    def test_shutdown(self):
+        supervisor = BridgeSupervisor('bridge.yaml', self.config)
+        for shard in supervisor.shards:
+            shard.process = MagicMock()
+            shard.process.poll.return_value = None
+        supervisor.shutdown()
+        self.assertTrue(supervisor.exit)
+        for shard in supervisor.shards:
+            shard.process.terminate.assert_called_once_with()
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBridgeSupervisor))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
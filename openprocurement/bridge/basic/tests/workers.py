@@ -14,7 +14,15 @@ from openprocurement_client.exceptions import (
     ResourceNotFound as RNF,
     ResourceGone
 )
-from openprocurement.bridge.basic.workers import ResourceItemWorker, TZ
+from openprocurement.bridge.basic.cache import DateModifiedIndex, PendingItems
+from openprocurement.bridge.basic.metrics import RETRIES
+from openprocurement.bridge.basic.queues import ClientScheduler, RetryQueue
+from openprocurement.bridge.basic.stats import LatencyWindow
+from openprocurement.bridge.basic.workers import (
+    BulkWriter,
+    ResourceItemWorker,
+    TZ
+)
 from openprocurement.bridge.basic.storages.couchdb_plugin import CouchDBStorage
 
 class TestResourceItemWorker(unittest.TestCase):
@@ -58,7 +66,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.update_doc, False)
 
     def test_add_to_retry_queue(self):
-        retry_items_queue = Queue()
+        retry_items_queue = RetryQueue()
         worker = ResourceItemWorker(
             config_dict=self.worker_config,
             retry_resource_items_queue=retry_items_queue)
@@ -85,12 +93,75 @@ class TestResourceItemWorker(unittest.TestCase):
                          worker.config['retry_default_timeout'] * 2)
 
         # Drop from retry_resource_items_queue
+        dropped = RETRIES.get(result='dropped')
         retry_item['retries_count'] = 3
         worker.add_to_retry_queue(retry_item)
         self.assertEqual(retry_items_queue.qsize(), 0)
+        self.assertEqual(RETRIES.get(result='dropped'), dropped + 1)
 
         del worker
 
+    def test_add_to_retry_queue_pending(self):
+        retry_items_queue = RetryQueue()
+        pending_items = PendingItems()
+        worker = ResourceItemWorker(
+            resource_items_queue=retry_items_queue,
+            config_dict=self.worker_config,
+            retry_resource_items_queue=retry_items_queue,
+            pending_items=pending_items)
+        retry_item = {
+            'id': uuid.uuid4().hex,
+            'dateModified': datetime.datetime.utcnow().isoformat(),
+        }
+        worker.add_to_retry_queue(retry_item)
+        self.assertIn(retry_item['id'], pending_items)
+
+        # Item from feed is merged into pending retry
+        new_date_modified = datetime.datetime.utcnow().isoformat()
+        self.assertFalse(pending_items.add(
+            {'id': retry_item['id'], 'dateModified': new_date_modified}))
+        sleep(worker.config['retry_default_timeout'] * 2)
+        resource_item = worker._get_resource_item_from_queue()
+        self.assertEqual(resource_item['dateModified'], new_date_modified)
+        self.assertNotIn(retry_item['id'], pending_items)
+
+        # Retry of item which is queued again is skipped
+        scheduled = RETRIES.get(result='scheduled')
+        pending_items.add({'id': retry_item['id'],
+                           'dateModified': new_date_modified})
+        worker.add_to_retry_queue(resource_item)
+        self.assertEqual(retry_items_queue.qsize(), 0)
+        self.assertEqual(RETRIES.get(result='scheduled'), scheduled)
+        self.assertEqual(pending_items.saved, 2)
+
+    def test_add_to_retry_queue_done(self):
+        retry_items_queue = RetryQueue()
+        pending_items = PendingItems()
+        worker = ResourceItemWorker(
+            config_dict=self.worker_config,
+            retry_resource_items_queue=retry_items_queue,
+            pending_items=pending_items)
+        item = {'id': uuid.uuid4().hex,
+                'dateModified': datetime.datetime.utcnow().isoformat()}
+        pending_items.add(item)
+        snapshot = pending_items.snapshot()
+
+        # Item failed on fetch waits in retry queue
+        pending_items.discard(item['id'], item)
+        worker.add_to_retry_queue(item)
+        self.assertFalse(pending_items.drained(snapshot))
+        retry_item = retry_items_queue.get(timeout=1)
+        pending_items.discard(retry_item['id'], retry_item)
+        self.assertFalse(pending_items.drained(snapshot))
+
+        # Dropped after last retry
+        retry_item = worker._retry_item(retry_item)
+        self.assertEqual(retry_item['retries_count'], 1)
+        retry_item['retries_count'] = worker.config['retries_count']
+        worker.add_to_retry_queue(retry_item)
+        self.assertTrue(pending_items.drained(snapshot))
+        self.assertEqual(pending_items.units, {})
+
     @patch('openprocurement.bridge.basic.workers.logger')
     @patch('openprocurement.bridge.basic.workers.datetime')
     def test_log_timeshift(self, mocked_datetime, mocked_logger):
@@ -124,12 +195,14 @@ class TestResourceItemWorker(unittest.TestCase):
             client_dict['id']: {
                 'drop_cookies': False,
                 'not_actual_count': 5,
-                'request_interval': 3
+                'request_interval': 3,
+                'request_durations': LatencyWindow(1)
             },
             client_dict2['id']: {
                 'drop_cookies': True,
                 'not_actual_count': 3,
-                'request_interval': 2
+                'request_interval': 2,
+                'request_durations': LatencyWindow(1)
             }
         }
 
@@ -199,8 +272,9 @@ class TestResourceItemWorker(unittest.TestCase):
         }
         api_clients_queue.put(client_dict)
         api_clients_info =\
-            {client_dict['id']: {'drop_cookies': False, 'request_durations': {}}}
-        retry_queue = Queue()
+            {client_dict['id']: {'drop_cookies': False,
+                                 'request_durations': LatencyWindow(1)}}
+        retry_queue = MagicMock()
         return_dict = {
             'data': {
                 'id': item['id'],
@@ -219,7 +293,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(api_client['request_interval'], 0.02)
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
         public_item = worker._get_resource_item_from_public(api_client, item)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 0)
+        self.assertEqual(retry_queue.put.call_count, 0)
         self.assertEqual(public_item, return_dict['data'])
 
         # Not actual document form public
@@ -230,19 +304,19 @@ class TestResourceItemWorker(unittest.TestCase):
         public_item = worker._get_resource_item_from_public(api_client, item)
         self.assertEqual(public_item, None)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 1)
+        self.assertEqual(retry_queue.put.call_count, 1)
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
 
         # InvalidResponse
         mock_api_client.get_resource_item.side_effect =\
             InvalidResponse('invalid response')
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 1)
+        self.assertEqual(retry_queue.put.call_count, 1)
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
         public_item = worker._get_resource_item_from_public(api_client, item)
         self.assertEqual(public_item, None)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 2)
+        self.assertEqual(retry_queue.put.call_count, 2)
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
 
         # RequestFailed status_code=429
@@ -254,7 +328,7 @@ class TestResourceItemWorker(unittest.TestCase):
         public_item = worker._get_resource_item_from_public(api_client, item)
         self.assertEqual(public_item, None)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 3)
+        self.assertEqual(retry_queue.put.call_count, 3)
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
@@ -269,7 +343,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(public_item, None)
         self.assertEqual(api_client['request_interval'], 0)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 4)
+        self.assertEqual(retry_queue.put.call_count, 4)
 
         # RequestFailed with status_code not equal 429
         mock_api_client.get_resource_item.side_effect = RequestFailed(
@@ -281,7 +355,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
         self.assertEqual(api_client['request_interval'], 0)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 5)
+        self.assertEqual(retry_queue.put.call_count, 5)
 
         # ResourceNotFound
         mock_api_client.get_resource_item.side_effect = RNF(
@@ -293,7 +367,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
         self.assertEqual(api_client['request_interval'], 0)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 6)
+        self.assertEqual(retry_queue.put.call_count, 6)
 
         # ResourceGone
         mock_api_client.get_resource_item.side_effect = ResourceGone(munchify(
@@ -306,7 +380,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
         self.assertEqual(api_client['request_interval'], 0)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 6)
+        self.assertEqual(retry_queue.put.call_count, 6)
 
         # Exception
         api_client = worker._get_api_client_dict()
@@ -316,24 +390,192 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(public_item, None)
         self.assertEqual(api_client['request_interval'], 0)
         sleep(worker.config['retry_default_timeout'] * 2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 7)
+        self.assertEqual(retry_queue.put.call_count, 7)
 
         del worker
 
+    def test__get_resource_item_from_public_with_rate_limiter(self):
+        item = {
+            'id': uuid.uuid4().hex,
+            'dateModified': datetime.datetime.utcnow().isoformat()
+        }
+        api_clients_queue = Queue()
+        client_dict = {
+            'id': uuid.uuid4().hex,
+            'request_interval': 0,
+            'client': MagicMock()
+        }
+        api_clients_info =\
+            {client_dict['id']: {'drop_cookies': False,
+                                 'request_durations': LatencyWindow(1)}}
+        rate_limiter = MagicMock()
+        client_dict['client'].get_resource_item.return_value = {
+            'data': {'id': item['id'], 'dateModified': item['dateModified']}}
+        worker = ResourceItemWorker(api_clients_queue=api_clients_queue,
+                                    config_dict=self.worker_config,
+                                    retry_resource_items_queue=MagicMock(),
+                                    api_clients_info=api_clients_info,
+                                    rate_limiter=rate_limiter)
+        public_item = worker._get_resource_item_from_public(client_dict, item)
+        self.assertEqual(public_item['id'], item['id'])
+        rate_limiter.acquire.assert_called_once_with(client_dict['id'])
+        self.assertEqual(rate_limiter.on_success.call_args[0][0],
+                         client_dict['id'])
+
+        # 429 slows down limiter, client returned without delay
+        client_dict['client'].get_resource_item.side_effect = RequestFailed(
+            munchify({'status_code': 429}))
+        api_client = worker._get_api_client_dict()
+        public_item = worker._get_resource_item_from_public(api_client, item)
+        self.assertIsNone(public_item)
+        rate_limiter.on_throttle.assert_called_once_with(client_dict['id'])
+        self.assertEqual(api_client['request_interval'], 0)
+        self.assertEqual(worker.api_clients_queue.qsize(), 1)
+
+    def test__get_resource_item_from_public_with_client_scheduler(self):
+        item = {
+            'id': uuid.uuid4().hex,
+            'dateModified': datetime.datetime.utcnow().isoformat()
+        }
+        scheduler = ClientScheduler()
+        client_dict = {
+            'id': uuid.uuid4().hex,
+            'request_interval': 0,
+            'client': MagicMock()
+        }
+        api_clients_info =\
+            {client_dict['id']: {'drop_cookies': False,
+                                 'request_durations': LatencyWindow(1)}}
+        client_dict['client'].get_resource_item.return_value = {
+            'data': {'id': item['id'], 'dateModified': item['dateModified']}}
+        worker = ResourceItemWorker(api_clients_queue=scheduler,
+                                    config_dict=self.worker_config,
+                                    retry_resource_items_queue=MagicMock(),
+                                    api_clients_info=api_clients_info)
+        worker._get_resource_item_from_public(client_dict, item)
+        self.assertEqual(scheduler.stats[client_dict['id']][1], 0)
+        self.assertEqual(scheduler.qsize(), 1)
+
+        # 429 backoff delays client in scheduler
+        client_dict['client'].get_resource_item.side_effect = RequestFailed(
+            munchify({'status_code': 429}))
+        api_client = scheduler.get()
+        worker._get_resource_item_from_public(api_client, item)
+        self.assertGreater(scheduler.stats[client_dict['id']][1], 0)
+        self.assertEqual(scheduler.qsize(), 1)
+        self.assertTrue(scheduler.empty())
+        self.assertEqual(scheduler.get(timeout=1), client_dict)
+
+    def test__get_resource_items_from_queue(self):
+        items_queue = Queue()
+        items = [{'id': uuid.uuid4().hex,
+                  'dateModified': datetime.datetime.utcnow().isoformat()}
+                 for _ in xrange(3)]
+        for item in items:
+            items_queue.put(item)
+        config = deepcopy(self.worker_config)
+        config['fetch_batch_size'] = 2
+        worker = ResourceItemWorker(resource_items_queue=items_queue,
+                                    config_dict=config)
+        self.assertEqual(worker._get_resource_items_from_queue(), items[:2])
+        self.assertEqual(worker._get_resource_items_from_queue(), items[2:])
+        self.assertEqual(worker._get_resource_items_from_queue(), [])
+
+    def test__get_resource_items_from_public(self):
+        items = [{'id': uuid.uuid4().hex,
+                  'dateModified': datetime.datetime.utcnow().isoformat()}
+                 for _ in xrange(3)]
+        api_clients_queue = Queue()
+        client = MagicMock()
+        client_dict = {
+            'id': uuid.uuid4().hex,
+            'request_interval': 0,
+            'client': client
+        }
+        api_clients_info = {
+            client_dict['id']: {'drop_cookies': False,
+                                'request_durations': LatencyWindow(1)}
+        }
+        retry_queue = RetryQueue()
+        client.get_resource_item.side_effect = [
+            {'data': items[0]},
+            RequestFailed(munchify({'status_code': 429})),
+            {'data': items[2]}
+        ]
+        worker = ResourceItemWorker(api_clients_queue=api_clients_queue,
+                                    config_dict=self.worker_config,
+                                    retry_resource_items_queue=retry_queue,
+                                    api_clients_info=api_clients_info)
+        with patch.object(worker, '_release_api_client') as mock_release:
+            resource_items = worker._get_resource_items_from_public(
+                client_dict, items)
+        self.assertEqual(resource_items, [items[0], None, items[2]])
+        self.assertEqual(client.get_resource_item.call_count, 3)
+        self.assertGreater(
+            len(api_clients_info[client_dict['id']]['request_durations']), 0)
+        # Client got 429, batch releases it with grown request interval
+        self.assertGreater(client_dict['request_interval'], 0)
+        self.assertEqual(mock_release.call_args,
+                         call(client_dict,
+                              timeout=client_dict['request_interval']))
+        sleep(worker.config['retry_default_timeout'] * 2)
+        self.assertEqual(retry_queue.qsize(), 1)
+        self.assertEqual(retry_queue.get()['id'], items[1]['id'])
+
+        # Batch without 429 returns client immediately
+        client.get_resource_item.side_effect = [{'data': items[0]},
+                                                {'data': items[2]}]
+        resource_items = worker._get_resource_items_from_public(
+            client_dict, [items[0], items[2]])
+        self.assertEqual(resource_items, [items[0], items[2]])
+        self.assertEqual(api_clients_queue.qsize(), 1)
+
+        # Burst of 429 in one batch grows request interval once
+        api_clients_queue.get()
+        client_dict['request_interval'] = 0
+        client.get_resource_item.side_effect = [
+            RequestFailed(munchify({'status_code': 429}))
+            for _ in items]
+        resource_items = worker._get_resource_items_from_public(client_dict,
+                                                                items)
+        self.assertEqual(resource_items, [None, None, None])
+        self.assertEqual(client_dict['request_interval'],
+                         worker.config['client_inc_step_timeout'])
+
+    @patch('openprocurement.bridge.basic.workers.ResourceItemWorker.'
+           '_save_bulk_docs')
+    @patch('openprocurement.bridge.basic.workers.ResourceItemWorker.'
+           '_get_resource_items_from_public')
+    def test__process_resource_items(self, mock_get_from_public,
+                                     mocked_save_bulk):
+        api_clients_queue = Queue()
+        retry_queue = RetryQueue()
+        items = [{'id': uuid.uuid4().hex,
+                  'dateModified': datetime.datetime.utcnow().isoformat()}
+                 for _ in xrange(3)]
+        db = MagicMock()
+        mock_get_from_public.return_value = [deepcopy(items[0]), None,
+                                             deepcopy(items[2])]
+        worker = ResourceItemWorker(api_clients_queue=api_clients_queue,
+                                    config_dict=self.worker_config, db=db,
+                                    retry_resource_items_queue=retry_queue)
+        client_dict = {'id': uuid.uuid4().hex}
+        worker._process_resource_items(client_dict, items)
+        mock_get_from_public.assert_called_once_with(client_dict, items)
+        self.assertEqual(sorted(worker.bulk),
+                         sorted([items[0]['id'], items[2]['id']]))
+        self.assertEqual(mocked_save_bulk.call_count, 1)
+        # Storage isn't requested per item
+        self.assertEqual(db.get_doc.call_count, 0)
+
     def test__add_to_bulk(self):
-        retry_queue = Queue()
+        retry_queue = RetryQueue()
         old_date_modified = datetime.datetime.utcnow().isoformat()
         queue_resource_item = {
             'doc_type': 'Tender',
             'id': uuid.uuid4().hex,
             'dateModified': datetime.datetime.utcnow().isoformat()
         }
-        resource_item_doc_dict = {
-            'doc_type': 'Tender',
-            '_rev': '1-' + uuid.uuid4().hex,
-            'id': queue_resource_item['id'],
-            'dateModified': queue_resource_item['dateModified']
-        }
         resource_item_dict = {
             'doc_type': 'Tender',
             'id': queue_resource_item['id'],
@@ -344,8 +586,7 @@ class TestResourceItemWorker(unittest.TestCase):
         worker.db = MagicMock()
         # Successfull adding to bulk
         start_length = len(worker.bulk)
-        worker._add_to_bulk(resource_item_dict, queue_resource_item,
-                            resource_item_doc_dict)
+        worker._add_to_bulk(resource_item_dict, queue_resource_item)
         end_length = len(worker.bulk)
         self.assertGreater(end_length, start_length)
 
@@ -354,8 +595,7 @@ class TestResourceItemWorker(unittest.TestCase):
         new_resource_item_dict = deepcopy(resource_item_dict)
         new_resource_item_dict['dateModified'] =\
             datetime.datetime.utcnow().isoformat()
-        worker._add_to_bulk(new_resource_item_dict, queue_resource_item,
-                            resource_item_doc_dict)
+        worker._add_to_bulk(new_resource_item_dict, queue_resource_item)
         end_length = len(worker.bulk)
         self.assertEqual(start_length, end_length)
 
@@ -366,7 +606,7 @@ class TestResourceItemWorker(unittest.TestCase):
             'id': queue_resource_item['id'],
             '_id': queue_resource_item['id'],
             'dateModified': old_date_modified
-        }, queue_resource_item, resource_item_dict)
+        }, queue_resource_item)
         end_length = len(worker.bulk)
         self.assertEqual(start_length, end_length)
         del worker
@@ -374,7 +614,7 @@ class TestResourceItemWorker(unittest.TestCase):
 
     def test__save_bulk_docs(self):
         self.worker_config['bulk_save_limit'] = 3
-        retry_queue = Queue()
+        retry_queue = RetryQueue()
         worker = ResourceItemWorker(config_dict=self.worker_config,
                                     retry_resource_items_queue=retry_queue)
         doc_id_1 = uuid.uuid4().hex
@@ -382,12 +622,9 @@ class TestResourceItemWorker(unittest.TestCase):
         doc_id_3 = uuid.uuid4().hex
         doc_id_4 = uuid.uuid4().hex
         date_modified = datetime.datetime.utcnow().isoformat()
-        worker.bulk = {
-            doc_id_1: {'id': doc_id_1, 'dateModified': date_modified},
-            doc_id_2: {'id': doc_id_2, 'dateModified': date_modified},
-            doc_id_3: {'id': doc_id_3, 'dateModified': date_modified},
-            doc_id_4: {'id': doc_id_4, 'dateModified': date_modified}
-        }
+        for doc_id in (doc_id_1, doc_id_2, doc_id_3, doc_id_4):
+            worker.bulk.add(doc_id, {'id': doc_id,
+                                     'dateModified': date_modified})
         update_return_value = [
             (True, doc_id_1, '1-' + uuid.uuid4().hex),
             (True, doc_id_2, '2-' + uuid.uuid4().hex),
@@ -407,17 +644,75 @@ class TestResourceItemWorker(unittest.TestCase):
 
         # Test failed response from couchdb
         worker.db.db.update.side_effect = Exception('Some exceptions')
-        worker.bulk = {
-            doc_id_1: {'id': doc_id_1, 'dateModified': date_modified},
-            doc_id_2: {'id': doc_id_2, 'dateModified': date_modified},
-            doc_id_3: {'id': doc_id_3, 'dateModified': date_modified},
-            doc_id_4: {'id': doc_id_4, 'dateModified': date_modified}
-        }
+        for doc_id in (doc_id_1, doc_id_2, doc_id_3, doc_id_4):
+            worker.bulk.add(doc_id, {'id': doc_id,
+                                     'dateModified': date_modified})
         worker._save_bulk_docs()
         sleep(0.2)
-        self.assertEqual(worker.retry_resource_items_queue.qsize(), 5)
+        # doc_id_4 already scheduled for retry and deduplicated
+        self.assertEqual(worker.retry_resource_items_queue.qsize(), 4)
         self.assertEqual(len(worker.bulk), 0)
 
+    def test__save_bulk_docs_updates_index(self):
+        retry_queue = RetryQueue()
+        index = DateModifiedIndex(10)
+        worker = ResourceItemWorker(config_dict=self.worker_config,
+                                    retry_resource_items_queue=retry_queue,
+                                    date_modified_index=index)
+        doc_id_1 = uuid.uuid4().hex
+        doc_id_2 = uuid.uuid4().hex
+        doc_id_3 = uuid.uuid4().hex
+        doc_id_4 = uuid.uuid4().hex
+        date_modified = datetime.datetime.utcnow().isoformat()
+        index.set(doc_id_2, date_modified)
+        for doc_id in (doc_id_1, doc_id_2, doc_id_3, doc_id_4):
+            worker.bulk.add(doc_id, {'id': doc_id,
+                                     'dateModified': date_modified})
+        worker.db = MagicMock()
+        worker.db.save_bulk.return_value = [
+            (True, doc_id_1, 'created'),
+            (True, doc_id_2, 'skipped'),
+            (False, doc_id_3, Exception('conflict')),
+            (True, doc_id_4, 'unchanged')
+        ]
+        worker.exit = True
+        worker._save_bulk_docs()
+        self.assertEqual(index.get(doc_id_1), date_modified)
+        self.assertNotIn(doc_id_2, index)
+        self.assertNotIn(doc_id_3, index)
+        self.assertEqual(index.get(doc_id_4), date_modified)
+
+    def test__save_bulk_docs_to_bulk_queue(self):
+        bulk_queue = Queue()
+        worker = ResourceItemWorker(config_dict=self.worker_config,
+                                    db=MagicMock(), bulk_queue=bulk_queue)
+        doc = {'id': uuid.uuid4().hex,
+               'dateModified': datetime.datetime.utcnow().isoformat()}
+        worker.bulk.add(doc['id'], doc)
+        worker._save_bulk_docs()
+        self.assertEqual(len(worker.bulk), 0)
+        self.assertEqual(bulk_queue.get(), (doc, None))
+        self.assertEqual(worker.db.save_bulk.call_count, 0)
+
+    def test__retry_doc(self):
+        retry_queue = RetryQueue()
+        worker = ResourceItemWorker(config_dict=self.worker_config,
+                                    retry_resource_items_queue=retry_queue)
+        queue_item = {'id': uuid.uuid4().hex, 'stream': 'backward',
+                      'dateModified': '2017-01-01T00:00:00+02:00'}
+        doc = {'id': queue_item['id'],
+               'dateModified': '2017-01-02T00:00:00+02:00'}
+        worker._add_to_bulk(doc, queue_item)
+        worker.db = MagicMock()
+        worker.db.save_bulk.return_value = [
+            (False, doc['id'], Exception('conflict'))]
+        worker.exit = True
+        worker._save_bulk_docs()
+        retry_item = retry_queue.get(timeout=1)
+        self.assertEqual(retry_item['dateModified'], doc['dateModified'])
+        self.assertEqual(retry_item['stream'], 'backward')
+        self.assertEqual(worker.bulk_sources, {})
+
     def test_shutdown(self):
         worker = ResourceItemWorker(
             'api_clients_queue', 'resource_items_queue', 'db',
@@ -434,7 +729,7 @@ class TestResourceItemWorker(unittest.TestCase):
     @patch('openprocurement.bridge.basic.workers.logger')
     def test__run(self, mocked_logger, mock_get_from_public, mocked_save_bulk):
         self.queue = Queue()
-        self.retry_queue = Queue()
+        self.retry_queue = RetryQueue()
         self.api_clients_queue = Queue()
         queue_item = {
             'id': uuid.uuid4().hex,
@@ -455,7 +750,7 @@ class TestResourceItemWorker(unittest.TestCase):
         client.session.headers = {'User-Agent': 'Test-Agent'}
         self.api_clients_info = {
             api_client_dict['id']: {
-                'drop_cookies': False, 'request_durations': []
+                'drop_cookies': False, 'request_durations': LatencyWindow(1)
             }
         }
         self.db = MagicMock()
@@ -490,7 +785,7 @@ class TestResourceItemWorker(unittest.TestCase):
             ]
         )
 
-        # Try get resource item from local storage
+        # Try get resource item from public server
         self.queue.put(queue_item)
         mock_get_from_public.return_value = doc
         worker.exit.__nonzero__.side_effect = [False, True]
@@ -507,6 +802,8 @@ class TestResourceItemWorker(unittest.TestCase):
                                                        doc['dateModified']))
             ]
         )
+        # Local storage isn't requested per item
+        self.assertEqual(self.db.get_doc.call_count, 0)
 
         # queue_resource_item dateModified is None and None public doc
         self.api_clients_queue.put(api_client_dict)
@@ -527,7 +824,6 @@ class TestResourceItemWorker(unittest.TestCase):
 
         # queue_resource_item dateModified is None and not None public doc
         self.api_clients_queue.put(api_client_dict)
-        self.api_clients_queue.put(api_client_dict)
         self.queue.put({'id': doc['id'], 'dateModified': None})
         mock_get_from_public.return_value = doc
         worker.exit.__nonzero__.side_effect = [False, True]
@@ -540,101 +836,23 @@ class TestResourceItemWorker(unittest.TestCase):
                     client.session.headers['User-Agent'])),
                 call('Get tender {} {} from main queue.'.format(
                     doc['id'], None)),
-                call('Got api_client ID: {} {}'.format(
-                    api_client_dict['id'],
-                    client.session.headers['User-Agent'])),
                 call('Ignored dublicate tender {} in bulk: previous {}, '
                      'current {}'.format(
                     doc['id'], doc['dateModified'], doc['dateModified']),
                     extra={'MESSAGE_ID': 'skipped'})
             ]
         )
-
-        # Add to retry queue
-        self.api_clients_queue.put(api_client_dict)
-        self.queue.put({'id': doc['id'], 'dateModified': None})
-        mock_get_from_public.return_value = doc
-        self.db.get_doc.return_value = doc
-        worker.exit.__nonzero__.side_effect = [False, True]
-        worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[12:],
-            [
-                call('Got api_client ID: {} {}'.format(
-                    api_client_dict['id'],
-                    client.session.headers['User-Agent'])),
-                call('Get tender {} {} from main queue.'.format(
-                    doc['id'], None))
-            ]
-        )
-        mocked_logger.info.assert_called_once_with(
-            'Put tender {} to \'retries_queue\''.format(doc['id']),
-            extra={'MESSAGE_ID': 'add_to_retry'}
-        )
-
-        # Skip doc
-        self.api_clients_queue.put(api_client_dict)
-        self.api_clients_queue.put(api_client_dict)
-        self.queue.put({'id': doc['id'], 'dateModified': None})
-        mock_get_from_public.return_value = doc
-        self.db.get_doc.return_value = doc
-        worker.exit.__nonzero__.side_effect = [False, True]
-        worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[14:],
-            [
-                call('Got api_client ID: {} {}'.format(
-                    api_client_dict['id'],
-                    client.session.headers['User-Agent'])),
-                call('Get tender {} {} from main queue.'.format(
-                    doc['id'], None)),
-                call('Got api_client ID: {} {}'.format(
-                    api_client_dict['id'],
-                    client.session.headers['User-Agent'])),
-                call('Ignored tender {} QUEUE - {}, EDGE - {}'.format(
-                    doc['id'], doc['dateModified'], doc['dateModified']),
-                    extra={'MESSAGE_ID': 'skipped'})
-            ]
-        )
-        self.assertEqual(mocked_logger.info.call_count, 1)
-
-        # Skip doc with raise exception
-        self.api_clients_queue.put(api_client_dict)
-        self.api_clients_queue.put(api_client_dict)
-        self.queue.put({'id': doc['id'], 'dateModified': None})
-        mock_get_from_public.side_effect = Exception('test')
-        worker.exit.__nonzero__.side_effect = [False, True]
-        worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[18:],
-            [
-                call('Got api_client ID: {} {}'.format(
-                    api_client_dict['id'],
-                    client.session.headers['User-Agent'])),
-                call('Get tender {} {} from main queue.'.format(
-                    doc['id'], None))
-            ]
-        )
-        mocked_logger.error.assert_called_once_with(
-            'Error while getting resource item from couchdb: {}'.format(repr(
-                Exception('test'))),
-            extra={'MESSAGE_ID': 'exceptions'}
-        )
-        self.assertEqual(
-            mocked_logger.info.call_args_list[1],
-            call('Put tender {} to \'retries_queue\''.format(doc['id']),
-            extra={'MESSAGE_ID': 'add_to_retry'})
-        )
+        self.assertEqual(mock_get_from_public.call_count, 3)
 
         # Try get resource item from public server with None public doc
         new_date_modified = datetime.datetime.utcnow().isoformat()
+        self.api_clients_queue.put(api_client_dict)
         self.queue.put({'id': doc['id'], 'dateModified': new_date_modified})
         mock_get_from_public.return_value = None
-        mock_get_from_public.side_effect = None
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
         self.assertEqual(
-            mocked_logger.debug.call_args_list[20:],
+            mocked_logger.debug.call_args_list[11:],
             [
                 call('Got api_client ID: {} {}'.format(
                     api_client_dict['id'],
@@ -643,18 +861,16 @@ class TestResourceItemWorker(unittest.TestCase):
                     doc['id'], new_date_modified))
             ]
         )
-        self.assertEqual(mocked_logger.info.call_count, 2)
-        self.assertEqual(mocked_logger.error.call_count, 1)
 
         # Try get resource item from public server
         new_date_modified = datetime.datetime.utcnow().isoformat()
+        self.api_clients_queue.put(api_client_dict)
         self.queue.put({'id': doc['id'], 'dateModified': new_date_modified})
         mock_get_from_public.return_value = doc
-        mock_get_from_public.side_effect = None
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
         self.assertEqual(
-            mocked_logger.debug.call_args_list[22:],
+            mocked_logger.debug.call_args_list[13:],
             [
                 call('Got api_client ID: {} {}'.format(
                     api_client_dict['id'],
@@ -667,13 +883,127 @@ class TestResourceItemWorker(unittest.TestCase):
                     extra={'MESSAGE_ID': 'skipped'})
             ]
         )
-        self.assertEqual(mocked_logger.info.call_count, 2)
-        self.assertEqual(mocked_logger.error.call_count, 1)
+        self.assertEqual(mocked_logger.info.call_count, 0)
+        self.assertEqual(mocked_logger.error.call_count, 0)
+
+
+class TestBulkWriter(unittest.TestCase):
+
+    worker_config = {
+        'resource': 'tenders',
+        'retry_default_timeout': 0.05,
+        'retries_count': 2,
+        'bulk_save_limit': 2,
+        'bulk_save_interval': 0.05
+    }
 
+    def test__run(self):
+        docs_queue = Queue()
+        retry_queue = RetryQueue()
+        db = MagicMock()
+        date_modified = datetime.datetime.utcnow().isoformat()
+        old_date_modified = '2017-01-01T00:00:00+02:00'
+        doc_id_1 = uuid.uuid4().hex
+        doc_id_2 = uuid.uuid4().hex
+        docs_queue.put(({'id': doc_id_1, 'dateModified': old_date_modified},
+                        None))
+        docs_queue.put(({'id': doc_id_1, 'dateModified': date_modified},
+                        None))
+        docs_queue.put(({'id': doc_id_2, 'dateModified': date_modified},
+                        {'id': doc_id_2, 'stream': 'backward'}))
+        db.save_bulk.return_value = [
+            (True, doc_id_1, 'created'),
+            (False, doc_id_2, Exception('conflict'))
+        ]
+        writer = BulkWriter(docs_queue=docs_queue, db=db,
+                            config_dict=self.worker_config,
+                            retry_resource_items_queue=retry_queue)
+        writer.start()
+        sleep(0.2)
+        writer.shutdown()
+        writer.join()
+        self.assertEqual(db.save_bulk.call_count, 1)
+        saved_bulk = db.save_bulk.call_args[0][0]
+        self.assertEqual(saved_bulk[doc_id_1]['dateModified'], date_modified)
+        self.assertEqual(saved_bulk[doc_id_1]['_id'], doc_id_1)
+        self.assertEqual(saved_bulk[doc_id_1]['doc_type'], 'Tender')
+        self.assertEqual(len(writer.bulk), 0)
+        sleep(0.1)
+        self.assertEqual(retry_queue.qsize(), 1)
+        self.assertEqual(retry_queue.get_nowait()['stream'], 'backward')
+
+
+    def test__run_feed_only(self):
+        docs_queue = Queue()
+        retry_queue = RetryQueue()
+        db = MagicMock()
+        doc_id = uuid.uuid4().hex
+        doc = {'id': doc_id, 'status': 'active',
+               'dateModified': datetime.datetime.utcnow().isoformat()}
+        docs_queue.put((doc, None))
+        db.save_bulk.return_value = [(False, doc_id, Exception('conflict'))]
+        writer = BulkWriter(docs_queue=docs_queue, db=db,
+                            config_dict=self.worker_config,
+                            retry_resource_items_queue=retry_queue,
+                            feed_only=True)
+        writer.start()
+        sleep(0.6)
+        writer.shutdown()
+        writer.join()
+        # Feed doc is saved again until retries limit, API isn't used
+        self.assertEqual(db.save_bulk.call_count, 3)
+        self.assertEqual(retry_queue.qsize(), 0)
+        self.assertEqual(writer.retry_resource_items_queue.qsize(), 0)
+        self.assertEqual(docs_queue.qsize(), 0)
+        saved_doc = db.save_bulk.call_args[0][0][doc_id]
+        self.assertEqual(saved_doc['status'], 'active')
+        self.assertNotIn('retries_count', saved_doc)
+
+    def test__run_feed_only_conflict(self):
+        docs_queue = Queue()
+        retry_queue = RetryQueue()
+        pending_items = PendingItems()
+        doc_id = uuid.uuid4().hex
+        item = {'id': doc_id, 'stream': 'forward',
+                'dateModified': datetime.datetime.utcnow().isoformat()}
+        pending_items.add(item)
+        pending_items.discard(doc_id, item)
+        docs_queue.put(({'id': doc_id, 'status': 'active',
+                         'dateModified': item['dateModified']}, item))
+        saved_revs = []
+
+        def save_bulk(bulk):
+            doc = bulk[doc_id]
+            saved_revs.append(doc.get('_rev'))
+            if '_rev' not in doc:
+                doc['_rev'] = '{}-{}'.format(len(saved_revs),
+                                             uuid.uuid4().hex)
+            if len(saved_revs) == 1:
+                return [(False, doc_id, Exception('conflict'))]
+            return [(True, doc_id, 'updated')]
+
+        db = MagicMock()
+        db.save_bulk.side_effect = save_bulk
+        writer = BulkWriter(docs_queue=docs_queue, db=db,
+                            config_dict=self.worker_config,
+                            retry_resource_items_queue=retry_queue,
+                            pending_items=pending_items, feed_only=True)
+        writer.start()
+        sleep(0.3)
+        writer.shutdown()
+        writer.join()
+        # Retried doc doesn't keep revision of conflicted save
+        self.assertEqual(saved_revs, [None, None])
+        saved_doc = db.save_bulk.call_args[0][0][doc_id]
+        self.assertEqual(saved_doc['status'], 'active')
+        self.assertEqual(saved_doc['doc_type'], 'Tender')
+        self.assertEqual(pending_items.units, {})
+        self.assertEqual(len(pending_items), 0)
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestResourceItemWorker))
+    suite.addTest(unittest.makeSuite(TestBulkWriter))
     return suite
 
 
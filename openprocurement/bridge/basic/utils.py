@@ -2,9 +2,21 @@
 import os
 from pytz import timezone
 
+# True when neither time.monotonic nor monotonic package is available and
+# timings follow wall clock, bridge warns about it on start
+MONOTONIC_FALLBACK = False
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    try:
+        from monotonic import monotonic
+    except ImportError:
+        from time import time as monotonic
+        MONOTONIC_FALLBACK = True
+
 TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
 
 
 class DataBridgeConfigError(Exception):
     pass
-
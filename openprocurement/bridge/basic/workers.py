@@ -5,7 +5,7 @@ monkey.patch_all()
 import os
 from datetime import datetime
 from gevent import Greenlet
-from gevent import spawn, sleep
+from gevent import joinall, spawn, sleep
 from gevent.queue import Empty
 from iso8601 import parse_date
 from pytz import timezone
@@ -19,6 +19,15 @@ from openprocurement_client.exceptions import (
     ResourceNotFound,
     ResourceGone
 )
+from openprocurement.bridge.basic.batching import MicroBatcher
+from openprocurement.bridge.basic.metrics import (
+    API_REQUEST_DURATION,
+    BULK_SIZE,
+    DOCUMENT_LAG,
+    RETRIES,
+    SAVE_RESULTS
+)
+from openprocurement.bridge.basic.queues import ClientScheduler, RetryQueue
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +38,8 @@ class ResourceItemWorker(Greenlet):
 
     def __init__(self, api_clients_queue=None, resource_items_queue=None,
                  db=None, config_dict=None, retry_resource_items_queue=None,
-                 api_clients_info=None):
+                 api_clients_info=None, date_modified_index=None,
+                 bulk_queue=None, rate_limiter=None, pending_items=None):
         Greenlet.__init__(self)
         self.exit = False
         self.update_doc = False
@@ -38,13 +48,28 @@ class ResourceItemWorker(Greenlet):
         self.api_clients_queue = api_clients_queue
         self.resource_items_queue = resource_items_queue
         self.retry_resource_items_queue = retry_resource_items_queue
-        self.bulk = {}
         self.bulk_save_limit = self.config['bulk_save_limit']
         self.bulk_save_interval = self.config['bulk_save_interval']
-        self.start_time = datetime.now()
+        self.bulk = MicroBatcher(self.bulk_save_limit, self.bulk_save_interval)
+        self.fetch_batch_size = self.config.get('fetch_batch_size', 1)
         self.api_clients_info = api_clients_info
+        self.date_modified_index = date_modified_index
+        self.bulk_queue = bulk_queue
+        self.rate_limiter = rate_limiter
+        self.pending_items = pending_items
+        # Queue items of bulk documents by id, retry of failed document
+        # keeps stream of its queue item
+        self.bulk_sources = {}
+        self.client_scheduler = isinstance(api_clients_queue, ClientScheduler)
+
+    def _done(self, item_id):
+        if self.pending_items is not None:
+            self.pending_items.done(item_id)
 
     def add_to_retry_queue(self, resource_item, status_code=0):
+        """
+        Reschedule item taken from queue, dropped item is done
+        """
         timeout = resource_item.get('timeout') or\
             self.config['retry_default_timeout']
         retries_count = resource_item.get('retries_count') or 0
@@ -61,13 +86,48 @@ class ResourceItemWorker(Greenlet):
                     self.config['resource'][:-1].title(),
                     resource_item['id'], self.config['retries_count']),
                 extra={'MESSAGE_ID': 'droped_documents'})
+            RETRIES.inc(result='dropped')
+            self._done(resource_item['id'])
+        elif (self.pending_items is not None and
+              not self.pending_items.add(resource_item, stage='retry',
+                                         requeued=True)):
+            logger.info('Coalesced {} {} retry with pending item'.format(
+                self.config['resource'][:-1], resource_item['id']),
+                extra={'MESSAGE_ID': 'coalesced'})
+        elif not self.retry_resource_items_queue.put(resource_item,
+                                                     delay=timeout):
+            if self.pending_items is not None:
+                self.pending_items.discard(resource_item['id'],
+                                           resource_item)
+                self.pending_items.done(resource_item['id'])
+            RETRIES.inc(result='dropped')
+            logger.critical(
+                '{} {} droped because retry_queue is full.'.format(
+                    self.config['resource'][:-1].title(),
+                    resource_item['id']),
+                extra={'MESSAGE_ID': 'droped_documents'})
         else:
-            spawn(self.retry_resource_items_queue.put,
-                  resource_item, timeout=timeout)
+            RETRIES.inc(result='scheduled')
             logger.info('Put {} {} to \'retries_queue\''.format(
                 self.config['resource'][:-1], resource_item['id']),
                 extra={'MESSAGE_ID': 'add_to_retry'})
 
+    def _retry_item(self, queue_resource_item, resource_item=None):
+        """
+        :param resource_item: dict, document which dateModified is retried,
+        queue item by default
+        :return: dict: new retry queue item of same stream and retries
+        state, so item is finally dropped after last retry
+        """
+        if resource_item is None:
+            resource_item = queue_resource_item
+        retry_item = {'id': resource_item['id'],
+                      'dateModified': resource_item['dateModified']}
+        for key in ('stream', 'timeout', 'retries_count'):
+            if key in queue_resource_item:
+                retry_item[key] = queue_resource_item[key]
+        return retry_item
+
     def _get_api_client_dict(self):
         if not self.api_clients_queue.empty():
             try:
@@ -78,12 +138,18 @@ class ResourceItemWorker(Greenlet):
             if self.api_clients_info[api_client_dict['id']]['drop_cookies']:
                 try:
                     api_client_dict['client'].renew_cookies()
-                    self.api_clients_info[api_client_dict['id']] = {
+                    info = self.api_clients_info[api_client_dict['id']]
+                    info['request_durations'].clear()
+                    info.update({
                         'drop_cookies': False,
-                        'request_durations': {},
                         'request_interval': 0,
                         'avg_duration': 0
-                    }
+                    })
+                    info.pop('grown', None)
+                    info.pop('p95_duration', None)
+                    if self.client_scheduler:
+                        # New cookies may bind client to other backend
+                        self.api_clients_queue.forget(api_client_dict['id'])
                     api_client_dict['request_interval'] = 0
                     api_client_dict['not_actual_count'] = 0
                     logger.info('Drop lazy api_client {} cookies'.format(
@@ -105,6 +171,9 @@ class ResourceItemWorker(Greenlet):
         if not self.resource_items_queue.empty():
             queue_resource_item = self.resource_items_queue.get(
                 timeout=self.config['queue_timeout'])
+            if self.pending_items is not None:
+                self.pending_items.discard(queue_resource_item['id'],
+                                           queue_resource_item)
             logger.debug('Get {} {} {} from main queue.'.format(
                 self.config['resource'][:-1], queue_resource_item['id'],
                 queue_resource_item['dateModified']))
@@ -112,19 +181,99 @@ class ResourceItemWorker(Greenlet):
         else:
             return None
 
+    def _release_api_client(self, api_client_dict, release=True,
+                            timeout=None):
+        if not release:
+            return
+        if timeout and self.client_scheduler:
+            self.api_clients_queue.put(api_client_dict, delay=timeout)
+        elif timeout:
+            spawn(self.api_clients_queue.put, api_client_dict, timeout=timeout)
+        else:
+            self.api_clients_queue.put(api_client_dict)
+
+    def _get_resource_items_from_queue(self):
+        queue_resource_item = self._get_resource_item_from_queue()
+        if queue_resource_item is None:
+            return []
+        queue_resource_items = [queue_resource_item]
+        while len(queue_resource_items) < self.fetch_batch_size:
+            try:
+                queue_resource_item = self.resource_items_queue.get_nowait()
+            except Empty:
+                break
+            if self.pending_items is not None:
+                self.pending_items.discard(queue_resource_item['id'],
+                                           queue_resource_item)
+            queue_resource_items.append(queue_resource_item)
+        return queue_resource_items
+
+    def _track_request(self, api_client_dict, start, failed=False):
+        duration = time.time() - start
+        if self.client_scheduler:
+            self.api_clients_queue.observe(api_client_dict['id'], duration,
+                                           failed)
+        self.api_clients_info[api_client_dict['id']][
+            'request_durations'].add(duration)
+        self.api_clients_info[api_client_dict['id']]['request_interval'] =\
+            api_client_dict['request_interval']
+        API_REQUEST_DURATION.observe(duration, client=api_client_dict['id'])
+        return duration
+
+    def _get_resource_items_from_public(self, api_client_dict,
+                                        queue_resource_items):
+        """
+        Concurrently get resource items over one api client session. Each
+        item keeps _get_resource_item_from_public not actual and retry
+        semantics, api client returned to queue once for whole batch and
+        delayed by its request_interval if any request got 429.
+        :return: list of public resource items or None in same order
+        """
+        throttled = []
+        jobs = [spawn(self._get_resource_item_from_public, api_client_dict,
+                      queue_resource_item, release_client=False,
+                      throttled=throttled)
+                for queue_resource_item in queue_resource_items]
+        joinall(jobs)
+        if throttled:
+            self._throttle_api_client(api_client_dict)
+        self._release_api_client(
+            api_client_dict,
+            timeout=api_client_dict['request_interval'] if throttled else None)
+        return [job.value for job in jobs]
+
+    def _throttle_api_client(self, api_client_dict):
+        """
+        Grow client request interval after 429, client throttled for too
+        long gets new session cookies
+        """
+        if (api_client_dict['request_interval'] >
+                self.config['drop_threshold_client_cookies']):
+            api_client_dict['client'].session.cookies.clear()
+            api_client_dict['request_interval'] = 0
+        else:
+            api_client_dict['request_interval'] +=\
+                self.config['client_inc_step_timeout']
+
     def _get_resource_item_from_public(self, api_client_dict,
-                                       queue_resource_item):
+                                       queue_resource_item,
+                                       release_client=True, throttled=None):
+        """
+        :param throttled: list, gets item id on 429 instead of growing client
+        request interval, for batch
+        """
         try:
             logger.debug('Request interval {} sec. for client {}'.format(
                 api_client_dict['request_interval'],
                 api_client_dict['client'].session.headers['User-Agent']))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(api_client_dict['id'])
             start = time.time()
             resource_item = api_client_dict['client'].get_resource_item(
                 queue_resource_item['id']).get('data')
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
+            duration = self._track_request(api_client_dict, start)
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_success(api_client_dict['id'], duration)
             logger.debug('Recieved from API {}: {} {}'.format(
                 self.config['resource'][:-1], resource_item['id'],
                 resource_item['dateModified']))
@@ -140,110 +289,83 @@ class ResourceItemWorker(Greenlet):
                             'User-Agent'], self.config['resource'][:-1],
                         queue_resource_item['id']),
                     extra={'MESSAGE_ID': 'not_actual_docs'})
-                self.add_to_retry_queue({
-                    'id': queue_resource_item['id'],
-                    'dateModified': queue_resource_item['dateModified']
-                })
-                self.api_clients_queue.put(api_client_dict)
+                self.add_to_retry_queue(self._retry_item(queue_resource_item))
+                self._release_api_client(api_client_dict, release_client)
                 return None  # Not actual
-            self.api_clients_queue.put(api_client_dict)
+            self._release_api_client(api_client_dict, release_client)
             return resource_item
         except ResourceGone:
-            self.api_clients_queue.put(api_client_dict)
+            self._release_api_client(api_client_dict, release_client)
+            self._done(queue_resource_item['id'])
             logger.info(
                 '{} {} archived.'.format(self.config['resource'][:-1].title(),
                                          queue_resource_item['id'])
             )
             return None  # Archived
         except InvalidResponse as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
-            self.api_clients_queue.put(api_client_dict)
+            self._track_request(api_client_dict, start, failed=True)
+            self._release_api_client(api_client_dict, release_client)
             logger.error(
                 'Error while getting {} {} from public with status code: '
                 '{}'.format(
                     self.config['resource'][:-1], queue_resource_item['id'],
                     e.status_code), extra={'MESSAGE_ID': 'exceptions'})
-            self.add_to_retry_queue({
-                'id': queue_resource_item['id'],
-                'dateModified': queue_resource_item['dateModified']
-            })
+            self.add_to_retry_queue(self._retry_item(queue_resource_item))
             return None
         except RequestFailed as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
-            if e.status_code == 429:
-                if (api_client_dict['request_interval'] >
-                        self.config['drop_threshold_client_cookies']):
-                    api_client_dict['client'].session.cookies.clear()
-                    api_client_dict['request_interval'] = 0
-                else:
-                    api_client_dict['request_interval'] +=\
-                        self.config['client_inc_step_timeout']
-                spawn(self.api_clients_queue.put, api_client_dict,
-                      timeout=api_client_dict['request_interval'])
+            self._track_request(api_client_dict, start, failed=True)
+            if e.status_code == 429 and self.rate_limiter is not None:
+                # Limiter slows down all workers, client is ready for next
+                # token
+                self.rate_limiter.on_throttle(api_client_dict['id'])
+                self._release_api_client(api_client_dict, release_client)
+            elif e.status_code == 429 and throttled is not None:
+                # Batch backs off client once for all its 429 responses
+                throttled.append(queue_resource_item['id'])
+            elif e.status_code == 429:
+                self._throttle_api_client(api_client_dict)
+                self._release_api_client(
+                    api_client_dict, release_client,
+                    timeout=api_client_dict['request_interval'])
             else:
-                self.api_clients_queue.put(api_client_dict)
+                self._release_api_client(api_client_dict, release_client)
             logger.error(
                 'Request failed while getting {} {} from public with status '
                 'code {}: '.format(
                     self.config['resource'][:-1], queue_resource_item['id'],
                     e.status_code), extra={'MESSAGE_ID': 'exceptions'})
-            self.add_to_retry_queue({
-                'id': queue_resource_item['id'],
-                'dateModified': queue_resource_item['dateModified']
-            }, status_code=e.status_code)
+            self.add_to_retry_queue(self._retry_item(queue_resource_item),
+                                    status_code=e.status_code)
             return None  # request failed
         except ResourceNotFound as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
+            self._track_request(api_client_dict, start, failed=True)
             logger.error('Resource not found {} at public: {} {}. {}'.format(
                 self.config['resource'][:-1], queue_resource_item['id'],
                 queue_resource_item['dateModified'], e.message),
                 extra={'MESSAGE_ID': 'not_found_docs'})
             api_client_dict['client'].session.cookies.clear()
             logger.info('Clear client cookies')
-            self.add_to_retry_queue({
-                'id': queue_resource_item['id'],
-                'dateModified': queue_resource_item['dateModified']
-            })
-            self.api_clients_queue.put(api_client_dict)
+            self.add_to_retry_queue(self._retry_item(queue_resource_item))
+            self._release_api_client(api_client_dict, release_client)
             return None  # not found
         except Exception as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
-            self.api_clients_queue.put(api_client_dict)
+            self._track_request(api_client_dict, start, failed=True)
+            self._release_api_client(api_client_dict, release_client)
             logger.error(
                 'Error while getting resource item {} {} {} from public '
                 '{}: '.format(
                     self.config['resource'][:-1], queue_resource_item['id'],
                     queue_resource_item['dateModified'], e.message),
                 extra={'MESSAGE_ID': 'exceptions'})
-            self.add_to_retry_queue({
-                'id': queue_resource_item['id'],
-                'dateModified': queue_resource_item['dateModified']
-            })
+            self.add_to_retry_queue(self._retry_item(queue_resource_item))
             return None
 
-    def _add_to_bulk(self, resource_item, queue_resource_item,
-                     local_item_doc):
+    def _add_to_bulk(self, resource_item, queue_resource_item):
+        # Storage service keys (_rev, _ver) are fetched by storage for
+        # whole bulk on save
         resource_item['doc_type'] = self.config['resource'][:-1].title()
         resource_item['_id'] = resource_item['id']
 
-        # Setup service keys
-        if local_item_doc:
-            for k in local_item_doc:
-                if k.startswith('_'):
-                    resource_item[k] = local_item_doc[k]
-
         bulk_doc = self.bulk.get(resource_item['id'])
 
         if bulk_doc and bulk_doc['dateModified'] <\
@@ -253,7 +375,9 @@ class ResourceItemWorker(Greenlet):
                     self.config['resource'][:-1], bulk_doc['id'],
                     bulk_doc['dateModified'], resource_item['dateModified']),
                 extra={'MESSAGE_ID': 'skipped'})
-            self.bulk[resource_item['id']] = resource_item
+            self.bulk.add(resource_item['id'], resource_item)
+            self.bulk_sources[resource_item['id']] = queue_resource_item
+            self._done(resource_item['id'])
         elif bulk_doc and bulk_doc['dateModified'] >=\
                 resource_item['dateModified']:
             logger.debug(
@@ -262,13 +386,21 @@ class ResourceItemWorker(Greenlet):
                     self.config['resource'][:-1], resource_item['id'],
                     bulk_doc['dateModified'], resource_item['dateModified']),
                 extra={'MESSAGE_ID': 'skipped'})
+            self._done(resource_item['id'])
         if not bulk_doc:
-            self.bulk[resource_item['id']] = resource_item
+            self.bulk.add(resource_item['id'], resource_item)
+            self.bulk_sources[resource_item['id']] = queue_resource_item
             logger.debug('Put in bulk {} {} {}'.format(
                 self.config['resource'][:-1], resource_item['id'],
                 resource_item['dateModified']))
         return
 
+    def _track_lag(self, resource_item, queue_resource_item):
+        lag = (datetime.now(TZ) -
+               parse_date(resource_item['dateModified'])).total_seconds()
+        DOCUMENT_LAG.observe(max(lag, 0), stream=queue_resource_item.get(
+            'stream', 'forward'))
+
     def log_timeshift(self, resource_item):
         ts = (datetime.now(TZ) -
               parse_date(resource_item['dateModified'])).total_seconds()
@@ -277,22 +409,37 @@ class ResourceItemWorker(Greenlet):
             extra={'DOCUMENT_TIMESHIFT': ts})
 
     def _save_bulk_docs(self):
-        if (len(self.bulk) > self.bulk_save_limit or
-                (datetime.now() - self.start_time).total_seconds() >
-                self.bulk_save_interval or self.exit):
+        if self.bulk_queue is not None:
+            # Hand documents over to BulkWriter
+            sources, self.bulk_sources = self.bulk_sources, {}
+            for doc in self.bulk.take().values():
+                self.bulk_queue.put((doc, sources.get(doc['id'])))
+            return
+        if self.bulk and (self.bulk.ready() or self.exit):
+            bulk = self.bulk.take()
+            sources, self.bulk_sources = self.bulk_sources, {}
+            BULK_SIZE.observe(len(bulk))
             try:
-                res = self.db.save_bulk(self.bulk)
-                logger.info('Save bulk {} docs to db.'.format(len(self.bulk)))
+                res = self.db.save_bulk(bulk)
+                logger.info('Save bulk {} docs to db.'.format(len(bulk)))
             except Exception as e:
                 logger.error('Error while saving bulk_docs in db: {}'.format(
                     repr(e)), extra={'MESSAGE_ID': 'exceptions'})
-                for doc in self.bulk.values():
-                    self.add_to_retry_queue(
-                        {'id': doc['id'], 'dateModified': doc['dateModified']})
-                self.bulk = {}
-                self.start_time = datetime.now()
+                SAVE_RESULTS.inc(len(bulk), result='failed')
+                for doc in bulk.values():
+                    self._retry_doc(doc, sources.get(doc['id']))
                 return
             for success, doc_id, reason in res:
+                SAVE_RESULTS.inc(result=reason if success else 'failed')
+                if success:
+                    self._done(doc_id)
+                if self.date_modified_index is not None:
+                    if success and reason in ('created', 'updated',
+                                              'unchanged'):
+                        self.date_modified_index.set(
+                            doc_id, bulk[doc_id]['dateModified'])
+                    else:
+                        self.date_modified_index.delete(doc_id)
                 if success and reason == 'updated':
                     logger.info('Update {} {}'.format(
                         self.config['resource'][:-1], doc_id),
@@ -301,6 +448,10 @@ class ResourceItemWorker(Greenlet):
                     logger.info('Save {} {}'.format(
                         self.config['resource'][:-1], doc_id),
                         extra={'MESSAGE_ID': 'save_documents'})
+                if success and reason == 'unchanged':
+                    logger.info('Skipped unchanged {} {}'.format(
+                        self.config['resource'][:-1], doc_id),
+                        extra={'MESSAGE_ID': 'skipped'})
                 if success and reason == 'skipped':
                     logger.info('Skipped {} {}'.format(
                         self.config['resource'][:-1], doc_id),
@@ -310,12 +461,29 @@ class ResourceItemWorker(Greenlet):
                         'Put to retry queue {} {} with reason: '
                         '{}'.format(self.config['resource'][:-1],
                                     doc_id, repr(reason)))
-                    self.add_to_retry_queue(
-                        {'id': doc_id,
-                         'dateModified': self.bulk[doc_id]['dateModified']}
-                    )
-            self.bulk = {}
-            self.start_time = datetime.now()
+                    self._retry_doc(bulk[doc_id], sources.get(doc_id))
+
+    def _retry_doc(self, doc, queue_resource_item=None):
+        """
+        Schedule document failed on save to be fetched again
+        :param queue_resource_item: dict, queue item document was fetched for
+        """
+        self.add_to_retry_queue(self._retry_item(queue_resource_item or doc,
+                                                 doc))
+
+    def _process_resource_items(self, api_client_dict, queue_resource_items):
+        # Try get resource items from public server
+        resource_items = self._get_resource_items_from_public(
+            api_client_dict, queue_resource_items)
+        for queue_resource_item, resource_item in zip(queue_resource_items,
+                                                      resource_items):
+            if resource_item is None:
+                continue
+            self._track_lag(resource_item, queue_resource_item)
+            self._add_to_bulk(resource_item, queue_resource_item)
+
+        # Save/Update docs in db
+        self._save_bulk_docs()
 
     def _run(self):
         while not self.exit:
@@ -326,65 +494,101 @@ class ResourceItemWorker(Greenlet):
                 sleep(self.config['worker_sleep'])
                 continue
 
+            if self.fetch_batch_size > 1:
+                # Try get batch of items from resource items queue
+                queue_resource_items = self._get_resource_items_from_queue()
+                if not queue_resource_items:
+                    self.api_clients_queue.put(api_client_dict)
+                    logger.debug('Resource items queue is empty.')
+                    # Don't keep expired bulk while queue is idle
+                    self._save_bulk_docs()
+                    sleep(self.config['worker_sleep'])
+                    continue
+                self._process_resource_items(api_client_dict,
+                                             queue_resource_items)
+                continue
+
             # Try get item from resource items queue
             queue_resource_item = self._get_resource_item_from_queue()
             if queue_resource_item is None:
                 self.api_clients_queue.put(api_client_dict)
                 logger.debug('Resource items queue is empty.')
+                # Don't keep expired bulk while queue is idle
+                self._save_bulk_docs()
                 sleep(self.config['worker_sleep'])
                 continue
 
-            # Try get resource item from local storage
-            try:
-                # Resource object from local db server
-                local_item_doc = self.db.get_doc(queue_resource_item['id'])
-                if queue_resource_item['dateModified'] is None:
-                    public_doc = self._get_resource_item_from_public(
-                        api_client_dict, queue_resource_item)
-                    if public_doc:
-                        queue_resource_item['dateModified'] \
-                            = public_doc['dateModified']
-                    else:
-                        continue
-                    api_client_dict = self._get_api_client_dict()
-                    if api_client_dict is None:
-                        self.add_to_retry_queue(queue_resource_item)
-                        continue
-                if (local_item_doc and
-                        local_item_doc['dateModified'] >=
-                        queue_resource_item['dateModified']):
-                    logger.debug('Ignored {} {} QUEUE - {}, EDGE - {}'.format(
-                        self.config['resource'][:-1],
-                        queue_resource_item['id'],
-                        queue_resource_item['dateModified'],
-                        local_item_doc['dateModified']),
-                        extra={'MESSAGE_ID': 'skipped'})
-                    self.api_clients_queue.put(api_client_dict)
-                    continue
-            except Exception as e:
-                self.api_clients_queue.put(api_client_dict)
-                self.add_to_retry_queue({
-                    'id': queue_resource_item['id'],
-                    'dateModified': queue_resource_item['dateModified']
-                })
-                logger.error('Error while getting resource item from couchdb: '
-                             '{}'.format(repr(e)),
-                             extra={'MESSAGE_ID': 'exceptions'})
-                continue
-
             # Try get resource item from public server
             resource_item = self._get_resource_item_from_public(
                 api_client_dict, queue_resource_item)
             if resource_item is None:
                 continue
+            self._track_lag(resource_item, queue_resource_item)
 
             # Add docs to bulk
-            self._add_to_bulk(resource_item, queue_resource_item,
-                              local_item_doc)
+            self._add_to_bulk(resource_item, queue_resource_item)
 
             # Save/Update docs in db
             self._save_bulk_docs()
 
     def shutdown(self):
         self.exit = True
-        logger.info('Worker complete his job.')
\ No newline at end of file
+        logger.info('Worker complete his job.')
+
+
+class BulkWriter(ResourceItemWorker):
+
+    """Coalesces documents from all workers into bulks and saves them"""
+
+    def __init__(self, docs_queue=None, db=None, config_dict=None,
+                 retry_resource_items_queue=None, date_modified_index=None,
+                 pending_items=None, feed_only=False):
+        super(BulkWriter, self).__init__(
+            db=db, config_dict=config_dict,
+            retry_resource_items_queue=retry_resource_items_queue,
+            date_modified_index=date_modified_index,
+            pending_items=pending_items)
+        self.docs_queue = docs_queue
+        self.feed_only = feed_only
+        if feed_only:
+            # Feed docs are saved again from feed fields instead of fetching
+            # full document from API, so storage keeps docs of one shape
+            self.retry_resource_items_queue = RetryQueue(
+                retry_resource_items_queue.maxsize)
+
+    def _retry_doc(self, doc, queue_resource_item=None):
+        if not self.feed_only:
+            return super(BulkWriter, self)._retry_doc(doc,
+                                                      queue_resource_item)
+        retry_item = self._retry_item(queue_resource_item or doc, doc)
+        # Storage service keys (_rev, _ver) of failed save are stale, they
+        # are fetched again for retried doc
+        retry_item.update((key, value) for key, value in doc.items()
+                          if not key.startswith('_') and key != 'doc_type')
+        self.add_to_retry_queue(retry_item)
+
+    def _add_retried_docs(self):
+        while True:
+            try:
+                retry_item = self.retry_resource_items_queue.get_nowait()
+            except Empty:
+                return
+            if self.pending_items is not None:
+                self.pending_items.discard(retry_item['id'], retry_item)
+            doc = dict((key, value) for key, value in retry_item.items()
+                       if key not in ('stream', 'timeout', 'retries_count'))
+            self._add_to_bulk(doc, retry_item)
+
+    def _run(self):
+        while not self.exit:
+            try:
+                doc, queue_resource_item = self.docs_queue.get(
+                    timeout=self.bulk.timeout())
+                self._add_to_bulk(doc, queue_resource_item or doc)
+            except Empty:
+                pass
+            if self.feed_only:
+                self._add_retried_docs()
+            self._save_bulk_docs()
+        if self.bulk:
+            self._save_bulk_docs()
@@ -18,6 +18,7 @@ requires = [
     'iso8601',
     'couchdb',
     'elasticsearch',
+    'monotonic',
 ]
 test_requires = requires + [
     'requests',
@@ -29,7 +30,8 @@ test_requires = requires + [
 
 entry_points = {
     'console_scripts': [
-        'databridge = openprocurement.bridge.basic.databridge:main'
+        'databridge = openprocurement.bridge.basic.databridge:main',
+        'databridge_benchmark = openprocurement.bridge.basic.benchmarks.runner:main'
     ],
     'openprocurement.bridge.basic.plugins': [
         'couchdb = openprocurement.bridge.basic.storages.couchdb_plugin:includme',